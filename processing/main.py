@@ -5,6 +5,7 @@ from src.config import BASE_PATH, AGGREGATED_DIR, OUTPUT_DIR, PROCESSED_DIR
 from src.preprocess import process_zips_parallel
 from src.aggregate import aggregate_month_from_saved_days
 from src.visualize import convert_to_echarts_format
+from src.pipeline import run_in_memory
 
 import run_pipeline as run_pipeline
 
@@ -17,12 +18,16 @@ DEFAULT_WORKERS = 4
 DEFAULT_PREPROCESS_DEBUG = 0
 # 是否跳过 IQR 离群值移除（1 跳过以加速，0 保留完整清洗）
 DEFAULT_PREPROCESS_SKIP_IQR = 1
+# 是否使用内存流水线（日结果直接进入月度累加器与导出器，不再写日文件再读回）
+DEFAULT_IN_MEMORY = False
+# 内存流水线下是否仍保存日文件
+DEFAULT_PERSIST_DAYS = False
 # granularity: 'city' or 'grid' (默认自动检测 admin_geojson 存在时使用 city)
 # ======================================================================
 
 
 
-def main_processing_pipeline(year=2013, workers=4):
+def main_processing_pipeline(year=2013, workers=4, in_memory=DEFAULT_IN_MEMORY, persist_days=DEFAULT_PERSIST_DAYS):
     # ensure environment flags are set from defaults if not provided externally
     if os.environ.get('PREPROCESS_DEBUG', '') == '':
         os.environ['PREPROCESS_DEBUG'] = str(int(DEFAULT_PREPROCESS_DEBUG))
@@ -35,6 +40,11 @@ def main_processing_pipeline(year=2013, workers=4):
     if not os.path.exists(admin_geojson):
         admin_geojson = None
 
+    if in_memory:
+        return run_in_memory(year, base_path=base_path, granularity='city' if admin_geojson else 'grid',
+                             admin_geojson=admin_geojson, workers=workers, aggregate_mean=True,
+                             persist_days=persist_days)
+
     # 逐日进行处理以降低内存压力
     process_zips_parallel(base_path, year=year, granularity='city' if admin_geojson else 'grid', admin_geojson=admin_geojson, workers=workers, aggregate_mean=True)
     # 保存的日文件根目录（preprocess 将按 PROCESSED_DIR/<granularity>/<year>/<month>/<day> 保存）
@@ -4,6 +4,15 @@
   extract   - 读取 ZIP 并生成每天处理的文件
   aggregate - 将保存的日文件汇总到每月摘要中
   export    - 将聚合帧转换为 ECharts JSON
+  all       - 在内存中一次完成以上三步（日文件可选保存；--overlap 时各阶段按月重叠执行）
+  calibrate - 在样本成员上计时各 xarray 后端并保存最快顺序（--force 重新校准）
+  zonal     - 把 grid 日文件堆叠为 (天 × 格点) 数组，用稀疏权重矩阵一次聚合到区县/市/省逐日序列
+  regions   - 任意多边形集合（京津冀、长三角、流域等）的逐日序列，区域权重栅格化一次后缓存
+  points    - 站点等任意点的逐日序列（KD 树最近格点或反距离加权）
+  regrid    - 把 grid 日文件重网格化为规则经纬度栅格（0.1°/0.25°，双线性或守恒，权重缓存为稀疏矩阵）
+  tiles     - 规则栅格的多分辨率瓦片金字塔（块平均 1×/2×/4×/8×，uint8/uint16 量化 + manifest）
+  centroids - 各市质心与标注点（GADM 多边形或各市拥有的格点，缓存后写 city_centroids.json 供热图使用）
+  boundaries - 网页地图用的简化边界（市/省共享弧段按多个容差简化、坐标量化，写 TopoJSON + GeoJSON 与面积误差）
 
 该脚本调用现有的“src”模块，因此逻辑仍然存在
 在库代码中实现，“run_pipeline.py”充当瘦运行器。
@@ -11,15 +20,14 @@
 import argparse
 import os
 import glob
-import pandas as pd
 
-from src.config import BASE_PATH, PROCESSED_DIR, AGGREGATED_DIR, OUTPUT_DIR, RESOURCE_DIR
-from src.preprocess import process_zips_parallel
-from src.aggregate import aggregate_month_from_saved_days
-from src.visualize import convert_to_echarts_format
+from src.config import BASE_PATH, PROCESSED_DIR, AGGREGATED_DIR, OUTPUT_DIR, RESOURCE_DIR, COUNTY_GEOJSON, \
+    ADMIN_GEOJSON
 
+# pandas/xarray/geopandas 等重依赖在各子命令内部按需导入，--help 与 export 等命令不必为它们付出启动时间
 
-def cmd_extract(args):
+
+def _resolve_base_path(args):
     # 智能选择 base path：优先使用命令行传入的 --base-path；
     # 否则，如果存在 BASE_PATH/<year> 且包含 zip，则优先使用该目录；
     # 否则做一次递归搜索（BASE_PATH/**/{year}/*.zip），找到则使用包含 zip 的目录；
@@ -37,31 +45,82 @@ def cmd_extract(args):
                 # 使用第一个 zip 所在目录作为 base（用户也可显式传入更精确路径）
                 base = os.path.dirname(candidate_zips[0])
                 print(f"Found zip(s) for year {args.year} under {BASE_PATH}; using base={base}")
+    return base
 
-    print(f"Extracting zips from {base} for year {args.year} -> granularity={args.granularity}")
+
+def _resolve_admin_geojson(args):
     # 如果用户未指定 admin geojson，则尝试使用仓库下的 GADM 文件作为默认（若存在）
     admin_geo = args.admin_geojson
     if not admin_geo:
-        candidate = os.path.join(RESOURCE_DIR, 'GADM', 'gadm41_CHN_2.json')
+        candidate = ADMIN_GEOJSON
         if os.path.exists(candidate):
             admin_geo = candidate
             print(f"Using default admin geojson: {admin_geo}")
+    return admin_geo
+
 
+def _resolve_max_inflight(args):
     # If the user didn't provide an explicit max_inflight, choose a conservative default
     # to avoid submitting hundreds of concurrent futures on machines with limited resources.
     if getattr(args, 'max_inflight', None) is None:
         # default scales with worker count but has a sensible minimum
         args.max_inflight = max(8, args.workers * 8)
         print(f"max_inflight not provided, using conservative default: {args.max_inflight}")
+    return args.max_inflight
+
+
+def _add_readahead_args(parser):
+    parser.add_argument('--readahead', type=int, default=None,
+                        help='number of upcoming ZIPs to prefetch in a background I/O thread (0 disables; default from config)')
+    parser.add_argument('--readahead-mb', type=int, default=None,
+                        help='memory cap in MB for prefetched but unprocessed ZIP bytes (default from config)')
+
+
+def _add_member_executor_arg(parser):
+    parser.add_argument('--member-executor', choices=['auto', 'thread', 'process'], default=None,
+                        help='intra-day parallelism over hourly members: threads share the HDF5 lock, processes bypass it; '
+                             'auto uses processes when only a few days are queued (default from config)')
+
+
+def _add_grid_store_args(parser):
+    parser.add_argument('--grid-store', choices=['parquet', 'compact'], default=None,
+                        help='grid day file format: parquet rows or compact npz (coords once, quantized values; default from config)')
+    parser.add_argument('--grid-store-dtype', choices=['int16', 'float32'], default=None,
+                        help='value encoding for --grid-store compact (default from config)')
+
+
+def _apply_grid_store(args):
+    # 通过环境变量传给 worker 进程（spawn/fork 均可继承）
+    if getattr(args, 'grid_store', None):
+        os.environ['GRID_STORE'] = args.grid_store
+    if getattr(args, 'grid_store_dtype', None):
+        os.environ['GRID_STORE_DTYPE'] = args.grid_store_dtype
+
+
+def _readahead_bytes(args):
+    mb = getattr(args, 'readahead_mb', None)
+    return None if mb is None else mb * 1024 * 1024
+
+
+def cmd_extract(args):
+    from src.preprocess import process_zips_parallel
+    base = _resolve_base_path(args)
+    print(f"Extracting zips from {base} for year {args.year} -> granularity={','.join(args.granularity)}")
+    admin_geo = _resolve_admin_geojson(args)
+    _resolve_max_inflight(args)
+    _apply_grid_store(args)
 
     saved, failed = process_zips_parallel(base, args.year, granularity=args.granularity,
                                           admin_geojson=admin_geo, workers=args.workers,
                                           aggregate_mean=args.aggregate_mean,
-                                          max_inflight=args.max_inflight)
+                                          max_inflight=args.max_inflight,
+                                          readahead=args.readahead, readahead_bytes=_readahead_bytes(args),
+                                          member_executor=args.member_executor)
     print(f"done: saved={len(saved)} failed={len(failed)}")
 
 
 def cmd_aggregate(args):
+    from src.aggregate import aggregate_month_from_saved_days
     processed_root = args.processed_root or PROCESSED_DIR
     outdir = args.output_dir or os.path.join(AGGREGATED_DIR, 'processed_months')
     os.makedirs(outdir, exist_ok=True)
@@ -91,6 +150,8 @@ def cmd_aggregate(args):
 
 
 def cmd_export(args):
+    import pandas as pd
+    from src.visualize import convert_to_echarts_format
     # 查找聚合的 CSV (processed_months) 并合并
     agg_dir = None
     # 如果用户传递了显式目录，则使用它
@@ -131,7 +192,175 @@ def cmd_export(args):
     out = args.output_dir or os.path.join(OUTPUT_DIR, 'echarts')
     os.makedirs(out, exist_ok=True)
     print(f"Exporting combined aggregated frames to ECharts JSON in {out} (rows={len(combined)})")
-    convert_to_echarts_format(combined, output_dir=out)
+    convert_to_echarts_format(combined, output_dir=out, compact=args.compact or None, sharded=args.sharded or None)
+
+
+def cmd_all(args):
+    from src.pipeline import run_in_memory, PipelineExporters
+    from src.orchestrator import run_overlapped
+    base = _resolve_base_path(args)
+    admin_geo = _resolve_admin_geojson(args)
+    _resolve_max_inflight(args)
+    _apply_grid_store(args)
+    print(f"Running in-memory pipeline from {base} for year {args.year} -> granularity={args.granularity} keep_days={args.keep_days}")
+    if args.overlap:
+        exporters = PipelineExporters(aggregated_dir=args.aggregated_dir, output_dir=args.output_dir,
+                                      compact=args.compact or None, sharded=args.sharded or None,
+                                      admin_geojson=admin_geo)
+        return run_overlapped(args.year, base_path=base, granularity=args.granularity, admin_geojson=admin_geo,
+                              extract_workers=args.workers, stage_workers=args.stage_workers,
+                              max_inflight=args.max_inflight, aggregate_mean=args.aggregate_mean,
+                              persist_days=args.keep_days, executor=args.executor, exporters=exporters,
+                              readahead=args.readahead, readahead_bytes=_readahead_bytes(args),
+                              member_executor=args.member_executor)
+    run_in_memory(args.year, base_path=base, granularity=args.granularity, admin_geojson=admin_geo,
+                  workers=args.workers, aggregate_mean=args.aggregate_mean, max_inflight=args.max_inflight,
+                  persist_days=args.keep_days, aggregated_dir=args.aggregated_dir, output_dir=args.output_dir,
+                  readahead=args.readahead, readahead_bytes=_readahead_bytes(args), compact=args.compact or None,
+                  sharded=args.sharded or None, member_executor=args.member_executor)
+
+
+def cmd_calibrate(args):
+    from src.preprocess import list_year_zips
+    from src.util.backend_calibration import ensure_calibrated, format_entry
+    sample = args.zip
+    if not sample:
+        base = _resolve_base_path(args)
+        zips = list_year_zips(base, args.year)
+        if not zips:
+            print(f"No zips found in {base} for year {args.year}; pass --zip to choose a sample")
+            return
+        sample = zips[0]
+    print(f"Calibrating xarray backends on {sample} (force={args.force})")
+    entry = ensure_calibrated(sample, force=args.force)
+    if entry:
+        print(format_entry(entry))
+
+
+def cmd_zonal(args):
+    from src.util.grid_cube import load_grid_cube
+    from src.util.admin_weights import get_admin_units
+    admin_geo = _resolve_admin_geojson(args)
+    if not admin_geo:
+        print("No admin geojson found; pass --admin-geojson")
+        return
+    cube = load_grid_cube(args.year, processed_root=args.processed_root, start=args.start, end=args.end)
+    print(f"Loaded {cube}")
+    units = get_admin_units(cube.lat, cube.lon, admin_geo,
+                            county_geojson=COUNTY_GEOJSON if args.level == 'county' else None,
+                            weighting=args.weighting, area_weighted=not args.no_area_weight)
+    df = units.cube_frame(cube.days, cube.values, args.level)
+    out = args.output or os.path.join(AGGREGATED_DIR, 'zonal', f"{args.year}_{args.level}_{args.weighting}.parquet")
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    if out.lower().endswith('.csv'):
+        df.to_csv(out, index=False)
+    else:
+        df.to_parquet(out, index=False)
+    print(f"wrote {len(df)} rows ({args.level}, weighting={args.weighting}) -> {out}")
+
+
+def cmd_regions(args):
+    from src.util.regions import region_series
+    variables = [v.strip() for v in args.vars.split(',') if v.strip()] if args.vars else None
+    df = region_series(args.regions, year=args.year, start=args.start, end=args.end, variables=variables,
+                       name_field=args.name_field, method=args.method, area_weighted=not args.no_area_weight,
+                       processed_root=args.processed_root)
+    label = args.year if args.year is not None else 'all'
+    out = args.output or os.path.join(AGGREGATED_DIR, 'regions',
+                                      f"{os.path.splitext(os.path.basename(args.regions))[0]}_{label}.parquet")
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    if out.lower().endswith('.csv'):
+        df.to_csv(out, index=False)
+    else:
+        df.to_parquet(out, index=False)
+    print(f"wrote {len(df)} rows ({df['region'].nunique()} regions, method={args.method}) -> {out}")
+
+
+def cmd_points(args):
+    from src.util.point_query import read_points, point_series
+    points = read_points(args.points)
+    variables = [v.strip() for v in args.vars.split(',') if v.strip()] if args.vars else None
+    df = point_series(points, year=args.year, start=args.start, end=args.end, variables=variables,
+                      method=args.method, k=args.k, power=args.power, max_distance_km=args.max_distance_km,
+                      processed_root=args.processed_root)
+    label = args.year if args.year is not None else 'all'
+    out = args.output or os.path.join(AGGREGATED_DIR, 'points',
+                                      f"{os.path.splitext(os.path.basename(args.points))[0]}_{label}_{args.method}.parquet")
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    if out.lower().endswith('.csv'):
+        df.to_csv(out, index=False)
+    else:
+        df.to_parquet(out, index=False)
+    print(f"wrote {len(df)} rows ({len(points)} points, method={args.method}) -> {out}")
+
+
+def cmd_regrid(args):
+    from src.config import REGRID_DIR
+    from src.util.grid_cube import load_grid_cube
+    from src.util.regrid import regrid_cube, write_raster
+    variables = [v.strip() for v in args.vars.split(',') if v.strip()] if args.vars else None
+    cube = load_grid_cube(args.year, variables=variables, processed_root=args.processed_root,
+                          start=args.start, end=args.end)
+    print(f"Loaded {cube}")
+    target, rasters = regrid_cube(cube, res=args.res, method=args.method, period=args.period, variables=variables)
+    out_dir = args.output_dir or os.path.join(REGRID_DIR, f"{args.res:g}", args.method, args.period)
+    for label, fields in rasters.items():
+        write_raster(os.path.join(out_dir, f"{label}.{args.format}"), target, fields, fmt=args.format)
+    print(f"wrote {len(rasters)} {target.shape[0]}x{target.shape[1]} rasters -> {out_dir}")
+    if args.heatmap:
+        from src.util.precompute_heatmaps import write_raster_heatmap
+        var = args.heatmap_var if args.heatmap_var in cube.values else next(iter(cube.values))
+        for label, fields in rasters.items():
+            write_raster_heatmap(fields[var], target.lat, target.lon, label,
+                                 out_base=os.path.join(RESOURCE_DIR, 'heatmap', 'raster'))
+
+
+def cmd_tiles(args):
+    from src.config import TILES_DIR
+    from src.util.grid_cube import load_grid_cube
+    from src.util.regrid import regrid_cube
+    from src.util.tile_pyramid import build_tiles
+    variables = [v.strip() for v in args.vars.split(',') if v.strip()] if args.vars else None
+    factors = [int(f) for f in args.levels.split(',') if f.strip()]
+    cube = load_grid_cube(args.year, variables=variables, processed_root=args.processed_root,
+                          start=args.start, end=args.end)
+    print(f"Loaded {cube}")
+    target, rasters = regrid_cube(cube, res=args.res, method=args.method, period=args.period, variables=variables)
+    out_dir = args.output_dir or os.path.join(TILES_DIR, args.period)
+    manifest = build_tiles(out_dir, target, rasters, factors=factors, tile_size=args.tile_size, bits=args.bits,
+                           source={'res': args.res, 'method': args.method, 'period': args.period})
+    stats = manifest['_written']
+    print(f"wrote {stats['tiles']} tiles ({stats['bytes'] / 1e6:.1f} MB, {len(rasters)} periods, "
+          f"levels {factors}) -> {out_dir}")
+
+
+def cmd_centroids(args):
+    from src.config import CITY_CENTROIDS_JSON
+    from src.util.precompute_heatmaps import compute_city_centroids
+    admin_geo = _resolve_admin_geojson(args)
+    if not admin_geo:
+        print("No admin geojson found; pass --admin-geojson")
+        return
+    if args.source == 'cells' and args.year is None:
+        raise SystemExit('--source cells needs --year (grid day files define the cells)')
+    centroids = compute_city_centroids(year=args.year, admin_geojson=admin_geo, source=args.source,
+                                       out=args.output or CITY_CENTROIDS_JSON)
+    print(f"{len(centroids)} cities -> {args.output or CITY_CENTROIDS_JSON}")
+
+
+def cmd_boundaries(args):
+    from src.config import BOUNDARY_DIR
+    from src.util.boundary_topo import build_boundaries, format_report
+    admin_geo = _resolve_admin_geojson(args)
+    if not admin_geo:
+        print("No admin geojson found; pass --admin-geojson")
+        return
+    tolerances = [float(t) for t in args.tolerances.split(',') if t.strip()] if args.tolerances else None
+    out_dir = args.output_dir or BOUNDARY_DIR
+    manifest = build_boundaries(admin_geo, out_dir, tolerances=tolerances, quantization=args.quantization,
+                                province=not args.no_province)
+    print(format_report(manifest))
+    print(f"wrote {len(manifest['levels'])} levels -> {out_dir}")
 
 
 def main():
@@ -141,12 +370,16 @@ def main():
     e = sp.add_parser('extract', help='read ZIPs and produce per-day processed files')
     e.add_argument('--base-path', help='path to raw ZIPs (overrides BASE_PATH)')
     e.add_argument('--year', type=int, required=True)
-    e.add_argument('--granularity', choices=['grid', 'city', 'province'], default='city')
-    e.add_argument('--admin-geojson', help='path to admin geojson for city/province mapping')
+    e.add_argument('--granularity', choices=['grid', 'county', 'city', 'province'], nargs='+', default=['city'],
+                   help='one or more granularities written from a single read of each ZIP (e.g. grid city province)')
+    e.add_argument('--admin-geojson', help='path to admin geojson for city/province mapping (county uses COUNTY_GEOJSON)')
     e.add_argument('--workers', type=int, default=4)
     e.add_argument('--max-inflight', type=int, default=None,
                    help='maximum number of submitted but not-yet-completed tasks (limits resources)')
     e.add_argument('--aggregate-mean', action='store_true', help='use quick aggregate_mean in preprocessing')
+    _add_readahead_args(e)
+    _add_member_executor_arg(e)
+    _add_grid_store_args(e)
     e.set_defaults(func=cmd_extract)
 
     a = sp.add_parser('aggregate', help='aggregate saved daily files into monthly summaries')
@@ -159,8 +392,131 @@ def main():
     x.add_argument('--aggregated-dir', help='directory with monthly aggregated files')
     x.add_argument('--year', type=int, help='look under AGGREGATED_DIR/<year> for monthly aggregates')
     x.add_argument('--output-dir', help='output directory for echarts JSONs')
+    x.add_argument('--compact', action='store_true',
+                   help='also write columnar echarts_compact.json/.arrow with .gz/.br siblings (default from config)')
+    x.add_argument('--sharded', action='store_true',
+                   help='write metric x month and metric x province shards with a manifest instead of whole-year metric files')
     x.set_defaults(func=cmd_export)
 
+    r = sp.add_parser('all', help='extract, aggregate and export in one in-memory pass (day files optional)')
+    r.add_argument('--base-path', help='path to raw ZIPs (overrides BASE_PATH)')
+    r.add_argument('--year', type=int, required=True)
+    r.add_argument('--granularity', choices=['grid', 'county', 'city', 'province'], default='city')
+    r.add_argument('--admin-geojson', help='path to admin geojson for city/province mapping (county uses COUNTY_GEOJSON)')
+    r.add_argument('--workers', type=int, default=4)
+    r.add_argument('--max-inflight', type=int, default=None,
+                   help='maximum number of submitted but not-yet-completed tasks (limits resources)')
+    r.add_argument('--aggregate-mean', action='store_true', help='use quick aggregate_mean in preprocessing')
+    r.add_argument('--keep-days', action='store_true', help='also persist per-day processed files')
+    r.add_argument('--aggregated-dir', help='where to save monthly aggregates (overrides AGGREGATED_DIR/processed_months)')
+    r.add_argument('--output-dir', help='output directory for echarts JSONs')
+    r.add_argument('--compact', action='store_true',
+                   help='also write columnar echarts_compact.json/.arrow with .gz/.br siblings (default from config)')
+    r.add_argument('--sharded', action='store_true',
+                   help='write metric x month and metric x province shards with a manifest instead of whole-year metric files')
+    r.add_argument('--overlap', action='store_true',
+                   help='run stages concurrently: aggregate/export each month as soon as all its days are extracted')
+    r.add_argument('--executor', choices=['thread', 'process'], default='thread',
+                   help='worker pool used for extract when --overlap is set')
+    r.add_argument('--stage-workers', type=int, default=2, help='workers for aggregate/export stages when --overlap is set')
+    _add_readahead_args(r)
+    _add_member_executor_arg(r)
+    _add_grid_store_args(r)
+    r.set_defaults(func=cmd_all)
+
+    c = sp.add_parser('calibrate', help='time xarray backends on a sample member and remember the fastest order')
+    c.add_argument('--zip', help='sample ZIP (default: first ZIP of --year)')
+    c.add_argument('--base-path', help='path to raw ZIPs (overrides BASE_PATH)')
+    c.add_argument('--year', type=int, default=None)
+    c.add_argument('--force', action='store_true', help='re-run even if this environment is already calibrated')
+    c.set_defaults(func=cmd_calibrate)
+
+    z = sp.add_parser('zonal', help='aggregate saved grid days to county/city/province daily series in one sparse multiply')
+    z.add_argument('--year', type=int, required=True)
+    z.add_argument('--level', choices=['county', 'city', 'province'], default='city')
+    z.add_argument('--weighting', choices=['overlap', 'centroid'], default='overlap',
+                   help='overlap: cell-footprint/polygon area fractions; centroid: cell centre ownership')
+    z.add_argument('--no-area-weight', action='store_true', help='do not scale overlap weights by cell area')
+    z.add_argument('--admin-geojson', help='path to admin geojson (county uses COUNTY_GEOJSON)')
+    z.add_argument('--processed-root', help='root directory where day files are saved (overrides PROCESSED_DIR)')
+    z.add_argument('--start', help='first day (YYYYMMDD or YYYY-MM-DD)')
+    z.add_argument('--end', help='last day (inclusive)')
+    z.add_argument('--output', help='output .parquet or .csv (default AGGREGATED_DIR/zonal/<year>_<level>_<weighting>.parquet)')
+    z.set_defaults(func=cmd_zonal)
+
+    g = sp.add_parser('regions', help='daily series for any polygon set (cached grid weights, no re-extract)')
+    g.add_argument('--regions', required=True, help='polygon file (GeoJSON/Shapefile/GeoPackage)')
+    g.add_argument('--name-field', help='attribute holding region names (default: name/NAME/region/...)')
+    g.add_argument('--year', type=int, default=None, help='restrict to one year of grid day files')
+    g.add_argument('--start', help='first day (YYYYMMDD or YYYY-MM-DD)')
+    g.add_argument('--end', help='last day (inclusive)')
+    g.add_argument('--vars', help='comma-separated variables (default: all)')
+    g.add_argument('--method', choices=['overlap', 'centroid'], default='overlap')
+    g.add_argument('--no-area-weight', action='store_true', help='do not scale overlap weights by cell area')
+    g.add_argument('--processed-root', help='root directory where day files are saved (overrides PROCESSED_DIR)')
+    g.add_argument('--output', help='output .parquet or .csv (default AGGREGATED_DIR/regions/<name>_<year>.parquet)')
+    g.set_defaults(func=cmd_regions)
+
+    q = sp.add_parser('points', help='daily series at arbitrary points (stations) via a cached KD-tree over the grid')
+    q.add_argument('--points', required=True, help='CSV/Excel/Parquet with lat/lon (and id/name) columns')
+    q.add_argument('--year', type=int, default=None, help='restrict to one year of grid day files')
+    q.add_argument('--start', help='first day (YYYYMMDD or YYYY-MM-DD)')
+    q.add_argument('--end', help='last day (inclusive)')
+    q.add_argument('--vars', help='comma-separated variables (default: all)')
+    q.add_argument('--method', choices=['nearest', 'idw'], default='nearest')
+    q.add_argument('--k', type=int, default=4, help='neighbours for idw')
+    q.add_argument('--power', type=float, default=2.0, help='inverse-distance power for idw')
+    q.add_argument('--max-distance-km', type=float, default=None, help='ignore cells farther than this')
+    q.add_argument('--processed-root', help='root directory where day files are saved (overrides PROCESSED_DIR)')
+    q.add_argument('--output', help='output .parquet or .csv (default AGGREGATED_DIR/points/<name>_<year>_<method>.parquet)')
+    q.set_defaults(func=cmd_points)
+
+    rg = sp.add_parser('regrid', help='regrid saved grid days to a regular lat/lon raster with cached sparse weights')
+    rg.add_argument('--year', type=int, default=None, help='restrict to one year of grid day files')
+    rg.add_argument('--start', help='first day (YYYYMMDD or YYYY-MM-DD)')
+    rg.add_argument('--end', help='last day (inclusive)')
+    rg.add_argument('--res', type=float, default=0.25, help='target resolution in degrees (e.g. 0.1 or 0.25)')
+    rg.add_argument('--method', choices=['bilinear', 'conservative'], default='bilinear')
+    rg.add_argument('--period', choices=['day', 'month', 'all'], default='month')
+    rg.add_argument('--vars', help='comma-separated variables (default: all)')
+    rg.add_argument('--format', choices=['npz', 'nc'], default='npz')
+    rg.add_argument('--processed-root', help='root directory where day files are saved (overrides PROCESSED_DIR)')
+    rg.add_argument('--output-dir', help='default REGRID_DIR/<res>/<method>/<period>')
+    rg.add_argument('--heatmap', action='store_true', help='also write raster heatmap JSONs under resources/heatmap/raster')
+    rg.add_argument('--heatmap-var', default='pm25')
+    rg.set_defaults(func=cmd_regrid)
+
+    t = sp.add_parser('tiles', help='build a quantized multi-resolution tile pyramid of regridded fields')
+    t.add_argument('--year', type=int, default=None, help='restrict to one year of grid day files')
+    t.add_argument('--start', help='first day (YYYYMMDD or YYYY-MM-DD)')
+    t.add_argument('--end', help='last day (inclusive)')
+    t.add_argument('--res', type=float, default=0.1, help='base raster resolution in degrees')
+    t.add_argument('--method', choices=['bilinear', 'conservative'], default='bilinear')
+    t.add_argument('--period', choices=['day', 'month', 'all'], default='month')
+    t.add_argument('--vars', help='comma-separated variables (default: all)')
+    t.add_argument('--levels', default='1,2,4,8', help='comma-separated block-average factors, one per level')
+    t.add_argument('--tile-size', type=int, default=128)
+    t.add_argument('--bits', type=int, choices=[8, 16], default=8, help='quantization width (uint8 or uint16)')
+    t.add_argument('--processed-root', help='root directory where day files are saved (overrides PROCESSED_DIR)')
+    t.add_argument('--output-dir', help='default TILES_DIR/<period>')
+    t.set_defaults(func=cmd_tiles)
+
+    ct = sp.add_parser('centroids', help='per-city centroids and label points (cached) for heatmap exports')
+    ct.add_argument('--admin-geojson', help='path to admin geojson (default: ADMIN_GEOJSON)')
+    ct.add_argument('--source', choices=['polygon', 'cells'], default=None,
+                    help='polygon: GADM geometry; cells: grid cells each city owns (default: ADMIN_POINTS_SOURCE)')
+    ct.add_argument('--year', type=int, default=None, help='grid day files that define the cells (--source cells)')
+    ct.add_argument('--output', help='default CITY_CENTROIDS_JSON')
+    ct.set_defaults(func=cmd_centroids)
+
+    bd = sp.add_parser('boundaries', help='simplified, quantized city/province boundaries (TopoJSON + GeoJSON) for the web map')
+    bd.add_argument('--admin-geojson', help='path to admin geojson (default: ADMIN_GEOJSON)')
+    bd.add_argument('--tolerances', help='comma-separated simplification tolerances in degrees (default: BOUNDARY_TOLERANCES)')
+    bd.add_argument('--quantization', type=int, default=None, help='grid size per axis (default: BOUNDARY_QUANTIZATION)')
+    bd.add_argument('--no-province', action='store_true', help='only the city object (no dissolved province borders)')
+    bd.add_argument('--output-dir', help='default BOUNDARY_DIR')
+    bd.set_defaults(func=cmd_boundaries)
+
     args = p.parse_args()
     if not args.cmd:
         p.print_help()
@@ -3,14 +3,15 @@ import glob
 import re
 import pandas as pd
 import numpy as np
-from .config import AGGREGATED_DIR
+from typing import Dict, List, Optional, Tuple
+from .config import AGGREGATED_DIR, VALUE_DTYPE
 
 
 def aggregate_month_from_saved_days(year: int, month: int, processed_days_dir: str, output_dir: str = None) -> pd.DataFrame:
     """将保存的每日清理文件汇总到每月摘要中。
 
-    在processed_days_dir 下查找与{year}{month:02d}*.parquet/csv 匹配的parquet/csv 文件。
-    如果 admin_name 存在，则按 admin_name+month 聚合数字列，否则按 lat/lon+month 聚合数字列。
+    在processed_days_dir 下查找与{year}{month:02d}*.parquet/csv 匹配的parquet/csv 文件（以及 grid 紧凑格式的 .npz）。
+    如果 admin_name 存在，则按 admin_name+month 聚合数字列；否则依次尝试 province+city、province，最后按 lat/lon+month 聚合。
     将结果保存到output_dir并返回聚合的DataFrame。
     """
     if output_dir is None:
@@ -20,7 +21,9 @@ def aggregate_month_from_saved_days(year: int, month: int, processed_days_dir: s
     # 递归搜索嵌套年/月/日文件夹下保存的日期文件。
     pattern_parquet = os.path.join(processed_days_dir, '**', f"{year}{month:02d}*.parquet")
     pattern_csv = os.path.join(processed_days_dir, '**', f"{year}{month:02d}*.csv")
-    files = sorted(glob.glob(pattern_parquet, recursive=True) + glob.glob(pattern_csv, recursive=True))
+    pattern_npz = os.path.join(processed_days_dir, '**', f"{year}{month:02d}*.npz")
+    files = sorted(glob.glob(pattern_parquet, recursive=True) + glob.glob(pattern_csv, recursive=True)
+                   + glob.glob(pattern_npz, recursive=True))
     if not files:
         raise FileNotFoundError(f"在 {processed_days_dir} 中未找到 {year}-{month:02d} 的日文件")
 
@@ -29,6 +32,9 @@ def aggregate_month_from_saved_days(year: int, month: int, processed_days_dir: s
         try:
             if f.endswith('.parquet'):
                 df = pd.read_parquet(f)
+            elif f.endswith('.npz'):
+                from .util.grid_store import read_day_frame
+                df = read_day_frame(f)
             else:
                 # 读取 csv 而不强制 parse_dates 以避免“时间”丢失时出现错误
                 df = pd.read_csv(f)
@@ -68,28 +74,50 @@ def aggregate_month_from_saved_days(year: int, month: int, processed_days_dir: s
             pass
 
     # 选择分组键。如果可用，我们按 admin_name 聚合，否则按纬度/经度聚合。
-    if 'admin_name' in month_df.columns:
-        group_keys = ['admin_name']
-    elif 'province' in month_df.columns and 'city' in month_df.columns:
-        group_keys = ['province', 'city']
-    else:
-        group_keys = ['lat', 'lon']
+    group_keys = _choose_group_keys(month_df)
 
     # 仅聚合数字列
-    numeric_cols = month_df.select_dtypes(include=[np.number]).columns.tolist()
+    numeric_cols = _numeric_value_cols(month_df, group_keys)
     if not numeric_cols:
         raise RuntimeError('没有找到可聚合的数值列')
 
-    month_agg = month_df.groupby(group_keys)[numeric_cols].mean().reset_index()
+    month_agg = month_df.groupby(group_keys, observed=True)[numeric_cols].mean()
+    month_agg = month_agg.astype(VALUE_DTYPE).reset_index()
+    _add_month_time(month_agg, year, month)
+    save_month_aggregate(month_agg, year, month, output_dir)
+    return month_agg
+
+
+def _choose_group_keys(df: pd.DataFrame) -> List[str]:
+    if 'admin_name' in df.columns:
+        return ['admin_name']
+    if 'county' in df.columns:
+        # 区县级日结果（见 util.admin_index），带上级省/市名称
+        return ['province', 'city', 'county']
+    if 'province' in df.columns and 'city' in df.columns:
+        return ['province', 'city']
+    if 'province' in df.columns:
+        # 省级日结果（由市级 sum/count 汇总，见 preprocess.build_day_frames）
+        return ['province']
+    return ['lat', 'lon']
+
 
+def _numeric_value_cols(df: pd.DataFrame, group_keys: List[str]) -> List[str]:
+    return [c for c in df.select_dtypes(include=[np.number]).columns if c not in group_keys]
+
+
+def _add_month_time(month_agg: pd.DataFrame, year: int, month: int) -> None:
     # 为月度聚合结果添加一个表示该月的时间列（第1天），便于后续可视化和按时间分组
     try:
-        month_time = pd.to_datetime(f"{year}-{month:02d}-01")
-        month_agg['time'] = month_time
+        month_agg['time'] = pd.to_datetime(f"{year}-{month:02d}-01")
     except Exception:
         # 如果构造失败则不添加
         pass
 
+
+def save_month_aggregate(month_agg: pd.DataFrame, year: int, month: int, output_dir: str) -> str:
+    """把月度聚合结果保存为 {year}{month:02d}.parquet（失败时回退为 csv），返回保存路径。"""
+    os.makedirs(output_dir, exist_ok=True)
     out_parquet = os.path.join(output_dir, f"{year}{month:02d}.parquet")
     try:
         month_agg.to_parquet(out_parquet)
@@ -100,5 +128,63 @@ def aggregate_month_from_saved_days(year: int, month: int, processed_days_dir: s
         saved = out_csv
 
     print(f"已保存月度聚合文件: {saved}")
+    return saved
 
-    return month_agg
+
+class MonthlyAccumulator:
+    """在内存中按月累加日结果，无需先写日文件再读回。
+
+    每个月只保留分组键上的 sum/count，finalize 得到的均值与
+    aggregate_month_from_saved_days 对同一批日文件的结果一致（按非缺失值计数）。
+    """
+
+    def __init__(self):
+        self._sums: Dict[Tuple[int, int], pd.DataFrame] = {}
+        self._counts: Dict[Tuple[int, int], pd.DataFrame] = {}
+        self._days: Dict[Tuple[int, int], int] = {}
+        self._group_keys: Dict[Tuple[int, int], List[str]] = {}
+
+    def add(self, day_basename: str, day_df: pd.DataFrame) -> Optional[Tuple[int, int]]:
+        """累加一天的结果；day_basename 形如 'YYYYMMDD'。返回 (year, month)，无法识别日期时返回 None。"""
+        m = re.match(r'(\d{4})(\d{2})', str(day_basename))
+        if not m or day_df is None or day_df.empty:
+            return None
+        key = (int(m.group(1)), int(m.group(2)))
+        group_keys = self._group_keys.setdefault(key, _choose_group_keys(day_df))
+        numeric_cols = _numeric_value_cols(day_df, group_keys)
+        if not numeric_cols:
+            return None
+        grouped = day_df.groupby(group_keys, observed=True)[numeric_cols]
+        # 跨天求和用 float64 累加，finalize 时再按 VALUE_DTYPE 输出均值
+        day_sum = grouped.sum(min_count=1).astype(np.float64)
+        day_count = grouped.count()
+        if key in self._sums:
+            self._sums[key] = self._sums[key].add(day_sum, fill_value=0)
+            self._counts[key] = self._counts[key].add(day_count, fill_value=0)
+        else:
+            self._sums[key] = day_sum
+            self._counts[key] = day_count
+        self._days[key] = self._days.get(key, 0) + 1
+        return key
+
+    def months(self) -> List[Tuple[int, int]]:
+        return sorted(self._sums)
+
+    def day_count(self, year: int, month: int) -> int:
+        return self._days.get((year, month), 0)
+
+    def finalize(self, year: int, month: int, output_dir: Optional[str] = None, drop: bool = True) -> pd.DataFrame:
+        """返回该月的聚合 DataFrame；提供 output_dir 时同时保存。drop=True 时释放该月的累加器。"""
+        key = (year, month)
+        if key not in self._sums:
+            raise FileNotFoundError(f"内存累加器中没有 {year}-{month:02d} 的日结果")
+        sums = self._sums[key]
+        counts = self._counts[key]
+        month_agg = (sums / counts.where(counts > 0)).astype(VALUE_DTYPE).reset_index()
+        _add_month_time(month_agg, year, month)
+        if output_dir is not None:
+            save_month_aggregate(month_agg, year, month, output_dir)
+        if drop:
+            for d in (self._sums, self._counts, self._days, self._group_keys):
+                d.pop(key, None)
+        return month_agg
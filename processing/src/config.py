@@ -38,6 +38,33 @@ DEFER_CLEANUP = True
 # 尝试内存读取的内存阈值
 MAX_IN_MEMORY_BYTES = 300 * 1024 * 1024  # 300 MB
 
+# ZIP 预读（I/O 与计算解耦）：后台线程按顺序预读后续 READAHEAD_DEPTH 个压缩包的字节；
+# 已读取但尚未处理完的字节总量不超过 READAHEAD_MAX_BYTES。READAHEAD_DEPTH=0 关闭预读。
+READAHEAD_DEPTH = 8
+READAHEAD_MAX_BYTES = 1024 * 1024 * 1024  # 1 GB
+# 顺序读取时单次 read 的块大小（网络文件系统上大块读取吞吐更高）
+READAHEAD_CHUNK_BYTES = 16 * 1024 * 1024  # 16 MB
+# ZIP 中以 STORED（未压缩）方式存放的 .nc 成员：通过 mmap 直接把归档中该成员的区间交给 HDF5 后端，
+# 不解压也不整体复制为 bytes
+MMAP_STORED_MEMBERS = True
+# 压缩成员按块解压进预分配缓冲区时的单次块大小
+INFLATE_CHUNK_BYTES = 1024 * 1024  # 1 MB
+# 单日内部并行：一天的各小时成员并发解码并归约为部分和（sum/count）后合并。
+# INTRA_DAY_WORKERS=None 表示自动（空闲核数 / 同时处理的天数，上限 INTRA_DAY_MAX_WORKERS）；1 关闭
+INTRA_DAY_WORKERS = None
+INTRA_DAY_MAX_WORKERS = 8
+# 单日内部并行的执行方式：'thread' 各线程共用 h5py 的全局锁，只有解压与归约能重叠；'process' 用进程池
+# （子进程各自重新打开压缩包）绕开该锁；'auto' 在排队天数不超过 INTRA_DAY_PROCESS_MAX_DAYS
+# （单日、一周这类任务，日级并行填不满核）且各天不在进程池中处理时用进程，否则用线程
+INTRA_DAY_EXECUTOR = 'auto'
+INTRA_DAY_PROCESS_MAX_DAYS = 7
+# 小时成员优先用 h5py 直接读入 float32 缓冲区（见 util/h5_reader.py），布局不符时回退到 xarray
+H5_FAST_PATH = True
+# xarray 后端校准结果（按环境指纹保存实测最快的 engine 顺序，见 util/backend_calibration.py）；
+# AUTO_CALIBRATE_BACKENDS=True 时首次处理 ZIP 前自动校准一次，之后直接复用
+BACKEND_CALIBRATION_FILE = os.path.join(TMP_DIR, 'backend_calibration.json')
+AUTO_CALIBRATE_BACKENDS = True
+
 # 高德逆地理相关配置
 AMAP_KEY = "a7335005d09683ee04c5e4e116c7d58e"
 # 缓存数据库（sqlite），用于存储经纬度->省市的映射，避免重复调用 API
@@ -81,3 +108,54 @@ TEMP_KELVIN_THRESHOLD = 100.0
 # IQR 离群值默认参数
 IQR_K = 1.5
 IQR_GROUPBY = ['lat', 'lon']
+
+# dtype 策略：原始变量为 float32，管道中的数值列保持 VALUE_DTYPE；
+# 只有跨小时/跨天的求和累加器使用 float64（见 preprocess.DayMeanAccumulator 与 aggregate.MonthlyAccumulator）
+VALUE_DTYPE = 'float32'
+# 行政区键（province/city/admin_name）在日内的大表上使用 category，groupby 时 observed=True；
+# 聚合后的小表仍输出普通字符串列，保持日文件/月文件格式不变
+CATEGORICAL_ADMIN_KEYS = True
+
+# 格点行政区层级索引（格点 -> 区县 -> 市 -> 省）：每张网格只做一次空间连接，缓存为 npz，
+# 之后 county/city/province 的日聚合都按编码 bincount；关闭时回退为逐日映射（不支持 county）
+ADMIN_INDEX_ENABLED = True
+ADMIN_INDEX_DIR = os.path.join(TMP_DIR, 'admin_index')
+# 市级边界（GADM level 2），命令行未指定 --admin-geojson 时使用
+ADMIN_GEOJSON = os.path.join(RESOURCE_DIR, 'GADM', 'gadm41_CHN_2.json')
+# 区县边界（GADM level 3），county 粒度需要
+COUNTY_GEOJSON = os.path.join(RESOURCE_DIR, 'GADM', 'gadm41_CHN_3.json')
+# 格点到行政区的权重：'centroid' 格点中心所在单元记 1；'overlap' 按格点足迹与多边形的面积重叠比例
+# （见 util.admin_weights，边界、沿海与小面积单元更准确），ADMIN_AREA_WEIGHTED 时再乘以格点面积
+ADMIN_WEIGHTING = 'centroid'
+ADMIN_AREA_WEIGHTED = True
+# 行政区质心与标注点（util.admin_points）：'polygon' 用 GADM 多边形，'cells' 用单元拥有的格点；
+# 与行政区索引一起缓存在 ADMIN_INDEX_DIR，热图导出按市查 CITY_CENTROIDS_JSON
+ADMIN_POINTS_SOURCE = 'polygon'
+CITY_CENTROIDS_JSON = os.path.join(RESOURCE_DIR, 'city_centroids.json')
+# 网页地图用的简化边界（util.boundary_topo）：市/省合并后的共享弧段按各容差（度）简化，
+# 坐标量化到 BOUNDARY_QUANTIZATION 级整数网格，写出 TopoJSON 与可直接 registerMap 的 GeoJSON
+BOUNDARY_DIR = os.path.join(RESOURCE_DIR, 'boundaries')
+BOUNDARY_TOLERANCES = (0.002, 0.01, 0.05)
+BOUNDARY_QUANTIZATION = 100000
+# 自定义区域（util.regions）栅格化后的格点 × 区域权重缓存
+REGION_CACHE_DIR = os.path.join(TMP_DIR, 'regions')
+# 曲线网格到规则经纬度栅格的重网格化权重缓存（util.regrid）与输出目录
+REGRID_CACHE_DIR = os.path.join(TMP_DIR, 'regrid')
+REGRID_DIR = os.path.join(RESOURCE_DIR, 'regrid')
+# 可缩放地图的量化瓦片金字塔（util.tile_pyramid）输出目录，前端按 manifest.json 取瓦片
+TILES_DIR = os.path.join(RESOURCE_DIR, 'tiles')
+# grid 粒度日文件的存储：'parquet'（每行带 lat/lon）或 'compact'（util.grid_store：坐标按网格只存一次，
+# 数值为 GRID_STORE_DTYPE 'int16' 定点码值 + 每变量 scale/offset，或 'float32'）；环境变量 GRID_STORE/GRID_STORE_DTYPE 优先
+GRID_STORE = 'parquet'
+GRID_STORE_DTYPE = 'int16'
+# export 额外写出紧凑列式的 echarts_compact.json/.arrow（util.echarts_compact）：数值保留的小数位与预压缩格式
+# （'br' 需要可选依赖 brotli，未安装时跳过）
+ECHARTS_COMPACT = False
+ECHARTS_COMPACT_DECIMALS = 2
+ECHARTS_PRECOMPRESS = ('gz', 'br')
+# export 按 指标 × 周期 与 指标 × 省 分片写到 <output>/shards 并附 manifest.json（util.echarts_shards）
+ECHARTS_SHARDED = False
+# 逐日趋势与分片导出的时间序列降采样级别（util.downsample）：weekly/monthly 为周/月均值，lttb_<N> 为 LTTB 选出的 N 个点
+TREND_LEVELS = ('weekly', 'monthly', 'lttb_100', 'lttb_250')
+# 趋势文件（CSV、降采样 JSON、合并二进制）的并行写出线程数；内容摘要未变的文件不重写（util.generate_trend_csvs）
+TREND_WRITE_WORKERS = 8
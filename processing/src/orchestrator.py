@@ -0,0 +1,174 @@
+"""基于 asyncio 的分阶段编排器：extract / aggregate / export 三个阶段重叠执行。
+
+每天的 extract 任务在底层工作池（线程或进程）中运行；编排器跟踪每个月
+已完成的天数，一旦某月所有天都完成（成功或失败）就立即启动该月的聚合与
+月度导出（含该月的 ECharts 分组与趋势均值），而不必等全年提取结束；全年结束后
+只剩合并与写出。总耗时因此接近单独 extract 的耗时。
+"""
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from .config import BASE_PATH, READAHEAD_DEPTH, READAHEAD_MAX_BYTES, AUTO_CALIBRATE_BACKENDS
+from .preprocess import list_year_zips, day_basename_from_zip, _worker_wrapper, auto_member_workers, \
+    auto_member_executor, DEFAULT_AGGREGATE_MEAN
+from .aggregate import MonthlyAccumulator
+from .util.io_utils import ZipPrefetcher
+from .util.backend_calibration import ensure_calibrated
+from .pipeline import PipelineExporters, accepts_day, daily_trend_part, month_of_day
+
+
+class StageOrchestrator:
+    """按月跟踪完成度并在事件循环中调度各阶段。
+
+    extract_workers 控制底层 extract 池大小；stage_workers 控制聚合/导出池大小
+    （与 extract 池分开，避免月度导出排在大量日任务之后）。
+    executor='process' 时 extract 使用进程池，可绕开 HDF5 打开时的全局锁。
+    readahead>0 时由 ZipPrefetcher 顺序预读压缩包字节，再交给 extract 池解码。
+    member_executor 为单日内部成员并行的方式（'auto'/'thread'/'process'，默认 config.INTRA_DAY_EXECUTOR）。
+    """
+
+    def __init__(self,
+                 year: int,
+                 base_path: Optional[str] = None,
+                 granularity: str = 'city',
+                 admin_geojson: Optional[str] = None,
+                 extract_workers: int = 4,
+                 stage_workers: int = 2,
+                 max_inflight: Optional[int] = None,
+                 aggregate_mean: bool = DEFAULT_AGGREGATE_MEAN,
+                 persist_days: bool = False,
+                 executor: str = 'thread',
+                 exporters: Optional[PipelineExporters] = None,
+                 readahead: Optional[int] = None,
+                 readahead_bytes: Optional[int] = None,
+                 member_executor: Optional[str] = None):
+        self.year = year
+        self.base_path = base_path or os.path.join(BASE_PATH, str(year))
+        self.granularity = granularity
+        self.admin_geojson = admin_geojson
+        self.extract_workers = max(1, int(extract_workers))
+        self.stage_workers = max(1, int(stage_workers))
+        self.max_inflight = max_inflight if max_inflight and max_inflight > 0 else self.extract_workers * 2
+        self.aggregate_mean = aggregate_mean
+        self.persist_days = persist_days
+        if executor not in ('thread', 'process'):
+            raise ValueError("executor 必须是 'thread' 或 'process'")
+        self.executor = executor
+        self.exporters = exporters or PipelineExporters()
+        self.readahead = READAHEAD_DEPTH if readahead is None else readahead
+        self.readahead_bytes = READAHEAD_MAX_BYTES if readahead_bytes is None else readahead_bytes
+        self.member_executor = member_executor
+
+        self.acc = MonthlyAccumulator()
+        self.remaining: Dict[Tuple[int, int], int] = {}
+        self.daily_parts: Dict[Tuple[int, int], List[object]] = {}
+        self.saved: List[str] = []
+        self.failed: List[Dict] = []
+        self.timings: Dict[str, float] = {}
+
+    def run(self) -> str:
+        """同步入口：运行事件循环直到所有阶段完成，返回 ECharts 输出目录。"""
+        return asyncio.run(self.run_async())
+
+    async def run_async(self) -> str:
+        zip_paths = list_year_zips(self.base_path, self.year)
+        print(f"found {len(zip_paths)} zip(s) to process in {self.base_path} for year {self.year}")
+        for zp in zip_paths:
+            key = month_of_day(day_basename_from_zip(zp))
+            self.remaining[key] = self.remaining.get(key, 0) + 1
+        if AUTO_CALIBRATE_BACKENDS and zip_paths:
+            ensure_calibrated(zip_paths[0])
+
+        pool_cls = ProcessPoolExecutor if self.executor == 'process' else ThreadPoolExecutor
+        # 天数少于 extract 池大小（如只处理一个月）时，把空闲核分给单日内部的成员解码
+        member_workers = auto_member_workers(self.extract_workers, len(zip_paths))
+        member_executor = auto_member_executor(len(zip_paths), member_workers, self.member_executor, self.executor)
+        t0 = time.perf_counter()
+        with pool_cls(max_workers=self.extract_workers) as extract_pool, \
+                ThreadPoolExecutor(max_workers=self.stage_workers) as stage_pool:
+            loop = asyncio.get_running_loop()
+            sem = asyncio.Semaphore(self.max_inflight)
+            month_tasks = []
+            prefetcher = None
+            if self.readahead and self.readahead > 0 and zip_paths:
+                prefetcher = ZipPrefetcher(zip_paths, depth=self.readahead, max_bytes=self.readahead_bytes).start()
+
+            async def _day(zp, data=None):
+                args = (zp, self.granularity, self.admin_geojson, None, self.aggregate_mean, self.persist_days, data,
+                        member_workers, member_executor)
+                try:
+                    file, ok, payload = await loop.run_in_executor(extract_pool, _worker_wrapper, args)
+                finally:
+                    sem.release()
+                    if prefetcher is not None and data is not None:
+                        prefetcher.release(len(data))
+                key = month_of_day(day_basename_from_zip(zp))
+                if ok:
+                    day_basename, frames, saved_paths = payload
+                    # 累加在事件循环线程中进行，无需加锁
+                    for out_granularity, day_df in frames.items():
+                        if not accepts_day(self.granularity, out_granularity, day_basename):
+                            continue
+                        self.acc.add(day_basename, day_df)
+                        if self.exporters.keep_daily(out_granularity):
+                            self.daily_parts.setdefault(key, []).append(daily_trend_part(day_basename, day_df))
+                    if self.persist_days:
+                        self.saved.extend(saved_paths.values())
+                    else:
+                        self.saved.append(day_basename)
+                    print(f"success: {file} -> {', '.join(saved_paths.values()) if self.persist_days else '(in-memory)'}")
+                else:
+                    self.failed.append({'file': file, 'error': payload})
+                    print(f"failed: {file} -> {payload}")
+                sys.stdout.flush()
+                self.remaining[key] -= 1
+                if self.remaining[key] == 0:
+                    month_tasks.append(asyncio.ensure_future(_month(key)))
+
+            async def _month(key):
+                y, m = key
+                if self.acc.day_count(y, m) == 0:
+                    print(f"no successful days for {y}-{m:02d}; skipping month stage")
+                    return
+                # finalize 只做小表计算，放在事件循环线程里以免与 add 并发修改累加器
+                month_df = self.acc.finalize(y, m)
+                # 该月的 ECharts 分组与趋势均值也在这里完成，日表随即释放；全年结束后只剩合并与写出
+                await loop.run_in_executor(stage_pool, self.exporters.export_month, y, m, month_df,
+                                           self.daily_parts.pop(key, None))
+                print(f"[orchestrator] month {y}-{m:02d} aggregated and exported "
+                      f"at +{time.perf_counter() - t0:.1f}s")
+
+            day_tasks = []
+            if prefetcher is not None:
+                # 预读线程阻塞在 I/O 上时不占用事件循环：next() 在默认线程池中等待
+                it = iter(prefetcher)
+                try:
+                    for zp in zip_paths:
+                        await sem.acquire()
+                        _path, data, _err = await loop.run_in_executor(None, next, it)
+                        day_tasks.append(asyncio.ensure_future(_day(zp, data)))
+                    await asyncio.gather(*day_tasks)
+                finally:
+                    prefetcher.close()
+            else:
+                for zp in zip_paths:
+                    await sem.acquire()
+                    day_tasks.append(asyncio.ensure_future(_day(zp)))
+                await asyncio.gather(*day_tasks)
+            self.timings['extract'] = time.perf_counter() - t0
+            # month_tasks 只会在 _day 中追加，此时已全部创建
+            await asyncio.gather(*month_tasks)
+            out = await loop.run_in_executor(stage_pool, self.exporters.export_final)
+        self.timings['total'] = time.perf_counter() - t0
+        print(f"[orchestrator] days ok={len(self.saved)} failed={len(self.failed)}; "
+              f"extract={self.timings['extract']:.1f}s total={self.timings['total']:.1f}s")
+        return out
+
+
+def run_overlapped(year: int, **kwargs) -> str:
+    """以重叠阶段方式运行整年流水线；参数同 StageOrchestrator。"""
+    return StageOrchestrator(year, **kwargs).run()
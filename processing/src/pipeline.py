@@ -0,0 +1,189 @@
+"""端到端的内存流水线：日结果直接进入月度累加器与导出器。
+
+与 extract -> aggregate -> export 三步相比，这里不必先写日文件再逐个读回；
+日文件是否保存由 persist_days 控制（默认不保存）。
+"""
+import os
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from .config import BASE_PATH, AGGREGATED_DIR, OUTPUT_DIR, RESOURCE_DIR, CITY_CENTROIDS_JSON
+from .preprocess import process_zips_parallel, DEFAULT_AGGREGATE_MEAN
+from .aggregate import MonthlyAccumulator, save_month_aggregate
+from .visualize import convert_to_echarts_format, echarts_part, write_echarts_parts
+from .util.generate_trend_csvs import trend_means, merge_trend_means, write_trend_means
+from .util.precompute_heatmaps import write_monthly_heatmap, load_city_centroids
+
+
+def _day_to_iso(day_basename: str) -> str:
+    s = str(day_basename)
+    return f"{s[0:4]}-{s[4:6]}-{s[6:8]}"
+
+
+def month_of_day(day_basename: str) -> Tuple[int, int]:
+    return int(day_basename[0:4]), int(day_basename[4:6])
+
+
+class PipelineExporters:
+    """内存流水线与重叠编排器共用的导出器。
+
+    export_month 在每个月的聚合完成后立即调用：写月度聚合文件与热图，并完成该月的 ECharts 分组
+    （visualize.echarts_part）与月/日趋势均值（generate_trend_csvs.trend_means），该月的日表随即释放；
+    export_final 在全部月份完成后调用一次，只按月拼接这些中间结果并写出 ECharts 与趋势文件。
+    没有名称键的月表（grid 粒度）无法按月分组，仍在 export_final 中整表导出。一个实例对应一次运行。
+    """
+
+    def __init__(self,
+                 aggregated_dir: Optional[str] = None,
+                 output_dir: Optional[str] = None,
+                 trends_dir: Optional[str] = None,
+                 heatmap_dir: Optional[str] = None,
+                 write_trends: bool = True,
+                 write_heatmaps: bool = True,
+                 compact: Optional[bool] = None,
+                 sharded: Optional[bool] = None,
+                 admin_geojson: Optional[str] = None):
+        self.aggregated_dir = aggregated_dir or os.path.join(AGGREGATED_DIR, 'processed_months')
+        self.output_dir = output_dir or os.path.join(OUTPUT_DIR, 'echarts')
+        self.trends_dir = trends_dir or os.path.join(RESOURCE_DIR, 'trends')
+        self.heatmap_dir = heatmap_dir or os.path.join(RESOURCE_DIR, 'heatmap', 'monthly')
+        self.write_trends = write_trends
+        self.write_heatmaps = write_heatmaps
+        self.compact = compact
+        self.sharded = sharded
+        self.admin_geojson = admin_geojson
+        self._centroids = None
+        self._echarts_parts: Dict[Tuple[int, int], dict] = {}
+        self._echarts_frames: Dict[Tuple[int, int], pd.DataFrame] = {}
+        # {(年, 月): {(分组字段, 'monthly'/'daily'): 该月的 (单元, 日期) 均值}}
+        self._trend_parts: Dict[Tuple[int, int], Dict[Tuple[str, str], pd.DataFrame]] = {}
+        self._county = False
+
+    def keep_daily(self, out_granularity: str) -> bool:
+        # 网格粒度不保留每日表，避免占用大量内存
+        return self.write_trends and out_granularity != 'grid'
+
+    def export_month(self, year: int, month: int, month_df: pd.DataFrame,
+                     daily_parts: Optional[List[pd.DataFrame]] = None) -> None:
+        save_month_aggregate(month_df, year, month, self.aggregated_dir)
+        if self.write_heatmaps:
+            if self._centroids is None:
+                self._centroids = load_city_centroids(CITY_CENTROIDS_JSON, admin_geojson=self.admin_geojson)
+            write_monthly_heatmap(month_df, f"{year}{month:02d}", self._centroids, out_base=self.heatmap_dir)
+
+        key = (year, month)
+        part = echarts_part(month_df)
+        if part is None:
+            self._echarts_frames[key] = month_df
+        else:
+            self._echarts_parts[key] = part
+        if not self.write_trends:
+            return
+        if 'county' in month_df.columns:
+            self._county = True
+        elif 'province' in month_df.columns:
+            monthly = month_df.copy()
+            monthly['__period'] = pd.to_datetime(monthly['time']).dt.strftime('%Y-%m')
+            monthly = monthly.drop(columns=['time'])
+            trends = {('province', 'monthly'): trend_means(monthly, 'province', 'monthly')}
+            # 省级粒度的结果没有 city 列，只写省级趋势（日趋势也按省）
+            level = 'city' if 'city' in month_df.columns else 'province'
+            if level == 'city':
+                trends[('city', 'monthly')] = trend_means(monthly, 'city', 'monthly')
+            if daily_parts:
+                trends[(level, 'daily')] = trend_means(pd.concat(daily_parts, ignore_index=True), level, 'daily')
+            self._trend_parts[key] = trends
+
+    def export_final(self) -> str:
+        if not self._echarts_parts and not self._echarts_frames:
+            raise RuntimeError("未找到可用于生成可视化的数据")
+        if self._echarts_parts:
+            parts = [self._echarts_parts[k] for k in sorted(self._echarts_parts)]
+            print(f"Exporting in-memory monthly parts to ECharts JSON in {self.output_dir} (months={len(parts)})")
+            write_echarts_parts(parts, output_dir=self.output_dir, compact=self.compact, sharded=self.sharded)
+        else:
+            combined = pd.concat([self._echarts_frames[k] for k in sorted(self._echarts_frames)], ignore_index=True)
+            print(f"Exporting in-memory monthly frames to ECharts JSON in {self.output_dir} (rows={len(combined)})")
+            convert_to_echarts_format(combined, output_dir=self.output_dir, compact=self.compact,
+                                      sharded=self.sharded)
+
+        if self._county:
+            # 区县均值再平均不等于市/省均值，同名区县也很常见；区县粒度不写按名称分组的趋势 CSV
+            print("county granularity: skipping trend CSVs (run with city/province for trends)")
+        months = sorted(self._trend_parts)
+        for field, kind in dict.fromkeys(t for k in months for t in self._trend_parts[k]):
+            merged = merge_trend_means([self._trend_parts[k].get((field, kind)) for k in months], field)
+            if merged is not None:
+                write_trend_means(merged, os.path.join(self.trends_dir, field), field, kind,
+                                  levels=None if kind == 'daily' else ())
+        return self.output_dir
+
+
+def accepts_day(granularity: str, out_granularity: str, day_basename: str) -> bool:
+    """日结果是否属于要累加的粒度。
+
+    行政区映射失败的一天会回退为 grid 表，列与其他天不同；混进同一个 MonthlyAccumulator 会让整月 KeyError，
+    因此跳过并提示（可单独重跑该天）。
+    """
+    if out_granularity == granularity:
+        return True
+    print(f"skipping {day_basename}: got {out_granularity} result (admin mapping fell back), expected {granularity}")
+    return False
+
+
+def daily_trend_part(day_basename: str, day_df: pd.DataFrame) -> pd.DataFrame:
+    part = day_df.copy()
+    part['time'] = _day_to_iso(day_basename)
+    return part
+
+
+def run_in_memory(year: int,
+                  base_path: Optional[str] = None,
+                  granularity: str = 'city',
+                  admin_geojson: Optional[str] = None,
+                  workers: int = 4,
+                  aggregate_mean: bool = DEFAULT_AGGREGATE_MEAN,
+                  max_inflight: Optional[int] = None,
+                  persist_days: bool = False,
+                  aggregated_dir: Optional[str] = None,
+                  output_dir: Optional[str] = None,
+                  trends_dir: Optional[str] = None,
+                  heatmap_dir: Optional[str] = None,
+                  write_trends: bool = True,
+                  write_heatmaps: bool = True,
+                  readahead: Optional[int] = None,
+                  readahead_bytes: Optional[int] = None,
+                  compact: Optional[bool] = None,
+                  sharded: Optional[bool] = None,
+                  member_executor: Optional[str] = None) -> str:
+    """处理一年的 ZIP 并直接生成月度聚合、ECharts、趋势与热图输出，返回 ECharts 输出目录。
+
+    日结果在主线程中累加到 MonthlyAccumulator；仅在 persist_days=True 时写出日文件。
+    行政区粒度下额外保留每日的小表用于日趋势（网格粒度不保留，避免占用大量内存）。
+    """
+    base_path = base_path or os.path.join(BASE_PATH, str(year))
+    exporters = PipelineExporters(aggregated_dir=aggregated_dir, output_dir=output_dir, trends_dir=trends_dir,
+                                  heatmap_dir=heatmap_dir, write_trends=write_trends, write_heatmaps=write_heatmaps,
+                                  compact=compact, sharded=sharded, admin_geojson=admin_geojson)
+
+    acc = MonthlyAccumulator()
+    daily_parts: Dict[Tuple[int, int], List[pd.DataFrame]] = {}
+
+    def _on_day(day_basename, out_granularity, day_df):
+        if not accepts_day(granularity, out_granularity, day_basename):
+            return
+        acc.add(day_basename, day_df)
+        if exporters.keep_daily(out_granularity):
+            daily_parts.setdefault(month_of_day(day_basename), []).append(daily_trend_part(day_basename, day_df))
+
+    saved, failed = process_zips_parallel(base_path, year, granularity=granularity, admin_geojson=admin_geojson,
+                                          workers=workers, aggregate_mean=aggregate_mean, max_inflight=max_inflight,
+                                          persist=persist_days, on_day=_on_day,
+                                          readahead=readahead, readahead_bytes=readahead_bytes,
+                                          member_executor=member_executor)
+    print(f"in-memory extract done: days={len(saved)} failed={len(failed)}")
+
+    for (y, m) in acc.months():
+        exporters.export_month(y, m, acc.finalize(y, m), daily_parts.pop((y, m), None))
+    return exporters.export_final()
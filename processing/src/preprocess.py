@@ -1,19 +1,18 @@
 import os
 import sys
 import shutil
-from typing import Optional, List, Tuple, Dict
-import xarray as xr, io
-import zipfile
+from typing import Optional, List, Tuple, Dict, Callable, Sequence, Union
 import numpy as np
 import pandas as pd
 import re
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 import threading
-from .util.io_utils import record_tmp_dir, read_nc_bytes, read_nc_from_zip
+from .util.io_utils import record_tmp_dir, read_nc_from_zip, open_member_dataset, ZipMemberReader, ZipPrefetcher
+from .util.backend_calibration import ensure_calibrated
+from .util import h5_reader
 from .remove_outliers import remove_physical_bounds, remove_iqr_outliers
 from . import config as _config
 from .config import PROCESSED_DIR, DEFER_CLEANUP, VAR_BOUNDS, IQR_K, IQR_GROUPBY
-from .util.geo_utils import map_points_to_admin, canonicalize_admin_mapping
 
 # 默认聚合方式
 DEFAULT_AGGREGATE_MEAN = getattr(_config, 'DEFAULT_AGGREGATE_MEAN', True)
@@ -40,6 +39,12 @@ def _save_df_by_year_granularity(df: pd.DataFrame, day_basename: str, granularit
     else:
         out_dir = os.path.join(PROCESSED_DIR, str(granularity), str(year), f"{month:02d}", f"{day:02d}")
     os.makedirs(out_dir, exist_ok=True)
+    # GRID_STORE=compact（环境变量优先于 config）：grid 粒度写紧凑 npz，坐标按网格只存一次
+    if granularity == 'grid' and (os.environ.get('GRID_STORE') or _config.GRID_STORE) == 'compact':
+        from .util.grid_store import save_grid_day
+        return save_grid_day(df, os.path.join(out_dir, f"{day_basename}.npz"),
+                             dtype=os.environ.get('GRID_STORE_DTYPE') or _config.GRID_STORE_DTYPE,
+                             processed_root=PROCESSED_DIR)
     parquet_path = os.path.join(out_dir, f"{day_basename}.parquet")
     try:
         if os.environ.get('PREPROCESS_DEBUG', '') == '1':
@@ -83,8 +88,8 @@ def temporal_aggregation(items: List[dict], aggregation: str = 'daily', aggregat
         lon = first.get('lon')
         if lat is None or lon is None:
             raise ValueError('items must include lat and lon')
-        lat_arr = np.array(lat)
-        lon_arr = np.array(lon)
+        lat_arr = np.asarray(lat)
+        lon_arr = np.asarray(lon)
         if lat_arr.ndim == 1 and lon_arr.ndim == 1:
             Lon, Lat = np.meshgrid(lon_arr, lat_arr)
         else:
@@ -102,7 +107,7 @@ def temporal_aggregation(items: List[dict], aggregation: str = 'daily', aggregat
             for it in items:
                 val = it.get(v)
                 try:
-                    arr = np.array(val)
+                    arr = np.asarray(val)
                     if arr.size == N:
                         stacks.append(arr.ravel())
                     elif arr.size == 1:
@@ -113,10 +118,12 @@ def temporal_aggregation(items: List[dict], aggregation: str = 'daily', aggregat
                     stacks.append(np.repeat(np.nan, N))
             if stacks:
                 stacked = np.vstack(stacks)
-                mean_vals = np.nanmean(stacked, axis=0)
+                # float64 累加，结果按 VALUE_DTYPE 存放
+                with np.errstate(invalid='ignore'):
+                    mean_vals = np.nanmean(stacked, axis=0, dtype=np.float64)
             else:
                 mean_vals = np.repeat(np.nan, N)
-            out[v] = mean_vals
+            out[v] = mean_vals.astype(_config.VALUE_DTYPE)
         df = pd.DataFrame(out)
         return df
 
@@ -128,8 +135,8 @@ def temporal_aggregation(items: List[dict], aggregation: str = 'daily', aggregat
         time = it.get('time')
         if lat is None or lon is None:
             continue
-        lat_arr = np.array(lat)
-        lon_arr = np.array(lon)
+        lat_arr = np.asarray(lat)
+        lon_arr = np.asarray(lon)
         if lat_arr.ndim == 1 and lon_arr.ndim == 1:
             Lon, Lat = np.meshgrid(lon_arr, lat_arr)
         else:
@@ -142,7 +149,7 @@ def temporal_aggregation(items: List[dict], aggregation: str = 'daily', aggregat
         arrays = {}
         for v in var_names:
             try:
-                a = np.array(it.get(v))
+                a = np.asarray(it.get(v))
                 if a.size == N:
                     arrays[v] = a.ravel()
                 elif a.size == 1:
@@ -163,126 +170,430 @@ def temporal_aggregation(items: List[dict], aggregation: str = 'daily', aggregat
         pass
     return df
 
-# 处理单个 zip 文件
-def process_single_zip(zip_path: str,
-                       granularity: str = 'grid',
-                       admin_geojson: Optional[str] = None,
-                       amap_key: Optional[str] = None,
-                       aggregate_mean: bool = DEFAULT_AGGREGATE_MEAN) -> str:
-    """处理单个 zip 文件（包含一天的每小时 .nc 文件）并保存结果。
+_MEMBER_VARS = ['pm25', 'pm10', 'so2', 'no2', 'co', 'o3', 'temp', 'rh', 'psfc', 'u', 'v']
 
-    使用 io_utils 中的 read_nc_from_zip 避免手动提取。
-    返回保存的文件路径（parquet 或 csv）。
+
+def _item_from_dataset(ds, day_basename: str) -> dict:
+    # 从 ds 构建 item（字段与之前一致）
+    item = {}
+    for var in _MEMBER_VARS:
+        if var in ds.variables:
+            try:
+                item[var] = ds[var].values
+            except Exception:
+                item[var] = None
+    if 'lat2d' in ds.variables:
+        item['lat'] = ds['lat2d'].values
+    elif 'lat' in ds.variables:
+        item['lat'] = ds['lat'].values
+    if 'lon2d' in ds.variables:
+        item['lon'] = ds['lon2d'].values
+    elif 'lon' in ds.variables:
+        item['lon'] = ds['lon'].values
+    # 时间字段：继续使用 day_basename
+    item['time'] = day_basename
+    return item
+
+
+class DayMeanAccumulator:
+    """逐小时成员的部分和（float64 sum 与有效值计数），可在线程/进程间合并。
+
+    to_frame() 的结果与 temporal_aggregation(items, aggregate_mean=True) 一致：
+    每个格点取各小时的 nanmean，变量列按名称排序，数值列为 config.VALUE_DTYPE。
+    """
+
+    def __init__(self):
+        self.lat = None
+        self.lon = None
+        self.sums: Dict[str, np.ndarray] = {}
+        self.counts: Dict[str, np.ndarray] = {}
+
+    @classmethod
+    def from_item(cls, item: dict) -> 'DayMeanAccumulator':
+        acc = cls()
+        acc.add(item)
+        return acc
+
+    def _ensure_grid(self, item: dict) -> Optional[int]:
+        if self.lat is None:
+            lat = item.get('lat')
+            lon = item.get('lon')
+            if lat is None or lon is None:
+                raise ValueError('items must include lat and lon')
+            lat_arr = np.asarray(lat)
+            lon_arr = np.asarray(lon)
+            if lat_arr.ndim == 1 and lon_arr.ndim == 1:
+                lon_arr, lat_arr = np.meshgrid(lon_arr, lat_arr)
+            # 复制为 float64：快速读取路径可能复用 lat/lon 缓冲区
+            self.lat = lat_arr.ravel().astype(float)
+            self.lon = lon_arr.ravel().astype(float)
+        return self.lat.size
+
+    def add(self, item: dict) -> None:
+        n = self._ensure_grid(item)
+        for v, val in item.items():
+            if v in ('lat', 'lon', 'time', 'geometry'):
+                continue
+            if v not in self.sums:
+                self.sums[v] = np.zeros(n, dtype=np.float64)
+                # 一天最多几十个小时成员，uint16 计数足够
+                self.counts[v] = np.zeros(n, dtype=np.uint16)
+            try:
+                arr = np.asarray(val)
+                if arr.size == n:
+                    arr = arr.reshape(-1)
+                elif arr.size == 1:
+                    arr = np.full(n, arr.item())
+                else:
+                    continue
+                if arr.dtype.kind not in 'fiu':
+                    arr = arr.astype(np.float64)
+            except Exception:
+                continue
+            valid = ~np.isnan(arr) if arr.dtype.kind == 'f' else np.ones(n, dtype=bool)
+            np.add(self.sums[v], arr, out=self.sums[v], where=valid)
+            self.counts[v] += valid
+
+    def merge(self, other: 'DayMeanAccumulator') -> None:
+        if other is None or other.lat is None:
+            return
+        if self.lat is None:
+            self.lat, self.lon = other.lat, other.lon
+        for v, s in other.sums.items():
+            if v in self.sums:
+                self.sums[v] += s
+                self.counts[v] += other.counts[v]
+            else:
+                self.sums[v] = s.copy()
+                self.counts[v] = other.counts[v].copy()
+
+    def to_frame(self, release: bool = False) -> pd.DataFrame:
+        """输出每个格点的均值表。
+
+        release=True 时就地把 sum 除成均值并逐列释放累加器（调用方之后不能再 add/merge），
+        峰值只比结果表多一列 float64；列数组直接交给 DataFrame，不再整体合并复制。
+        """
+        if self.lat is None:
+            return pd.DataFrame()
+        out = {'lat': self.lat, 'lon': self.lon}
+        for v in sorted(self.sums):
+            counts = self.counts[v]
+            sums = self.sums.pop(v) if release else self.sums[v].copy()
+            empty = counts == 0
+            with np.errstate(invalid='ignore', divide='ignore'):
+                np.divide(sums, counts, out=sums, where=~empty)
+            sums[empty] = np.nan
+            out[v] = sums.astype(_config.VALUE_DTYPE)
+            del sums
+            if release:
+                del self.counts[v]
+        if release:
+            self.lat = self.lon = None
+        return pd.DataFrame(out, copy=False)
+
+
+_h5_local = threading.local()
+
+
+def _fast_member_item(member, day_basename: str, reuse: bool) -> Optional[dict]:
+    """h5py 快速路径；布局不符或 h5py 不可用时返回 None，由调用方回退到 xarray。"""
+    if not _config.H5_FAST_PATH or not h5_reader.available():
+        return None
+    fast = getattr(_h5_local, 'reader', None)
+    if fast is None:
+        fast = _h5_local.reader = h5_reader.H5MemberReader(_MEMBER_VARS)
+    try:
+        item = fast.read(member, reuse=reuse)
+    except Exception:
+        return None
+    item['time'] = day_basename
+    return item
+
+
+def _read_member_item(reader: 'ZipMemberReader', zip_path: str, nc_name: str, day_basename: str,
+                      tmp_dirs: List[str], reuse_buffers: bool = False) -> Optional[dict]:
+    """解码单个小时成员为 item；失败时返回 None。
+
+    reuse_buffers=True 表示调用方会在同一线程读取下一个成员之前消费完 item（如立即归约），
+    此时快速路径复用线程内的预分配缓冲区。
+    """
+    ds = None
+    member = None
+    try:
+        # 尝试在内存中打开：STORED 成员是归档 mmap 上的零拷贝视图，压缩成员解压到内存
+        # （reuse_buffers 时解压到线程内复用的缓冲区）
+        try:
+            member = reader.open_member(nc_name, reuse=reuse_buffers)
+        except Exception:
+            member = None
+
+        if member is not None:
+            item = _fast_member_item(member, day_basename, reuse_buffers)
+            if item is not None:
+                return item
+            # 按 engine_order('memory')（校准结果优先）依次尝试
+            try:
+                ds = open_member_dataset(member)
+            except Exception:
+                ds = None
+        else:
+            # 回退：尝试使用 io_utils 提供的 helper（可能会解压到临时目录）
+            try:
+                ds, t = read_nc_from_zip(zip_path)
+                if t:
+                    tmp_dirs.append(t)
+                # when using this fallback the helper may return the first file; accept it
+            except Exception:
+                ds = None
+
+        if ds is None:
+            return None
+        return _item_from_dataset(ds, day_basename)
+    finally:
+        try:
+            if ds is not None:
+                ds.close()
+        except Exception:
+            pass
+        try:
+            if member is not None:
+                member.close()
+        except Exception:
+            pass
+
+
+def _decode_member_in_process(args: Tuple) -> Tuple[object, List[str]]:
+    # 进程池入口：子进程自行打开归档（mmap），只把 item 传回
+    zip_path, nc_name, day_basename = args
+    tmp_dirs = []
+    with ZipMemberReader(zip_path) as reader:
+        item = _read_member_item(reader, zip_path, nc_name, day_basename, tmp_dirs)
+    return item, tmp_dirs
+
+
+def _decode_members(reader: 'ZipMemberReader', zip_path: str, nc_names: List[str], day_basename: str,
+                    tmp_dirs: List[str], member_workers: int = 1, member_executor: str = 'thread'):
+    """按成员顺序产出每个小时的 item（非均值路径使用）。"""
+    def _one(nc_name):
+        return _read_member_item(reader, zip_path, nc_name, day_basename, tmp_dirs)
+
+    workers = max(1, min(int(member_workers or 1), len(nc_names)))
+    if workers == 1:
+        for nc_name in nc_names:
+            yield _one(nc_name)
+        return
+    if member_executor == 'process':
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            for result, dirs in ex.map(_decode_member_in_process, [(zip_path, n, day_basename) for n in nc_names]):
+                tmp_dirs.extend(dirs)
+                yield result
+        return
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        for result in ex.map(_one, nc_names):
+            yield result
+
+
+def _reduce_serial(reader: 'ZipMemberReader', zip_path: str, nc_names: List[str], day_basename: str,
+                   tmp_dirs: List[str], acc: Optional[DayMeanAccumulator] = None) -> DayMeanAccumulator:
+    # 解码一个成员就立即加进累加器并丢弃 item；快速路径复用线程内的缓冲区
+    acc = acc if acc is not None else DayMeanAccumulator()
+    for nc_name in nc_names:
+        item = _read_member_item(reader, zip_path, nc_name, day_basename, tmp_dirs, reuse_buffers=True)
+        if item is not None:
+            acc.add(item)
+        item = None
+    return acc
+
+
+def _reduce_members_in_process(args: Tuple) -> Tuple[DayMeanAccumulator, List[str]]:
+    # 进程池入口：子进程归约一段连续的成员，只把一个累加器传回
+    zip_path, nc_names, day_basename = args
+    tmp_dirs = []
+    with ZipMemberReader(zip_path) as reader:
+        acc = _reduce_serial(reader, zip_path, nc_names, day_basename, tmp_dirs)
+    return acc, tmp_dirs
+
+
+def _reduce_members(reader: 'ZipMemberReader', zip_path: str, nc_names: List[str], day_basename: str,
+                    tmp_dirs: List[str], member_workers: int = 1, member_executor: str = 'thread') -> DayMeanAccumulator:
+    """把一天的全部成员归约为一个 DayMeanAccumulator。
+
+    每个工作线程/进程只持有一个累加器（而不是每个成员一个部分和），
+    所以额外内存随 member_workers 而不是成员数增长；单线程时直接累加到结果上。
+    """
+    workers = max(1, min(int(member_workers or 1), len(nc_names)))
+    if workers == 1:
+        return _reduce_serial(reader, zip_path, nc_names, day_basename, tmp_dirs)
+
+    if member_executor == 'process':
+        step = -(-len(nc_names) // workers)
+        chunks = [nc_names[i:i + step] for i in range(0, len(nc_names), step)]
+        partials = []
+        with ProcessPoolExecutor(max_workers=len(chunks)) as ex:
+            for acc, dirs in ex.map(_reduce_members_in_process, [(zip_path, c, day_basename) for c in chunks]):
+                tmp_dirs.extend(dirs)
+                partials.append(acc)
+    else:
+        pending = iter(nc_names)
+        lock = threading.Lock()
+
+        def _next_name():
+            with lock:
+                return next(pending, None)
+
+        def _worker():
+            acc = DayMeanAccumulator()
+            while True:
+                nc_name = _next_name()
+                if nc_name is None:
+                    return acc
+                _reduce_serial(reader, zip_path, [nc_name], day_basename, tmp_dirs, acc)
+
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            partials = list(ex.map(lambda _: _worker(), range(workers)))
+
+    total = partials[0]
+    for i in range(1, len(partials)):
+        total.merge(partials[i])
+        partials[i] = None
+    return total
+
+
+def auto_member_workers(day_workers: int, n_days: int) -> int:
+    """为一天内的成员解码分配线程数：天数少于 day_workers 时把空闲核分给单日内部并行。"""
+    if _config.INTRA_DAY_WORKERS:
+        return int(_config.INTRA_DAY_WORKERS)
+    cpus = os.cpu_count() or 1
+    active_days = max(1, min(int(day_workers or 1), int(n_days or 1)))
+    return max(1, min(_config.INTRA_DAY_MAX_WORKERS, cpus // active_days))
+
+
+def auto_member_executor(n_days: int, member_workers: int, member_executor: Optional[str] = None,
+                         day_executor: str = 'thread') -> str:
+    """单日内部并行用 'thread' 还是 'process'（member_executor 默认 config.INTRA_DAY_EXECUTOR）。
+
+    'auto'：排队天数不超过 INTRA_DAY_PROCESS_MAX_DAYS 时用进程池绕开 h5py 的全局锁；天数多时日级并行已能
+    占满核，线程即可。各天本身已在进程池中处理（day_executor='process'）时不再嵌套进程池。
     """
+    member_executor = member_executor or _config.INTRA_DAY_EXECUTOR
+    if member_executor not in ('auto', 'thread', 'process'):
+        raise ValueError(f"member_executor 必须是 'auto'、'thread' 或 'process'，得到 {member_executor!r}")
+    if int(member_workers or 1) <= 1:
+        return 'thread'
+    if member_executor == 'auto':
+        few_days = int(n_days or 0) <= _config.INTRA_DAY_PROCESS_MAX_DAYS
+        return 'process' if few_days and day_executor != 'process' else 'thread'
+    return member_executor
+
+
+def day_basename_from_zip(zip_path: str) -> str:
+    """从 CN-ReanalysisYYYYMMDD.zip 文件名推断 'YYYYMMDD'。"""
     basename = os.path.basename(zip_path)
-    # try to infer date from filename CN-ReanalysisYYYYMMDD.zip
-    day_basename = None
     try:
         part = basename.replace('CN-Reanalysis', '').replace('.zip', '')
-        day_basename = part[0:8]
+        return part[0:8]
     except Exception:
-        day_basename = basename.replace('.zip', '')
+        return basename.replace('.zip', '')
+
+
+# 处理单个 zip 文件（只在内存中构建结果，不落盘）
+ADMIN_GRANULARITIES = ('county', 'city', 'province')
+
+
+def _aggregate_with_admin_index(day_df: pd.DataFrame, admin_levels: Sequence[str], admin_geojson: str,
+                                numeric_cols: Sequence[str], value_dtype, debug: bool = False) -> Dict[str, pd.DataFrame]:
+    """用缓存的格点行政区单元（中心点归属或面积重叠权重，见 config.ADMIN_WEIGHTING）
+    把一天的格点均值聚合到 admin_levels 中的各层级。"""
+    from .util.admin_weights import get_admin_units
+
+    county_geojson = _config.COUNTY_GEOJSON if 'county' in admin_levels else None
+    index = get_admin_units(day_df['lat'].to_numpy(), day_df['lon'].to_numpy(), admin_geojson,
+                            county_geojson=county_geojson, debug=debug)
+    frames = {}
+    for level in admin_levels:
+        if level == 'county' and not index.has_county:
+            print(f"[warn] county granularity needs GADM level 3 boundaries ({_config.COUNTY_GEOJSON}); skipped")
+            continue
+        frames[level] = index.aggregate(day_df, level, numeric_cols, value_dtype)
+    return frames
+
+
+def _normalize_granularities(granularities: Union[str, Sequence[str]]) -> List[str]:
+    # 'grid' / ['city', 'province'] / 'city,province' 都接受，去重并保持顺序
+    if isinstance(granularities, str):
+        granularities = granularities.split(',')
+    out = [str(g).strip() for g in granularities if str(g).strip()]
+    return list(dict.fromkeys(out)) or ['grid']
+
+
+def build_day_frames(zip_path: str,
+                     granularities: Union[str, Sequence[str]] = ('grid',),
+                     admin_geojson: Optional[str] = None,
+                     amap_key: Optional[str] = None,
+                     aggregate_mean: bool = DEFAULT_AGGREGATE_MEAN,
+                     zip_bytes=None,
+                     member_workers: Optional[int] = None,
+                     member_executor: str = 'thread') -> Tuple[str, Dict[str, pd.DataFrame]]:
+    """处理单个 zip 文件（包含一天的每小时 .nc 文件），一次解码与清洗后输出多个粒度的日结果。
+
+    使用 io_utils 中的 read_nc_from_zip 避免手动提取。
+    zip_bytes 为预读好的压缩包字节（见 ZipPrefetcher）；提供时不再从磁盘读取 zip_path。
+    member_workers>1 时一天内的各小时成员并发解压/解码并归约为部分和后合并
+    （member_executor='process' 时使用进程池，绕开 HDF5 的全局锁）。
+    city 与 province 共用一次空间映射：province 由 province+city 分组的 sum/count 汇总得到。
+    返回 (day_basename, {实际粒度: DataFrame})；行政区映射失败时以 'grid' 代替行政区粒度。
+    """
+    granularities = _normalize_granularities(granularities)
+    admin_levels = [g for g in granularities if g in ADMIN_GRANULARITIES]
+    frames: Dict[str, pd.DataFrame] = {}
+    day_basename = day_basename_from_zip(zip_path)
 
     print(f"[task] start {zip_path}")
     sys.stdout.flush()
 
     # 读取 zip 中所有的 .nc 文件并构建每小时的 items 列表（行为与 run_single_day_quick 保持一致）
+    # aggregate_mean 时每个成员解码后立即归约进累加器（sum/count），不保留逐小时数组
     items = []
+    day_sums = DayMeanAccumulator() if aggregate_mean else None
     tmp_dirs = []
     tmp_dir = None
+    reader = None
+    if member_workers is None:
+        member_workers = _config.INTRA_DAY_WORKERS or 1
     try:
-    # 列出 zip 中的 .nc 成员名
+    # 列出 zip 中的 .nc 成员名；同一个 ZipMemberReader 在整天的成员间复用
         try:
-            with zipfile.ZipFile(zip_path, 'r') as zf:
-                nc_names = sorted([n for n in zf.namelist() if n.lower().endswith('.nc')])
+            reader = ZipMemberReader(zip_path, zip_bytes)
+            nc_names = sorted([n for n in reader.namelist() if n.lower().endswith('.nc')])
         except Exception:
             nc_names = []
 
-        if nc_names:
-            for nc_name in nc_names:
-                ds = None
-                try:
-                    # 尝试从 zip 读取字节并在内存中打开
-                    raw = None
-                    try:
-                        raw = read_nc_bytes(zip_path, nc_name)
-                    except Exception:
-                        raw = None
-
-                    if raw is not None:
-                        try:
-                            ds = xr.open_dataset(io.BytesIO(raw), engine='h5netcdf')
-                        except Exception:
-                            try:
-                                ds = xr.open_dataset(io.BytesIO(raw))
-                            except Exception:
-                                ds = None
-                    else:
-                        # 回退：尝试使用 io_utils 提供的 helper（可能会解压到临时目录）
-                        try:
-                            ds, t = read_nc_from_zip(zip_path)
-                            if t:
-                                tmp_dirs.append(t)
-                            # when using this fallback the helper may return the first file; accept it
-                        except Exception:
-                            ds = None
-
-                    if ds is None:
-                        continue
-
-                    # 从 ds 构建 item（字段与之前一致）
-                    item = {}
-                    for var in ['pm25', 'pm10', 'so2', 'no2', 'co', 'o3', 'temp', 'rh', 'psfc', 'u', 'v']:
-                        if var in ds.variables:
-                            try:
-                                item[var] = ds[var].values
-                            except Exception:
-                                item[var] = None
-                    if 'lat2d' in ds.variables:
-                        item['lat'] = ds['lat2d'].values
-                    elif 'lat' in ds.variables:
-                        item['lat'] = ds['lat'].values
-                    if 'lon2d' in ds.variables:
-                        item['lon'] = ds['lon2d'].values
-                    elif 'lon' in ds.variables:
-                        item['lon'] = ds['lon'].values
-                    # 时间字段：继续使用 day_basename
-                    item['time'] = day_basename
-
-                    items.append(item)
-                finally:
-                    try:
-                        if ds is not None:
-                            ds.close()
-                    except Exception:
-                        pass
+        if nc_names and day_sums is not None:
+            day_sums = _reduce_members(reader, zip_path, nc_names, day_basename, tmp_dirs,
+                                       member_workers=member_workers, member_executor=member_executor)
+        elif nc_names:
+            for result in _decode_members(reader, zip_path, nc_names, day_basename, tmp_dirs,
+                                          member_workers=member_workers, member_executor=member_executor):
+                if result is not None:
+                    items.append(result)
         else:
             # 回退到以前的行为：通过 helper 打开第一个 .nc
             try:
                 ds, tmp_dir = read_nc_from_zip(zip_path)
                 # build single-item list so temporal_aggregation still works
-                item = {}
-                for var in ['pm25', 'pm10', 'so2', 'no2', 'co', 'o3', 'temp', 'rh', 'psfc', 'u', 'v']:
-                    if var in ds.variables:
-                        try:
-                            item[var] = ds[var].values
-                        except Exception:
-                            item[var] = None
-                if 'lat2d' in ds.variables:
-                    item['lat'] = ds['lat2d'].values
-                elif 'lat' in ds.variables:
-                    item['lat'] = ds['lat'].values
-                if 'lon2d' in ds.variables:
-                    item['lon'] = ds['lon2d'].values
-                elif 'lon' in ds.variables:
-                    item['lon'] = ds['lon'].values
-                item['time'] = day_basename
-                items.append(item)
+                item = _item_from_dataset(ds, day_basename)
+                if day_sums is not None:
+                    day_sums.add(item)
+                else:
+                    items.append(item)
             except Exception:
                 # no usable files found
                 items = []
     except Exception:
         items = []
+    finally:
+        if reader is not None:
+            reader.close()
     # 可选的调试打印，通过 PREPROCESS_DEBUG 控制
     _debug = os.environ.get('PREPROCESS_DEBUG', '') == '1'
     if _debug:
@@ -293,7 +604,11 @@ def process_single_zip(zip_path: str,
             pass
 
     # 使用 temporal_aggregation 创建 day_df；当使用 aggregate_mean 可避免数据膨胀
-    day_df = temporal_aggregation(items, aggregation='daily', aggregate_mean=aggregate_mean)
+    if day_sums is not None:
+        day_df = day_sums.to_frame(release=True)
+        day_sums = None
+    else:
+        day_df = temporal_aggregation(items, aggregation='daily', aggregate_mean=aggregate_mean)
 
     if _debug:
         try:
@@ -304,16 +619,18 @@ def process_single_zip(zip_path: str,
 
     # 确保期望的数值列存在
     expected_vars = ['pm25', 'pm10', 'so2', 'no2', 'co', 'o3', 'temp', 'rh', 'psfc', 'u', 'v']
+    value_dtype = np.dtype(_config.VALUE_DTYPE)
     for v in expected_vars:
         if v not in day_df.columns:
-            day_df[v] = pd.NA
-        else:
-            day_df[v] = pd.to_numeric(day_df[v], errors='coerce')
+            day_df[v] = np.full(len(day_df), np.nan, dtype=value_dtype)
+        elif day_df[v].dtype != value_dtype:
+            day_df[v] = pd.to_numeric(day_df[v], errors='coerce').astype(value_dtype)
 
     # 在可用时应用物理范围过滤
     if VAR_BOUNDS:
         try:
-            day_df = remove_physical_bounds(day_df, VAR_BOUNDS, inplace=False)
+            # day_df 由本函数独占（刚从累加器生成），直接就地置 NaN
+            day_df = remove_physical_bounds(day_df, VAR_BOUNDS, inplace=True)
         except Exception:
             pass
 
@@ -338,27 +655,14 @@ def process_single_zip(zip_path: str,
 
             # 允许通过环境变量跳过 IQR（以加速运行）
             if os.environ.get('PREPROCESS_SKIP_IQR', '') == '1':
+                # 跳过 IQR。此前这里会在整表副本上做全局 0.5%/99.5% 分位裁剪，但裁剪结果从未写回 day_df，
+                # 输出与不裁剪完全相同；为保持输出不变，不再复制整表做这次无效计算。
                 if os.environ.get('PREPROCESS_DEBUG', '') == '1':
-                    print("[iqr-debug] PREPROCESS_SKIP_IQR=1 set; using global percentile clip instead of group IQR")
+                    print("[iqr-debug] PREPROCESS_SKIP_IQR=1 set; skipping group IQR")
                     sys.stdout.flush()
-                # Perform global percentile clipping per column to emulate run_single_day_quick behaviour
-                cleaned_df = day_df.copy()
-                try:
-                    clip_low = 0.005
-                    clip_high = 0.995
-                    for col in numeric_cols:
-                        try:
-                            ser = pd.to_numeric(cleaned_df[col], errors='coerce')
-                            low = ser.quantile(clip_low)
-                            high = ser.quantile(clip_high)
-                            cleaned_df[col] = ser.clip(lower=low, upper=high)
-                        except Exception:
-                            pass
-                except Exception:
-                    pass
             else:
-                cleaned_df, _ = remove_iqr_outliers(day_df, value_cols=numeric_cols, groupby=groupby_cols, k=IQR_K, return_mask=True)
-                day_df = cleaned_df
+                day_df, _ = remove_iqr_outliers(day_df, value_cols=numeric_cols, groupby=groupby_cols, k=IQR_K,
+                                                return_mask=True, inplace=True)
 
         if _debug:
             try:
@@ -368,235 +672,97 @@ def process_single_zip(zip_path: str,
                 pass
 
     # 将点过滤到中国并按需聚合到行政区
-    # 优化：对唯一的四舍五入坐标（lat/lon）做一次映射，然后合并回主表。
-        if granularity in ('city', 'province') and admin_geojson and os.path.exists(admin_geojson):
+    # 优先使用缓存的格点行政区层级索引（admin_index）：各层级均按编码 bincount，无需逐日空间连接
+        if admin_levels and admin_geojson and os.path.exists(admin_geojson) and _config.ADMIN_INDEX_ENABLED:
             try:
-                coords = day_df[['lat', 'lon']].dropna().copy()
-                coords['_lat_r'] = coords['lat'].round(4)
-                coords['_lon_r'] = coords['lon'].round(4)
-                coords_unique = coords[['_lat_r', '_lon_r']].drop_duplicates().reset_index(drop=True).rename(columns={'_lat_r': 'lat', '_lon_r': 'lon'})
-
-                # 只对唯一的四舍五入坐标进行映射
-                mapped_coords = map_points_to_admin(coords_unique, admin_geojson, level=granularity)
-                # 映射相关的调试信息
+                frames.update(_aggregate_with_admin_index(day_df, admin_levels, admin_geojson, numeric_cols,
+                                                          value_dtype, debug=_debug))
+            except Exception as e:
                 if _debug:
-                    try:
-                        print('DEBUG mapped_coords.shape =', getattr(mapped_coords, 'shape', None))
-                        print('DEBUG mapped_coords.columns =', list(mapped_coords.columns))
-                        try:
-                            print('DEBUG mapped_coords sample:\n', mapped_coords.head(10).to_string(index=False))
-                        except Exception:
-                            pass
-                    except Exception:
-                        pass
+                    print(f"[task-debug] admin index failed for {zip_path}: {e}; falling back to per-day mapping")
+                    sys.stdout.flush()
+                frames = {}
 
-                # 确保存在 admin_name 列
-                if 'admin_name' not in mapped_coords.columns:
-                    candidates = [c for c in mapped_coords.columns if any(tok in c.upper() for tok in ['NL_NAME_2','NL_NAME_1','NAME_2','NAME_1','PROVINCE','CITY','NL_NAME'])]
-                    if candidates:
-                        mapped_coords = mapped_coords.rename(columns={candidates[0]: 'admin_name'})
-
-                # 若缺少 'province' 或 'city'，尝试从常见的 GADM 属性名中填充。
-                # 这是一个轻量的本地处理逻辑，用于避免当 geojson 使用不同列名时丢失行。
-                if 'province' not in mapped_coords.columns:
-                    prov_candidates = [c for c in mapped_coords.columns if any(tok in c.upper() for tok in ['NAME_1','NL_NAME_1','PROVINCE','ADM1','PRV'])]
-                    if prov_candidates:
-                        mapped_coords = mapped_coords.rename(columns={prov_candidates[0]: 'province'})
-                if 'city' not in mapped_coords.columns:
-                    city_candidates = [c for c in mapped_coords.columns if any(tok in c.upper() for tok in ['NAME_2','NL_NAME_2','CITY','ADM2','CNTY','MUN'])]
-                    if city_candidates:
-                        mapped_coords = mapped_coords.rename(columns={city_candidates[0]: 'city'})
-
-                # 仅保留必要的列：lat/lon/行政名相关列
-                keep_cols = ['lat', 'lon']
-                for c in ('admin_name', 'province', 'city'):
-                    if c in mapped_coords.columns:
-                        keep_cols.append(c)
-                mapped_coords = mapped_coords[[c for c in keep_cols if c in mapped_coords.columns]]
+    # 回退：对唯一的四舍五入坐标（lat/lon）做一次映射，然后合并回主表（不支持 county）。
+        legacy_levels = [g for g in admin_levels if g != 'county']
+        if not frames and legacy_levels and admin_geojson and os.path.exists(admin_geojson):
+            admin_levels = legacy_levels
+            try:
+                # geopandas/shapely 只在需要行政区映射时才导入（grid 粒度与纯导出命令不必付出导入开销）
+                from .util.geo_utils import resolve_admin_names
+                # 四舍五入坐标只算一次：既用于去重后映射，也作为回连格点的键
+                lat_r = day_df['lat'].round(4)
+                lon_r = day_df['lon'].round(4)
+                coords_unique = pd.DataFrame({'lat': lat_r, 'lon': lon_r}, copy=False).dropna().drop_duplicates().reset_index(drop=True)
+
+                # 只对唯一的四舍五入坐标进行映射（city 与 province 共用这一次映射），名称规范化也在唯一坐标表上完成
+                mapped = resolve_admin_names(coords_unique, admin_geojson,
+                                             level='city' if 'city' in admin_levels else admin_levels[0], debug=_debug)
                 # rename back to rounded keys for merge
-                mapped_coords = mapped_coords.rename(columns={'lat': '_lat_r', 'lon': '_lon_r'})
-
-                # 使用四舍五入坐标合并回主表
-                day_df['_lat_r'] = day_df['lat'].round(4)
-                day_df['_lon_r'] = day_df['lon'].round(4)
-                merged = day_df.merge(mapped_coords, how='left', left_on=['_lat_r', '_lon_r'], right_on=['_lat_r', '_lon_r'])
-
-                # 规范化行政映射（必要时填充英文名）
-                before_rows = len(merged)
-                merged, stats = canonicalize_admin_mapping(merged, fill_english_if_missing=True, sample_limit=50)
-                # 将占位字符串（"NA","N/A","<NA>",空串等）标准化为真实的缺失值
-                try:
-                    placeholders = set(['', 'NA', 'N/A', 'NAN', '<NA>'])
-                    for col in ('province', 'city', 'admin_name'):
-                        if col in merged.columns:
-                            # strip whitespace and convert known placeholders (case-insensitive) to pd.NA
-                            def _norm(v):
-                                try:
-                                    if v is None or (isinstance(v, float) and pd.isna(v)):
-                                        return pd.NA
-                                    if isinstance(v, str):
-                                        s = v.strip()
-                                        if s == '':
-                                            return pd.NA
-                                        if s.upper() in placeholders:
-                                            return pd.NA
-                                        return s
-                                    return v
-                                except Exception:
-                                    return pd.NA
-                            merged[col] = merged[col].apply(_norm)
-                except Exception:
-                    pass
-
-                # 调试：打印原始 english_samples 的内容/数量，帮助诊断打印分支为何在过滤后被跳过。
-                if os.environ.get('PREPROCESS_DEBUG', '') == '1':
-                    try:
-                        raw_es = stats.get('english_samples')
-                        print(f"[debug] raw english_samples count={len(raw_es) if raw_es is not None else 0}; raw={raw_es}")
-                    except Exception:
-                        pass
-
-                if stats.get('english_samples'):
-                    try:
-                        print('使用英文名作为替代:')
-                        shown = 0
-                        # filter out empty or placeholder values
-                        samples = []
-                        for pe, ce in stats.get('english_samples', []):
-                            s_pe = '' if pe is None else str(pe).strip()
-                            s_ce = '' if ce is None else str(ce).strip()
-                            if s_ce and s_ce.upper() not in ('NA', 'NAN', '<NA>'):
-                                samples.append((s_pe, s_ce))
-                            elif s_pe and s_pe.upper() not in ('NA', 'NAN', '<NA>'):
-                                samples.append((s_pe, s_ce))
-                        for pe, ce in samples:
-                            if shown >= 50:
-                                break
-                            if pe and ce:
-                                print(f'  {pe} / {ce}')
-                            elif ce:
-                                print(f'  {ce}')
-                            elif pe:
-                                print(f'  {pe}')
-                            shown += 1
-                    except Exception:
-                        pass
-
-                # 如果 canonicalize 未能填充某些名称，尝试对仍缺少 admin_name/province/city 的行
-                # 使用显式的英文列作为回退。按行从任何可用的英文类列填充；不删除行。最后将剩余的 NaN
-                # 用 'UNKNOWN' 替代，确保输出中没有 NaN（注意：此处代码保留为尽量不覆盖已有中文值）。
-                try:
-                    # Build candidate columns (broad set) but we'll prefer Chinese text when available.
-                    cand_cols = [c for c in merged.columns if re.search(r'NAME|EN\b|ENG|VARNAME|NL_NAME|CITY|PROVINCE|ADM', c, re.I)]
-
-                    def _choose_preferred(series_df, candidates):
-                        """
-                        Choose preferred string per-row from candidates:
-                        - First prefer values containing CJK/Chinese characters.
-                        - If none contain Chinese, pick the first non-empty candidate (assumed English).
-                        - If still none, return NaN (will be dropped later if desired).
-                        Returns a pandas Series aligned with series_df.index.
-                        """
-                        idx = series_df.index
-                        out = pd.Series([pd.NA] * len(idx), index=idx, dtype=object)
-                        # helper to normalize a column to string but keep NA as NA
-                        def _col_series(name):
-                            if name not in series_df.columns:
-                                return pd.Series([pd.NA] * len(idx), index=idx, dtype=object)
-                            s = series_df[name].astype(object).where(series_df[name].notna(), pd.NA)
-                            return s
-
-                        # first pass: prefer Chinese characters
-                        chinese_re = re.compile(r'[\u4e00-\u9fff]')
-                        for c in candidates:
-                            s = _col_series(c)
-                            mask = s.notna() & s.astype(str).str.strip().ne('') & s.astype(str).str.contains(chinese_re)
-                            if mask.any():
-                                # fill only where out is not set
-                                to_fill = mask & out.isna()
-                                out[to_fill] = s[to_fill]
-                        # second pass: first non-empty (english/fallback)
-                        for c in candidates:
-                            s = _col_series(c)
-                            mask = s.notna() & s.astype(str).str.strip().ne('')
-                            if mask.any():
-                                to_fill = mask & out.isna()
-                                out[to_fill] = s[to_fill]
-                        # leave remaining as pd.NA
-                        out = out.replace({pd.NA: pd.NA})
-                        return out
-
-                    # Candidate ordering: prefer NAME_1/NAME_2 style then generic city/province columns
-                    prov_cands = [c for c in cand_cols if re.search(r'NAME[_\.]?1|PROVINCE|ADM1|VARNAME[_\.]?1|NL_NAME[_\.]?1', c, re.I)] + [c for c in cand_cols if c not in []]
-                    city_cands = [c for c in cand_cols if re.search(r'NAME[_\.]?2|CITY|ADM2|VARNAME[_\.]?2|NL_NAME[_\.]?2', c, re.I)] + [c for c in cand_cols if c not in []]
-
-                    # Ensure we don't duplicate columns in candidate lists
-                    prov_cands = [c for i, c in enumerate(prov_cands) if c and prov_cands.index(c) == i]
-                    city_cands = [c for i, c in enumerate(city_cands) if c and city_cands.index(c) == i]
-
-                    # If canonical columns already present and non-empty, keep them
-                    if 'province' in merged.columns and merged['province'].notna().any():
-                        prov_series = merged['province'].astype(object).where(merged['province'].notna(), pd.NA)
-                    else:
-                        prov_series = _choose_preferred(merged, prov_cands)
-                    if 'city' in merged.columns and merged['city'].notna().any():
-                        city_series = merged['city'].astype(object).where(merged['city'].notna(), pd.NA)
-                    else:
-                        city_series = _choose_preferred(merged, city_cands)
-
-                        # admin_name：优先保留已存在的 admin_name，否则在可用时由 city/province 组合得到
-                    if 'admin_name' in merged.columns and merged['admin_name'].notna().any():
-                        admin_series = merged['admin_name'].astype(object).where(merged['admin_name'].notna(), pd.NA)
-                    else:
-                        # prefer city, then province
-                        admin_series = city_series.where(city_series.notna(), prov_series)
-
-                        # 赋值回列（不要覆盖已有的非空值）
-                    merged['province'] = merged.get('province').where(merged.get('province').notna(), prov_series)
-                    merged['city'] = merged.get('city').where(merged.get('city').notna(), city_series)
-                    merged['admin_name'] = merged.get('admin_name').where(merged.get('admin_name').notna(), admin_series)
-
-                    # Note: per your request, we leave rows with no province AND no city as NaN so they can be dropped
-                    if _debug:
-                        try:
-                            prov_count = int(merged['province'].notna().sum()) if 'province' in merged.columns else 0
-                            city_count = int(merged['city'].notna().sum()) if 'city' in merged.columns else 0
-                            admin_count = int(merged['admin_name'].notna().sum()) if 'admin_name' in merged.columns else 0
-                            print(f"[task-debug] after-fallback counts: province={prov_count} city={city_count} admin_name={admin_count}")
-                            sys.stdout.flush()
-                        except Exception:
-                            pass
-                except Exception:
-                    pass
+                mapped = mapped.rename(columns={'lat': '_lat_r', 'lon': '_lon_r'})
+
+                # 行政区键在大表上用 category 存放（每行 1~2 字节的编码，而不是对象指针）；
+                # 在唯一坐标表上转换，merge 时直接带出 category 列
+                admin_keys = [c for c in ('province', 'city', 'admin_name') if c in mapped.columns]
+                key_dtypes = {c: mapped[c].dtype for c in admin_keys}
+                if _config.CATEGORICAL_ADMIN_KEYS:
+                    for c in admin_keys:
+                        mapped[c] = mapped[c].astype('category')
+                keys = pd.DataFrame({'_lat_r': lat_r, '_lon_r': lon_r, '_row': np.arange(len(day_df))}, copy=False)
+                keys = keys.merge(mapped[['_lat_r', '_lon_r'] + admin_keys], how='left', on=['_lat_r', '_lon_r'])
+                if len(keys) == len(day_df):
+                    # 常见情况：每个坐标只落在一个行政区，左连接保持行序；浅拷贝上挂键列，
+                    # 不复制数值列，也不改动（可能同时作为 grid 输出的）day_df
+                    merged = day_df.copy(deep=False)
+                else:
+                    # 边界坐标同时落在多个行政区时左连接会复制行（与整表 merge 的语义一致），只在此时取行
+                    merged = day_df.take(keys['_row'].to_numpy()).reset_index(drop=True)
+                for c in admin_keys:
+                    merged[c] = keys[c].set_axis(merged.index)
 
                 # 强制数值列为数值类型并进行聚合
                 for v in expected_vars:
                     if v not in merged.columns:
-                        merged[v] = pd.NA
-                    merged[v] = pd.to_numeric(merged[v], errors='coerce')
+                        merged[v] = np.full(len(merged), np.nan, dtype=value_dtype)
+                    elif merged[v].dtype != value_dtype:
+                        merged[v] = pd.to_numeric(merged[v], errors='coerce').astype(value_dtype)
 
-                # 以 province+city 为键聚合数值列（优先使用中文名称）
+                # 以 province+city 为键聚合数值列（优先使用中文名称）。
+                # 先求每组各变量的有效值 sum/count（充分统计量）：city 取 sum/count；province 把同省各市的
+                # sum/count 相加后再除，等于省内全部格点的均值，无需再做一次空间连接
                 agg_numeric_cols = [c for c in numeric_cols]
                 if 'province' in merged.columns and 'city' in merged.columns:
-                    agg = merged.groupby(['province', 'city'])[agg_numeric_cols].mean().reset_index()
-                    # drop groups where both province and city are missing
-                    try:
-                        agg = agg[~(agg['province'].isna() & agg['city'].isna())].copy()
-                    except Exception:
-                        pass
+                    grouped = merged.groupby(['province', 'city'], observed=True)[agg_numeric_cols]
+                    sums = grouped.sum().astype(np.float64)
+                    counts = grouped.count()
+                    by_level = {'city': (sums, counts)}
+                    if 'province' in admin_levels:
+                        by_level['province'] = (sums.groupby(level='province', observed=True).sum(),
+                                                counts.groupby(level='province', observed=True).sum())
+                    aggs = {}
+                    for level in admin_levels:
+                        level_sums, level_counts = by_level[level]
+                        agg = (level_sums / level_counts.where(level_counts > 0)).reset_index()
+                        # drop groups where both province and city are missing
+                        try:
+                            agg = agg[~(agg['province'].isna() & agg['city'].isna())].copy() if level == 'city' \
+                                else agg[agg['province'].notna()].copy()
+                        except Exception:
+                            pass
+                        aggs[level] = agg
                 elif 'admin_name' in merged.columns:
-                    agg = merged.groupby(['admin_name'])[agg_numeric_cols].mean().reset_index()
+                    agg = merged.groupby(['admin_name'], observed=True)[agg_numeric_cols].mean().reset_index()
+                    aggs = {level: agg for level in admin_levels}
                 else:
                     agg = merged[agg_numeric_cols].mean().to_frame().T
-
-                saved = _save_df_by_year_granularity(agg, day_basename, granularity)
-                if _debug:
-                    try:
-                        print(f"[task-debug] saved aggregated admin file: {saved}")
-                        sys.stdout.flush()
-                    except Exception:
-                        pass
-                return saved
+                    aggs = {level: agg for level in admin_levels}
+                # 聚合后的小表恢复为原来的字符串键类型，数值列按 VALUE_DTYPE 输出
+                for level, agg in aggs.items():
+                    for c in admin_keys:
+                        if c in agg.columns and isinstance(agg[c].dtype, pd.CategoricalDtype):
+                            agg[c] = agg[c].astype(key_dtypes[c])
+                    agg[agg_numeric_cols] = agg[agg_numeric_cols].astype(value_dtype)
+                    frames[level] = agg
             except Exception as e:
             # 映射/聚合失败；回退为网格级别保存并记录错误
                 if _debug:
@@ -607,23 +773,18 @@ def process_single_zip(zip_path: str,
                     except Exception:
                         pass
                 # continue to fallback to grid-level save below
-                pass
+                frames = {}
 
-    # 默认：按网格级别保存（删除 time 列以保持与以前行为一致）
-        if 'time' in day_df.columns:
-            try:
-                day_df = day_df.drop(columns=['time'])
-            except Exception:
-                pass
+    # 默认：按网格级别保存（删除 time 列以保持与以前行为一致）；行政区粒度没有产出时同样回退为 grid
+        if 'grid' in granularities or not frames:
+            if 'time' in day_df.columns:
+                try:
+                    day_df = day_df.drop(columns=['time'])
+                except Exception:
+                    pass
+            frames['grid'] = day_df
 
-        saved = _save_df_by_year_granularity(day_df, day_basename, 'grid')
-        if _debug:
-            try:
-                print(f"[task-debug] saved grid file: {saved}")
-                sys.stdout.flush()
-            except Exception:
-                pass
-        return saved
+        return day_basename, frames
 
     finally:
     # 关闭任何残留的 dataset（大多数已在上文关闭）并清理临时目录
@@ -650,30 +811,104 @@ def process_single_zip(zip_path: str,
             pass
 
 
-def _worker_wrapper(args: Tuple) -> Tuple[str, bool, str]:
-    zip_path, granularity, admin_geojson, amap_key, aggregate_mean = args
+def build_day_frame(zip_path: str,
+                    granularity: str = 'grid',
+                    admin_geojson: Optional[str] = None,
+                    amap_key: Optional[str] = None,
+                    aggregate_mean: bool = DEFAULT_AGGREGATE_MEAN,
+                    zip_bytes=None,
+                    member_workers: Optional[int] = None,
+                    member_executor: str = 'thread') -> Tuple[str, str, pd.DataFrame]:
+    """单粒度版本的 build_day_frames。
+
+    返回 (day_basename, 实际粒度, DataFrame)；行政区映射失败时实际粒度回退为 'grid'。
+    """
+    day_basename, frames = build_day_frames(zip_path, [granularity], admin_geojson=admin_geojson, amap_key=amap_key,
+                                            aggregate_mean=aggregate_mean, zip_bytes=zip_bytes,
+                                            member_workers=member_workers, member_executor=member_executor)
+    out_granularity = granularity if granularity in frames else 'grid'
+    return day_basename, out_granularity, frames[out_granularity]
+
+
+def process_single_zip(zip_path: str,
+                       granularity: str = 'grid',
+                       admin_geojson: Optional[str] = None,
+                       amap_key: Optional[str] = None,
+                       aggregate_mean: bool = DEFAULT_AGGREGATE_MEAN) -> str:
+    """处理单个 zip 文件（包含一天的每小时 .nc 文件）并保存结果。
+
+    返回保存的文件路径（parquet 或 csv）。只需要内存结果时请使用 build_day_frame。
+    """
+    day_basename, out_granularity, day_df = build_day_frame(zip_path, granularity=granularity, admin_geojson=admin_geojson,
+                                                            amap_key=amap_key, aggregate_mean=aggregate_mean)
+    saved = _save_df_by_year_granularity(day_df, day_basename, out_granularity)
+    if os.environ.get('PREPROCESS_DEBUG', '') == '1':
+        try:
+            print(f"[task-debug] saved {out_granularity} file: {saved}")
+            sys.stdout.flush()
+        except Exception:
+            pass
+    return saved
+
+
+def _worker_wrapper(args: Tuple) -> Tuple[str, bool, object]:
+    # args[1] 可以是单个粒度或粒度列表；payload 为 (day_basename, {粒度: df}, {粒度: 保存路径})
+    zip_path, granularity, admin_geojson, amap_key, aggregate_mean, persist = args[:6]
+    zip_bytes = args[6] if len(args) > 6 else None
+    member_workers = args[7] if len(args) > 7 else None
+    member_executor = args[8] if len(args) > 8 else 'thread'
     try:
-        res = process_single_zip(zip_path, granularity=granularity, admin_geojson=admin_geojson, amap_key=amap_key, aggregate_mean=aggregate_mean)
-        return zip_path, True, res
+        day_basename, frames = build_day_frames(zip_path, granularity, admin_geojson=admin_geojson,
+                                                amap_key=amap_key, aggregate_mean=aggregate_mean,
+                                                zip_bytes=zip_bytes, member_workers=member_workers,
+                                                member_executor=member_executor)
+        saved = {}
+        if persist:
+            for gran, day_df in frames.items():
+                saved[gran] = _save_df_by_year_granularity(day_df, day_basename, gran)
+        return zip_path, True, (day_basename, frames, saved)
     except Exception as e:
         return zip_path, False, str(e)
 
 
-
-def process_zips_parallel(base_path: str,
-                          year: int,
-                          granularity: str = 'grid',
-                          admin_geojson: Optional[str] = None,
-                          workers: int = 4,
-                          aggregate_mean: bool = DEFAULT_AGGREGATE_MEAN) -> Tuple[List[str], List[Dict]]:
+def list_year_zips(base_path: str, year: int) -> List[str]:
+    """按日期顺序列出 base_path 下某年的 CN-Reanalysis{YYYY}{MM}{DD}.zip。"""
     zip_paths = []
-    # expect files named CN-Reanalysis{YYYY}{MM}{DD}.zip
     for month in range(1, 13):
         for day in range(1, 32):
             name = f"CN-Reanalysis{year}{month:02d}{day:02d}.zip"
             p = os.path.join(base_path, name)
             if os.path.exists(p):
                 zip_paths.append(p)
+    return zip_paths
+
+
+def process_zips_parallel(base_path: str,
+                          year: int,
+                          granularity: Union[str, Sequence[str]] = 'grid',
+                          admin_geojson: Optional[str] = None,
+                          workers: int = 4,
+                          aggregate_mean: bool = DEFAULT_AGGREGATE_MEAN,
+                          max_inflight: Optional[int] = None,
+                          persist: bool = True,
+                          on_day: Optional[Callable[[str, str, pd.DataFrame], None]] = None,
+                          readahead: Optional[int] = None,
+                          readahead_bytes: Optional[int] = None,
+                          member_executor: Optional[str] = None) -> Tuple[List[str], List[Dict]]:
+    """并行处理某年的全部日 zip。
+
+    granularity 可以是多个粒度（如 ['grid', 'city', 'province']）：每个压缩包只读取、解码与清洗一次，
+    各粒度都从同一份日数组得到，city/province 共用一次空间映射。
+    persist=False 时不写日文件，saved 中记录的是 day_basename；
+    on_day(day_basename, granularity, day_df) 在主线程中按完成顺序对每个产出的粒度各调用一次，
+    可把日结果直接送入内存累加器。
+    max_inflight 限制已提交但未完成的任务数。
+    readahead/readahead_bytes 控制 ZipPrefetcher 的预读深度与内存上限（默认取 config），
+    I/O 线程顺序预读后续压缩包，计算线程只做解码与归约；readahead=0 时由 worker 自行读盘。
+    member_executor 为单日内部成员并行的方式（见 auto_member_executor）。
+    """
+    # expect files named CN-Reanalysis{YYYY}{MM}{DD}.zip
+    zip_paths = list_year_zips(base_path, year)
 
     print(f"found {len(zip_paths)} zip(s) to process in {base_path} for year {year}")
     saved = []
@@ -681,12 +916,27 @@ def process_zips_parallel(base_path: str,
     if not zip_paths:
         return saved, failed
 
-    args_list = [(zp, granularity, admin_geojson, None, aggregate_mean) for zp in zip_paths]
+    if _config.AUTO_CALIBRATE_BACKENDS:
+        ensure_calibrated(zip_paths[0])
+    args_list = [(zp, granularity, admin_geojson, None, aggregate_mean, persist) for zp in zip_paths]
+    member_workers = auto_member_workers(workers, len(zip_paths))
+    member_executor = auto_member_executor(len(zip_paths), member_workers, member_executor)
+    if not max_inflight or max_inflight <= 0:
+        max_inflight = len(args_list)
+    readahead = _config.READAHEAD_DEPTH if readahead is None else readahead
+    readahead_bytes = _config.READAHEAD_MAX_BYTES if readahead_bytes is None else readahead_bytes
+    prefetcher = None
+    if readahead and readahead > 0:
+        prefetcher = ZipPrefetcher(zip_paths, depth=readahead, max_bytes=readahead_bytes)
+        prefetched = iter(prefetcher)
+        print(f"readahead enabled: depth={readahead} max_bytes={readahead_bytes}")
 
     with ThreadPoolExecutor(max_workers=workers) as ex:
     # 在调试模式下启动心跳线程以周期性显示进度
         _debug = os.environ.get('PREPROCESS_DEBUG', '') == '1'
         stop_event = threading.Event()
+        total = len(args_list)
+        completed_count = 0
 
         def _heartbeat():
             while not stop_event.is_set():
@@ -701,27 +951,62 @@ def process_zips_parallel(base_path: str,
         if _debug:
             hb_thread = threading.Thread(target=_heartbeat, daemon=True)
             hb_thread.start()
-        futures = {ex.submit(_worker_wrapper, args): args[0] for args in args_list}
-        total = len(futures)
-        print(f"submitted {total} jobs to thread pool (workers={workers})")
-        completed_count = 0
-    # 随着 futures 完成逐个处理结果；这种方式更简单并避免与 wait/pending 集合相关的微妙错误
-        for fut in as_completed(futures):
-            zp = futures.get(fut)
-            try:
-                file, ok, payload = fut.result()
-                if ok:
-                    saved.append(payload)
-                    print(f"success: {file} -> {payload}")
+        pending_args = iter(args_list)
+        futures = {}
+
+        def _submit_more():
+            while len(futures) < max_inflight:
+                args = next(pending_args, None)
+                if args is None:
+                    return
+                if prefetcher is not None:
+                    # 预读顺序与 args_list 一致；读取失败时 data 为 None，worker 回退为直接读盘
+                    _path, data, _err = next(prefetched)
                 else:
-                    failed.append({'file': file, 'error': payload})
-                    print(f"failed: {file} -> {payload}")
-            except Exception as e:
-                failed.append({'file': zp, 'error': str(e)})
-                print(f"error retrieving result for {zp}: {e}")
-            completed_count += 1
-            # 周期性进度心跳打印
-            if completed_count % 10 == 0 or completed_count == total:
-                print(f"progress... {completed_count}/{total} completed; failed {len(failed)}")
+                    data = None
+                args = args + (data, member_workers, member_executor)
+                fut = ex.submit(_worker_wrapper, args)
+                futures[fut] = args[0]
+                if prefetcher is not None and data is not None:
+                    # 任务结束即在 worker 线程中归还预读额度：主线程可能正阻塞在 next(prefetched) 上等额度，
+                    # 若等到主线程收割结果时才 release，两者会互相等待
+                    fut.add_done_callback(lambda _f, n=len(data): prefetcher.release(n))
+
+        _submit_more()
+        print(f"submitted {len(futures)}/{total} jobs to thread pool (workers={workers}, max_inflight={max_inflight}, "
+              f"member_workers={member_workers}, member_executor={member_executor})")
+    # 每完成一个任务就补交新任务，保证在途任务数不超过 max_inflight
+        try:
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    zp = futures.pop(fut)
+                    try:
+                        file, ok, payload = fut.result()
+                        if ok:
+                            day_basename, frames, saved_paths = payload
+                            if on_day is not None:
+                                for out_granularity, day_df in frames.items():
+                                    on_day(day_basename, out_granularity, day_df)
+                            if persist:
+                                saved.extend(saved_paths.values())
+                            else:
+                                saved.append(day_basename)
+                            print(f"success: {file} -> {', '.join(saved_paths.values()) if persist else '(in-memory)'}")
+                        else:
+                            failed.append({'file': file, 'error': payload})
+                            print(f"failed: {file} -> {payload}")
+                    except Exception as e:
+                        failed.append({'file': zp, 'error': str(e)})
+                        print(f"error retrieving result for {zp}: {e}")
+                    completed_count += 1
+                    # 周期性进度心跳打印
+                    if completed_count % 10 == 0 or completed_count == total:
+                        print(f"progress... {completed_count}/{total} completed; failed {len(failed)}")
+                _submit_more()
+        finally:
+            stop_event.set()
+            if prefetcher is not None:
+                prefetcher.close()
 
     return saved, failed
@@ -1,8 +1,8 @@
 """异常值检测与剔除工具
 
 功能：
-- remove_physical_bounds(df, var_bounds) - 基于变量物理上下限剔除
-- remove_iqr_outliers(df, value_cols, groupby=None, k=1.5, return_mask=False) - 基于分组 IQR 剔除离群点
+- remove_physical_bounds(df, var_bounds, inplace=False) - 基于变量物理上下限剔除
+- remove_iqr_outliers(df, value_cols, groupby=None, k=1.5, return_mask=False, inplace=False) - 基于分组 IQR 剔除离群点
 
 输出：返回清洗后的 DataFrame（并可选返回布尔掩码或被移除的统计信息）
 """
@@ -28,13 +28,15 @@ def remove_physical_bounds(df: pd.DataFrame, var_bounds: Dict[str, Tuple[float,
         df = df.copy()
     for col, (lo, hi) in var_bounds.items():
         if col in df.columns:
-            mask = (df[col] < lo) | (df[col] > hi) | pd.isna(df[col])
-            # 把不合法的值设为 NaN
-            df.loc[mask, col] = np.nan
+            # NaN 本身无需再写一遍；只有确实越界时才写入，避免无谓地触发列复制
+            mask = (df[col] < lo) | (df[col] > hi)
+            if mask.any():
+                # 把不合法的值设为 NaN
+                df.loc[mask, col] = np.nan
     return df
 
 
-def remove_iqr_outliers(df: pd.DataFrame, value_cols: List[str], groupby: Optional[List[str]] = None, k: float = 1.5, return_mask: bool = False) -> Tuple[pd.DataFrame, Optional[pd.Series]]:
+def remove_iqr_outliers(df: pd.DataFrame, value_cols: List[str], groupby: Optional[List[str]] = None, k: float = 1.5, return_mask: bool = False, inplace: bool = False) -> Tuple[pd.DataFrame, Optional[pd.Series]]:
     """基于 IQR 的离群点剔除。对于每个 group（或全局），逐列计算 Q1/Q3 并剔除小于 Q1-k*IQR 或大于 Q3+k*IQR 的点（设置为 NaN）。
 
     Args:
@@ -43,12 +45,14 @@ def remove_iqr_outliers(df: pd.DataFrame, value_cols: List[str], groupby: Option
         groupby: 分组键，例如 ['lat','lon'] 或 ['province','city']。如果 None 则不分组。
         k: IQR 扩展倍数，常用 1.5
         return_mask: 如果 True，返回一个布尔 Series，标识哪些行被认为是离群并被替换为 NaN（任一列触发）
+        inplace: 是否就地操作（调用方独占 df 时可避免整表复制）
 
     Returns:
         (cleaned_df, mask_series 或 None)
     """
     # Work on a copy to avoid mutating caller data
-    df = df.copy()
+    if not inplace:
+        df = df.copy()
 
     # Prepare mask Series (False by default)
     row_mask = pd.Series(False, index=df.index)
@@ -0,0 +1,409 @@
+"""格点 -> 区县 -> 市 -> 省 的行政区层级索引。
+
+对一张网格（四舍五入到 4 位小数的经纬度）只做一次空间连接：用 GADM level 2 确定每个格点所属的
+市（名称规则与 geo_utils.resolve_admin_names 相同，省/市键与逐日映射的结果一致），可选再用
+GADM level 3 确定区县。结果是整数编码数组（格点 -> 市、格点 -> 区县）加上层级关系（区县 -> 市 -> 省），
+以 npz 缓存到 ADMIN_INDEX_DIR，按网格坐标与边界文件的指纹区分。
+
+之后任何层级的日聚合只需按编码做 bincount（每个变量的有效值 sum/count），不再做空间连接：
+省由其下各市的 sum/count 汇总；区县的上级市取其格点中占多数的市。
+每个格点只归属一个行政区（落在多个多边形边界上的点取第一个匹配）。
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from src import config as _config
+
+LEVELS = ('county', 'city', 'province')
+# 缓存格式变化时递增，旧缓存自动失效
+INDEX_VERSION = 1
+_COUNTY_NAME_COLUMNS = ('NL_NAME_3', 'NAME_3', 'VARNAME_3')
+_COUNTY_ID_COLUMNS = ('GID_3',)
+_PLACEHOLDERS = {'', 'NA', 'N/A', 'NAN', '<NA>', 'NONE'}
+_CJK = r'[一-鿿]'
+
+# 进程内缓存：{(grid_key, source_key): AdminIndex}
+_LOADED: Dict[tuple, 'AdminIndex'] = {}
+# 并发的日任务线程同时首次请求同一网格时只构建一次：命中缓存不加锁，未命中时在锁内复查后再加载/构建
+_LOAD_LOCK = threading.Lock()
+
+
+def _round_coords(lat, lon):
+    lat_r = np.round(np.asarray(lat, dtype=np.float64).ravel(), 4)
+    lon_r = np.round(np.asarray(lon, dtype=np.float64).ravel(), 4)
+    return lat_r, lon_r
+
+
+def grid_key(lat_r: np.ndarray, lon_r: np.ndarray) -> str:
+    h = hashlib.sha1()
+    h.update(str(lat_r.size).encode('ascii'))
+    h.update(np.ascontiguousarray(lat_r).tobytes())
+    h.update(np.ascontiguousarray(lon_r).tobytes())
+    return h.hexdigest()[:16]
+
+
+def source_key(admin_geojson: str, county_geojson: Optional[str] = None) -> str:
+    parts = [f'v{INDEX_VERSION}']
+    for path in (admin_geojson, county_geojson):
+        if not path:
+            parts.append('-')
+            continue
+        st = os.stat(path)
+        parts.append(f'{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}')
+    return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+def clean_names(s: pd.Series) -> pd.Series:
+    # 占位字符串（NA/N/A/空串等）视为缺失
+    s = s.astype(object).where(s.notna(), None)
+    stripped = s.map(lambda v: v.strip() if isinstance(v, str) else v)
+    bad = stripped.map(lambda v: v is None or (isinstance(v, str) and v.upper() in _PLACEHOLDERS))
+    return stripped.where(~bad, None)
+
+
+def choose_chinese_first(df: pd.DataFrame, columns: Sequence[str]) -> pd.Series:
+    """逐行选择名称：优先包含中文的候选列，否则取第一个非空候选列。"""
+    out = pd.Series([None] * len(df), index=df.index, dtype=object)
+    cols = [c for c in columns if c in df.columns]
+    cleaned = {c: clean_names(df[c]) for c in cols}
+    for c in cols:
+        s = cleaned[c]
+        mask = s.notna() & s.astype(str).str.contains(_CJK) & out.isna()
+        out[mask] = s[mask]
+    for c in cols:
+        s = cleaned[c]
+        mask = s.notna() & out.isna()
+        out[mask] = s[mask]
+    return out
+
+
+def county_names_and_ids(df: pd.DataFrame):
+    """区县名称（中文优先）与唯一标识（GID_3；没有时用上级名称与区县名组合，同名区县在不同市里很常见）。"""
+    names = choose_chinese_first(df, _COUNTY_NAME_COLUMNS)
+    id_col = next((c for c in _COUNTY_ID_COLUMNS if c in df.columns), None)
+    if id_col is not None:
+        ids = clean_names(df[id_col])
+    else:
+        parents = [c for c in ('NAME_1', 'NAME_2') if c in df.columns]
+        ids = pd.concat([df[parents].astype(str), names.astype(str)], axis=1).agg('|'.join, axis=1)
+        ids = ids.where(names.notna(), None)
+    return names, ids
+
+
+def _codes_for(values: pd.Series, names: List[str]) -> np.ndarray:
+    lookup = {n: i for i, n in enumerate(names)}
+    return values.map(lambda v: lookup.get(v, -1) if v is not None else -1).to_numpy(dtype=np.int32)
+
+
+class AdminUnits:
+    """某张网格上的行政区单元（区县/市/省名称与上级关系）及按单元聚合的公共逻辑。
+
+    city_names[i] 属于省 province_names[city_province[i]]；county_names[j] 的上级市为 county_city[j]
+    （-1 表示未能确定上级市）。名称按 (省, 市[, 区县]) 排序，与 groupby(['province', 'city']) 的输出顺序一致。
+    子类提供格点到单元的权重：AdminIndex 为中心点归属（0/1），admin_weights.AdminWeights 为面积重叠比例。
+    """
+
+    def __init__(self, province_names, city_names, city_province,
+                 county_names=None, county_ids=None, county_city=None):
+        self.province_names = np.asarray(province_names, dtype=object)
+        self.city_names = np.asarray(city_names, dtype=object)
+        self.city_province = np.asarray(city_province, dtype=np.int32)
+        self.county_names = np.asarray(county_names if county_names is not None else [], dtype=object)
+        self.county_ids = np.asarray(county_ids if county_ids is not None else [], dtype=object)
+        self.county_city = np.asarray(county_city if county_city is not None else [], dtype=np.int32)
+
+    @property
+    def n_cells(self) -> int:
+        raise NotImplementedError
+
+    @property
+    def has_county(self) -> bool:
+        return self.county_names.size > 0
+
+    def n_units(self, level: str) -> int:
+        if level not in LEVELS:
+            raise ValueError(f'未知的行政层级: {level}')
+        return {'province': self.province_names.size, 'city': self.city_names.size,
+                'county': self.county_names.size}[level]
+
+    def keys(self, level: str) -> pd.DataFrame:
+        """level 上每个单元的键列（province[, city[, county]]），行号即单元编码。"""
+        if level == 'province':
+            return pd.DataFrame({'province': self.province_names})
+        if level == 'city':
+            return pd.DataFrame({'province': self.province_names[self.city_province], 'city': self.city_names})
+        parent = self.county_city
+        has_parent = parent >= 0
+        city = np.where(has_parent, self.city_names[np.maximum(parent, 0)] if self.city_names.size else None, None)
+        prov_codes = self.city_province[np.maximum(parent, 0)] if self.city_names.size else np.zeros(0, np.int32)
+        province = np.where(has_parent, self.province_names[prov_codes] if self.province_names.size else None, None)
+        return pd.DataFrame({'province': province, 'city': city, 'county': self.county_names})
+
+    def weight_matrix(self, level: str):
+        """格点 × 单元的稀疏权重矩阵（scipy.sparse.csr_matrix）。"""
+        raise NotImplementedError
+
+    def sufficient_stats(self, df: pd.DataFrame, level: str, value_cols: Sequence[str]):
+        """返回 (加权和[单元×变量], 有效权重和[单元×变量], 单元总权重)。"""
+        w = self.weight_matrix(level)
+        if len(df) != w.shape[0]:
+            raise ValueError(f'行数 {len(df)} 与索引格点数 {w.shape[0]} 不一致')
+        wt = w.T.tocsr()
+        sums = np.zeros((w.shape[1], len(value_cols)), dtype=np.float64)
+        counts = np.zeros((w.shape[1], len(value_cols)), dtype=np.float64)
+        for j, col in enumerate(value_cols):
+            vals = df[col].to_numpy()
+            ok = ~np.isnan(vals)
+            sums[:, j] = wt @ np.where(ok, vals, 0).astype(np.float64)
+            counts[:, j] = wt @ ok.astype(np.float64)
+        return sums, counts, np.asarray(wt.sum(axis=1)).ravel()
+
+    def aggregate(self, df: pd.DataFrame, level: str, value_cols: Sequence[str],
+                  value_dtype=None) -> pd.DataFrame:
+        """按 level 聚合 df（行与网格格点一一对应）中 value_cols 的（加权）均值，返回键列 + 变量列。"""
+        value_dtype = np.dtype(value_dtype or _config.VALUE_DTYPE)
+        value_cols = list(value_cols)
+        sums, counts, cells = self.sufficient_stats(df, level, value_cols)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(counts > 0, sums / np.where(counts > 0, counts, 1), np.nan)
+        # 只输出至少含一个格点的单元（与 groupby(observed=True) 一致）
+        keep = cells > 0
+        out = self.keys(level)[keep].reset_index(drop=True)
+        for j, col in enumerate(value_cols):
+            out[col] = means[keep, j].astype(value_dtype)
+        return out
+
+    def aggregate_cube(self, values: Dict[str, np.ndarray], level: str, chunk_days: int = 32) -> Dict[str, np.ndarray]:
+        """把 {变量: (天 × 格点) 数组} 聚合为 {变量: (天 × 单元) 均值}：每块天数一次稀疏矩阵乘法，跳过 NaN。"""
+        w = self.weight_matrix(level).tocsc()
+        out = {}
+        for var, cube in values.items():
+            cube = np.asarray(cube)
+            if cube.ndim != 2 or cube.shape[1] != w.shape[0]:
+                raise ValueError(f'{var}: 期望 (天, {w.shape[0]}) 数组，实际 {cube.shape}')
+            res = np.full((cube.shape[0], w.shape[1]), np.nan, dtype=np.float64)
+            for s in range(0, cube.shape[0], chunk_days):
+                block = cube[s:s + chunk_days]
+                ok = ~np.isnan(block)
+                sums = np.asarray((w.T @ np.where(ok, block, 0).astype(np.float64).T)).T
+                wsum = np.asarray((w.T @ ok.astype(np.float64).T)).T
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    res[s:s + chunk_days] = np.where(wsum > 0, sums / np.where(wsum > 0, wsum, 1), np.nan)
+            out[var] = res
+        return out
+
+    def cube_frame(self, days: Sequence[str], values: Dict[str, np.ndarray], level: str,
+                   value_dtype=None) -> pd.DataFrame:
+        """aggregate_cube 的长表形式：time + 键列 + 变量列，每天每个（含格点的）单元一行。"""
+        value_dtype = np.dtype(value_dtype or _config.VALUE_DTYPE)
+        means = self.aggregate_cube(values, level)
+        keep = np.asarray(self.weight_matrix(level).sum(axis=0)).ravel() > 0
+        keys = self.keys(level)[keep].reset_index(drop=True)
+        n_days, n_keep = len(days), int(keep.sum())
+        out = keys.iloc[np.tile(np.arange(n_keep), n_days)].reset_index(drop=True)
+        out.insert(0, 'time', pd.to_datetime(np.repeat(np.asarray(days, dtype=object), n_keep), format='%Y%m%d'))
+        for var, arr in means.items():
+            out[var] = arr[:, keep].reshape(-1).astype(value_dtype)
+        return out
+
+
+class AdminIndex(AdminUnits):
+    """某张网格的行政区层级索引：每个格点中心归属一个单元（cell_city/cell_county，-1 表示不属于任何单元）。"""
+
+    def __init__(self, province_names, city_names, city_province, cell_city,
+                 county_names=None, county_ids=None, county_city=None, cell_county=None):
+        super().__init__(province_names, city_names, city_province,
+                         county_names=county_names, county_ids=county_ids, county_city=county_city)
+        self.cell_city = np.asarray(cell_city, dtype=np.int32)
+        self.cell_county = None if cell_county is None else np.asarray(cell_county, dtype=np.int32)
+
+    @property
+    def n_cells(self) -> int:
+        return int(self.cell_city.size)
+
+    @property
+    def has_county(self) -> bool:
+        return self.cell_county is not None and self.county_names.size > 0
+
+    def cell_codes(self, level: str) -> np.ndarray:
+        """每个格点在 level 上的单元编码（-1 表示不属于任何单元）。"""
+        if level == 'city':
+            return self.cell_city
+        if level == 'province':
+            return np.where(self.cell_city >= 0, self.city_province[np.maximum(self.cell_city, 0)], -1).astype(np.int32)
+        if level == 'county':
+            if not self.has_county:
+                raise ValueError('索引中没有区县层级（需要 GADM level 3 边界）')
+            return self.cell_county
+        raise ValueError(f'未知的行政层级: {level}')
+
+    def weight_matrix(self, level: str):
+        """中心点归属的 0/1 稀疏矩阵（格点 × 单元）。"""
+        from scipy import sparse
+
+        codes = self.cell_codes(level)
+        rows = np.flatnonzero(codes >= 0)
+        return sparse.csr_matrix((np.ones(rows.size), (rows, codes[rows])), shape=(codes.size, self.n_units(level)))
+
+    def sufficient_stats(self, df: pd.DataFrame, level: str, value_cols: Sequence[str]):
+        """返回 (sums[float64, 单元×变量], counts[int64, 单元×变量], 单元格点数)；按编码 bincount。"""
+        codes = self.cell_codes(level)
+        if len(df) != codes.size:
+            raise ValueError(f'行数 {len(df)} 与索引格点数 {codes.size} 不一致')
+        n_units = self.n_units(level)
+        inside = codes >= 0
+        cells = np.bincount(codes[inside], minlength=n_units)
+        sums = np.zeros((n_units, len(value_cols)), dtype=np.float64)
+        counts = np.zeros((n_units, len(value_cols)), dtype=np.int64)
+        for j, col in enumerate(value_cols):
+            vals = df[col].to_numpy()
+            ok = inside & ~np.isnan(vals)
+            c = codes[ok]
+            sums[:, j] = np.bincount(c, weights=vals[ok], minlength=n_units)
+            counts[:, j] = np.bincount(c, minlength=n_units)
+        return sums, counts, cells
+
+    # ---- 持久化 ----
+
+    def save(self, path: str, meta: Optional[Dict] = None) -> str:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        arrays = {
+            'province_names': self.province_names.astype(str), 'city_names': self.city_names.astype(str),
+            'city_province': self.city_province, 'cell_city': self.cell_city,
+            'county_names': self.county_names.astype(str), 'county_ids': self.county_ids.astype(str),
+            'county_city': self.county_city,
+            'meta': np.array(json.dumps(meta or {}, ensure_ascii=False)),
+        }
+        if self.cell_county is not None:
+            arrays['cell_county'] = self.cell_county
+        tmp = path + '.tmp.npz'
+        np.savez_compressed(tmp, **arrays)
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> 'AdminIndex':
+        with np.load(path, allow_pickle=False) as z:
+            return cls(z['province_names'].tolist(), z['city_names'].tolist(), z['city_province'], z['cell_city'],
+                       county_names=z['county_names'].tolist(), county_ids=z['county_ids'].tolist(),
+                       county_city=z['county_city'], cell_county=z['cell_county'] if 'cell_county' in z.files else None)
+
+
+def _cell_rows(lat_r: np.ndarray, lon_r: np.ndarray, owners: pd.DataFrame, cols: List[str]) -> pd.DataFrame:
+    # 把每个唯一坐标的归属连回格点（左连接保持格点顺序，owners 中每个坐标只有一行）
+    cells = pd.DataFrame({'lat': lat_r, 'lon': lon_r})
+    return cells.merge(owners[['lat', 'lon'] + cols], how='left', on=['lat', 'lon'])
+
+
+def build_admin_index(lat, lon, admin_geojson: str, county_geojson: Optional[str] = None,
+                      debug: bool = False) -> AdminIndex:
+    """对网格做一次空间连接，构建行政区层级索引（不读写缓存）。"""
+    from .geo_utils import resolve_admin_names, map_points_to_admin
+
+    lat_r, lon_r = _round_coords(lat, lon)
+    coords = pd.DataFrame({'lat': lat_r, 'lon': lon_r}).dropna().drop_duplicates().reset_index(drop=True)
+
+    mapped = resolve_admin_names(coords, admin_geojson, level='city', debug=debug)
+    owners = mapped[mapped['province'].notna() & mapped['city'].notna()]
+    owners = owners.drop_duplicates(['lat', 'lon'], keep='first')
+    owners = owners.assign(province=owners['province'].astype(object), city=owners['city'].astype(object))
+
+    province_names = sorted(owners['province'].unique().tolist())
+    pairs = sorted(set(zip(owners['province'], owners['city'])))
+    city_names = [c for _, c in pairs]
+    prov_lookup = {p: i for i, p in enumerate(province_names)}
+    city_province = np.array([prov_lookup[p] for p, _ in pairs], dtype=np.int32)
+    pair_lookup = {pc: i for i, pc in enumerate(pairs)}
+
+    cells = _cell_rows(lat_r, lon_r, owners, ['province', 'city'])
+    cell_city = np.fromiter((pair_lookup.get((p, c), -1) for p, c in zip(cells['province'], cells['city'])),
+                            dtype=np.int32, count=len(cells))
+
+    county_names = county_ids = county_city = cell_county = None
+    if county_geojson and os.path.exists(county_geojson):
+        joined = map_points_to_admin(coords, county_geojson, level='county')
+        names, ids_ = county_names_and_ids(joined)
+        joined = joined.assign(_county=names, _county_id=ids_)
+        joined = joined[joined['_county'].notna() & joined['_county_id'].notna()]
+        joined = joined.drop_duplicates(['lat', 'lon'], keep='first')
+
+        cells_c = _cell_rows(lat_r, lon_r, joined, ['_county', '_county_id'])
+        ids = sorted(joined['_county_id'].unique().tolist())
+        cell_county_raw = _codes_for(cells_c['_county_id'].astype(object).where(cells_c['_county_id'].notna(), None), ids)
+        names_by_id = dict(zip(joined['_county_id'], joined['_county']))
+
+        # 上级市：区县内格点中占多数的市（与 city 粒度的键保持一致）
+        parent = np.full(len(ids), -1, dtype=np.int32)
+        both = (cell_county_raw >= 0) & (cell_city >= 0)
+        if both.any() and city_names:
+            votes = pd.DataFrame({'county': cell_county_raw[both], 'city': cell_city[both]})
+            top = votes.groupby(['county', 'city']).size().reset_index(name='n')
+            top = top.sort_values(['county', 'n', 'city'], ascending=[True, False, True]).drop_duplicates('county')
+            parent[top['county'].to_numpy()] = top['city'].to_numpy()
+
+        # 按 (省, 市, 区县名, 标识) 排序后重新编号
+        def _sort_key(i):
+            p = parent[i]
+            prov = province_names[city_province[p]] if p >= 0 else '￿'
+            city = city_names[p] if p >= 0 else '￿'
+            return (prov, city, names_by_id[ids[i]], ids[i])
+
+        order = sorted(range(len(ids)), key=_sort_key)
+        remap = np.empty(len(ids), dtype=np.int32)
+        remap[order] = np.arange(len(ids), dtype=np.int32)
+        county_ids = [ids[i] for i in order]
+        county_names = [names_by_id[cid] for cid in county_ids]
+        county_city = parent[order]
+        cell_county = np.where(cell_county_raw >= 0, remap[np.maximum(cell_county_raw, 0)], -1).astype(np.int32)
+
+    return AdminIndex(province_names, city_names, city_province, cell_city,
+                      county_names=county_names, county_ids=county_ids, county_city=county_city,
+                      cell_county=cell_county)
+
+
+def index_path(lat_r: np.ndarray, lon_r: np.ndarray, admin_geojson: str, county_geojson: Optional[str] = None,
+               cache_dir: Optional[str] = None) -> str:
+    cache_dir = cache_dir or _config.ADMIN_INDEX_DIR
+    return os.path.join(cache_dir, f'{grid_key(lat_r, lon_r)}_{source_key(admin_geojson, county_geojson)}.npz')
+
+
+def get_admin_index(lat, lon, admin_geojson: str, county_geojson: Optional[str] = None,
+                    cache_dir: Optional[str] = None, debug: bool = False) -> AdminIndex:
+    """返回网格的行政区层级索引：依次查进程内缓存、磁盘缓存，都没有时构建并写入磁盘。"""
+    if county_geojson and not os.path.exists(county_geojson):
+        county_geojson = None
+    lat_r, lon_r = _round_coords(lat, lon)
+    gkey = grid_key(lat_r, lon_r)
+    skey = source_key(admin_geojson, county_geojson)
+    mem_key = (gkey, skey)
+    index = _LOADED.get(mem_key)
+    if index is not None:
+        return index
+    with _LOAD_LOCK:
+        index = _LOADED.get(mem_key)
+        if index is not None:
+            return index
+        path = index_path(lat_r, lon_r, admin_geojson, county_geojson, cache_dir)
+        if os.path.exists(path):
+            try:
+                index = AdminIndex.load(path)
+            except Exception:
+                index = None
+        if index is None or index.n_cells != lat_r.size:
+            index = build_admin_index(lat_r, lon_r, admin_geojson, county_geojson, debug=debug)
+            try:
+                index.save(path, meta={'admin_geojson': os.path.abspath(admin_geojson),
+                                       'county_geojson': os.path.abspath(county_geojson) if county_geojson else None,
+                                       'cells': int(lat_r.size)})
+                print(f"[admin-index] built {path} (provinces={index.province_names.size} "
+                      f"cities={index.city_names.size} counties={index.county_names.size})")
+            except Exception as e:
+                print(f"[admin-index] could not save {path}: {e}")
+        _LOADED[mem_key] = index
+    return index
@@ -0,0 +1,203 @@
+"""行政区单元的质心与标注点（热图点位、地图标签）。
+
+每个单元算一次，结果缓存为 npz（与行政区索引同在 ADMIN_INDEX_DIR）：
+  - source='polygon'：GADM 多边形按 (省, 市) 合并后取几何质心；标注点为质心（落在单元内时）
+    或 point_on_surface（月牙形、沿海破碎的单元质心可能落在单元外）。市名由每个多边形的内部代表点
+    经 geo_utils.resolve_admin_names 得到，与格点映射 / admin_weights 的键一致；缓存只按边界文件指纹区分。
+  - source='cells'：由单元拥有的格点（AdminUnits.weight_matrix，中心点归属或面积重叠权重）加权平均得质心，
+    标注点为离质心最近的所属格点。按网格指纹 + 边界指纹 + 权重方式缓存。
+结果是每个层级一张表：province[, city[, county, county_id]], lon, lat, label_lon, label_lat。
+city_records 把市级表转为 resources/city_centroids.json 的格式，供 precompute_heatmaps 与内存流水线的热图使用。
+
+用法（在 processing 目录下）：
+    python run_pipeline.py centroids                          # GADM 多边形（默认 config.ADMIN_GEOJSON）
+    python run_pipeline.py centroids --source cells --year 2013
+"""
+import os
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from src import config as _config
+from .admin_index import LEVELS, county_names_and_ids, grid_key, source_key, _round_coords
+
+KEY_COLUMNS = {'province': ['province'], 'city': ['province', 'city'],
+               'county': ['province', 'city', 'county', 'county_id']}
+POINT_COLUMNS = ['lon', 'lat', 'label_lon', 'label_lat']
+
+# 进程内缓存：{缓存文件路径: {层级: DataFrame}}
+_LOADED: Dict[str, Dict[str, pd.DataFrame]] = {}
+
+
+def _label_points(geoms: np.ndarray):
+    import shapely
+
+    cent = shapely.centroid(geoms)
+    inside = shapely.contains(geoms, cent)
+    surface = shapely.point_on_surface(geoms)
+    label = np.where(inside, cent, surface)
+    return shapely.get_x(cent), shapely.get_y(cent), shapely.get_x(label), shapely.get_y(label)
+
+
+def _dissolved_points(geoms: np.ndarray, keys: pd.DataFrame, cols) -> pd.DataFrame:
+    import shapely
+
+    ok = keys[cols].notna().all(axis=1).to_numpy()
+    keys = keys.loc[ok, cols].reset_index(drop=True)
+    geoms = geoms[ok]
+    groups = keys.groupby(cols, sort=True).indices
+    merged = np.array([shapely.union_all(geoms[idx]) if len(idx) > 1 else geoms[idx[0]]
+                       for idx in groups.values()], dtype=object)
+    out = pd.DataFrame(list(groups.keys()), columns=cols)
+    if merged.size:
+        out['lon'], out['lat'], out['label_lon'], out['label_lat'] = _label_points(merged)
+    else:
+        out = out.assign(**{c: np.array([], dtype=np.float64) for c in POINT_COLUMNS})
+    return out
+
+
+def polygon_points(admin_geojson: str, county_geojson: Optional[str] = None,
+                   debug: bool = False) -> Dict[str, pd.DataFrame]:
+    """由 GADM 多边形计算各层级单元的质心与标注点（不读写缓存）。"""
+    from .geo_utils import read_admin_polygons
+    from .admin_weights import _representative_city_keys
+
+    gdf = read_admin_polygons(admin_geojson)
+    geoms = np.asarray(gdf.geometry.values, dtype=object)
+    keys = _representative_city_keys(gdf, admin_geojson, debug=debug)
+    points = {'city': _dissolved_points(geoms, keys, KEY_COLUMNS['city']),
+              'province': _dissolved_points(geoms, keys, KEY_COLUMNS['province'])}
+    if county_geojson and os.path.exists(county_geojson):
+        gdf3 = read_admin_polygons(county_geojson)
+        names, ids = county_names_and_ids(gdf3)
+        # 区县的上级市为其代表点所在的市（与 admin_weights 相同）
+        parents = _representative_city_keys(gdf3, admin_geojson, debug=debug)
+        keys3 = pd.DataFrame({'province': parents['province'].to_numpy(), 'city': parents['city'].to_numpy(),
+                              'county': names.to_numpy(), 'county_id': ids.to_numpy()})
+        points['county'] = _dissolved_points(np.asarray(gdf3.geometry.values, dtype=object),
+                                             keys3.fillna({'province': '', 'city': ''}), KEY_COLUMNS['county'])
+    return points
+
+
+def cell_points(units, lat, lon, level: str) -> pd.DataFrame:
+    """由单元拥有的格点（units 为 AdminIndex / AdminWeights）计算质心与标注点。"""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    w = units.weight_matrix(level).tocoo()
+    n = units.n_units(level)
+    total = np.bincount(w.col, weights=w.data, minlength=n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        c_lon = np.bincount(w.col, weights=w.data * lon[w.row], minlength=n) / total
+        c_lat = np.bincount(w.col, weights=w.data * lat[w.row], minlength=n) / total
+    # 标注点：离质心最近的所属格点（经度差按纬度余弦缩放）
+    dx = (lon[w.row] - c_lon[w.col]) * np.cos(np.radians(c_lat[w.col]))
+    dist = dx * dx + (lat[w.row] - c_lat[w.col]) ** 2
+    order = np.lexsort((dist, w.col))
+    first = order[np.r_[True, w.col[order][1:] != w.col[order][:-1]]] if order.size else order
+    label_lon = np.full(n, np.nan)
+    label_lat = np.full(n, np.nan)
+    label_lon[w.col[first]] = lon[w.row[first]]
+    label_lat[w.col[first]] = lat[w.row[first]]
+    out = units.keys(level)
+    if level == 'county':
+        out = out.assign(county_id=units.county_ids)
+    out = out.assign(lon=c_lon, lat=c_lat, label_lon=label_lon, label_lat=label_lat)
+    return out[total > 0].reset_index(drop=True)
+
+
+def points_path(admin_geojson: str, county_geojson: Optional[str] = None, source: str = 'polygon',
+                lat=None, lon=None, weighting: Optional[str] = None, cache_dir: Optional[str] = None) -> str:
+    cache_dir = cache_dir or _config.ADMIN_INDEX_DIR
+    skey = source_key(admin_geojson, county_geojson)
+    if source == 'polygon':
+        return os.path.join(cache_dir, f'points_{skey}.npz')
+    lat_r, lon_r = _round_coords(lat, lon)
+    return os.path.join(cache_dir, f'points_{grid_key(lat_r, lon_r)}_{skey}_{weighting}.npz')
+
+
+def save_points(points: Dict[str, pd.DataFrame], path: str) -> str:
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    arrays = {'levels': np.array(list(points), dtype=str)}
+    for level, df in points.items():
+        for col in df.columns:
+            if col in POINT_COLUMNS:
+                arrays[f'{level}__{col}'] = df[col].to_numpy(dtype=np.float64)
+            else:
+                arrays[f'{level}__{col}'] = df[col].astype(object).where(df[col].notna(), '').to_numpy().astype(str)
+    tmp = path + '.tmp.npz'
+    np.savez_compressed(tmp, **arrays)
+    os.replace(tmp, path)
+    return path
+
+
+def load_points(path: str) -> Dict[str, pd.DataFrame]:
+    with np.load(path, allow_pickle=False) as z:
+        points = {}
+        for level in z['levels'].tolist():
+            cols = KEY_COLUMNS[level] + POINT_COLUMNS
+            points[level] = pd.DataFrame({c: z[f'{level}__{c}'].astype(object if c not in POINT_COLUMNS else np.float64)
+                                          for c in cols})
+        return points
+
+
+def get_admin_points(admin_geojson: str, county_geojson: Optional[str] = None, source: Optional[str] = None,
+                     lat=None, lon=None, weighting: Optional[str] = None, cache_dir: Optional[str] = None,
+                     debug: bool = False) -> Dict[str, pd.DataFrame]:
+    """返回 {层级: 质心/标注点表}：依次查进程内缓存、磁盘缓存，都没有时计算并写入磁盘。
+
+    source 默认 config.ADMIN_POINTS_SOURCE；'cells' 需要网格坐标 lat/lon（单元与 get_admin_units 相同）。
+    """
+    source = source or _config.ADMIN_POINTS_SOURCE
+    if source not in ('polygon', 'cells'):
+        raise ValueError(f'未知的 source: {source}')
+    if county_geojson and not os.path.exists(county_geojson):
+        county_geojson = None
+    if source == 'cells':
+        if lat is None or lon is None:
+            raise ValueError("source='cells' 需要网格坐标 lat/lon")
+        weighting = weighting or _config.ADMIN_WEIGHTING
+    path = points_path(admin_geojson, county_geojson, source, lat, lon, weighting, cache_dir)
+    points = _LOADED.get(path)
+    if points is not None:
+        return points
+    if os.path.exists(path):
+        try:
+            points = load_points(path)
+        except Exception:
+            points = None
+    if points is None:
+        if source == 'polygon':
+            points = polygon_points(admin_geojson, county_geojson, debug=debug)
+        else:
+            from .admin_weights import get_admin_units
+            units = get_admin_units(lat, lon, admin_geojson, county_geojson=county_geojson, weighting=weighting,
+                                    debug=debug)
+            points = {level: cell_points(units, lat, lon, level) for level in LEVELS
+                      if level != 'county' or units.has_county}
+        try:
+            save_points(points, path)
+            print(f"[admin-points] built {path} ({source}: " +
+                  ' '.join(f"{lv}={len(df)}" for lv, df in points.items()) + ')')
+        except Exception as e:
+            print(f"[admin-points] could not save {path}: {e}")
+    _LOADED[path] = points
+    return points
+
+
+def city_records(points: Dict[str, pd.DataFrame], source: str = 'polygon') -> Dict[str, Dict]:
+    """市级表 -> {键: {city, province, lon, lat, label_lon, label_lat, source}}。
+
+    键为市名；不同省的同名市改用 '省|市'（heatmap_rows 先查 '省|市' 再查市名）。
+    """
+    df = points.get('city')
+    if df is None or df.empty:
+        return {}
+    dup = df['city'].duplicated(keep=False).to_numpy()
+    records = {}
+    for (prov, city, lon, lat, llon, llat), d in zip(df[KEY_COLUMNS['city'] + POINT_COLUMNS].itertuples(index=False),
+                                                      dup):
+        key = f'{prov}|{city}' if d else str(city)
+        records[key] = {'city': city, 'province': prov, 'lon': round(float(lon), 5), 'lat': round(float(lat), 5),
+                        'label_lon': round(float(llon), 5), 'label_lat': round(float(llat), 5), 'source': source}
+    return records
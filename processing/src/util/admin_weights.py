@@ -0,0 +1,257 @@
+"""格点与行政区多边形的面积重叠权重（稀疏矩阵，格点 × 单元）。
+
+中心点归属（admin_index.AdminIndex）把每个格点整体划给中心所在的单元，小城市、沿海与边界单元会因此偏差；
+这里用格点四边形足迹（grid_geometry.cell_polygons）与多边形求交，权重为格点落在单元内的面积比例，
+可选再乘以格点面积（area_weighted），使单元均值成为面积加权平均。
+
+单元的名称与层级与 AdminIndex 相同：市名由每个多边形的内部代表点经 geo_utils.resolve_admin_names 得到，
+同名的多个多边形合并为一个单元；区县的上级市为其代表点所在的市。
+权重矩阵按网格坐标与边界文件的指纹缓存到 ADMIN_INDEX_DIR；任意天数的聚合都是一次稀疏矩阵乘法
+（见 AdminUnits.aggregate / aggregate_cube）。
+"""
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src import config as _config
+from .admin_index import (AdminUnits, county_names_and_ids, grid_key, source_key, _round_coords)
+
+
+def overlap_fractions(cells, geoms, clip: bool = True) -> 'scipy.sparse.csr_matrix':
+    """每个格点足迹落在每个多边形内的面积比例（稀疏矩阵，格点 × 多边形）。
+
+    先用 STRtree 找出相交的 (多边形, 格点) 对；完全包含的格点比例为 1，只有跨边界的格点才求交。
+    clip 时先把多边形裁剪到格点外接矩形，避免对复杂多边形整体做叠加运算（多边形本身很简单时可关闭）。
+    """
+    import shapely
+    from scipy import sparse
+
+    cells = np.asarray(cells, dtype=object)
+    geoms = np.asarray(geoms, dtype=object)
+    tree = shapely.STRtree(cells)
+    gi, ci = tree.query(geoms, predicate='intersects')
+    gin, cin = tree.query(geoms, predicate='contains')
+    n_cells = cells.size
+    full = np.isin(gi.astype(np.int64) * n_cells + ci, gin.astype(np.int64) * n_cells + cin)
+    frac = np.ones(gi.size, dtype=np.float64)
+    part = np.flatnonzero(~full)
+    if part.size:
+        cell_part = cells[ci[part]]
+        if clip:
+            part_geoms = np.array([shapely.clip_by_rect(g, *b)
+                                   for g, b in zip(geoms[gi[part]], shapely.bounds(cell_part))], dtype=object)
+        else:
+            part_geoms = geoms[gi[part]]
+        inter = shapely.intersection(part_geoms, cell_part)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            frac[part] = shapely.area(inter) / shapely.area(cell_part)
+    keep = frac > 0
+    return sparse.csr_matrix((np.minimum(frac[keep], 1.0), (ci[keep], gi[keep])), shape=(n_cells, geoms.size))
+
+
+def _one_hot(codes: np.ndarray, n: int):
+    from scipy import sparse
+
+    rows = np.flatnonzero(codes >= 0)
+    return sparse.csr_matrix((np.ones(rows.size), (rows, codes[rows])), shape=(codes.size, n))
+
+
+def _representative_city_keys(gdf, admin_geojson: str, debug: bool = False) -> pd.DataFrame:
+    """每个多边形内部代表点所在的 (province, city)，名称规则与逐格点映射一致。"""
+    import shapely
+    from .geo_utils import resolve_admin_names
+
+    reps = shapely.point_on_surface(np.asarray(gdf.geometry.values, dtype=object))
+    pts = pd.DataFrame({'lat': shapely.get_y(reps), 'lon': shapely.get_x(reps)})
+    mapped = resolve_admin_names(pts.drop_duplicates(), admin_geojson, level='city', debug=debug)
+    mapped = mapped[mapped['province'].notna() & mapped['city'].notna()].drop_duplicates(['lat', 'lon'], keep='first')
+    mapped = mapped.assign(province=mapped['province'].astype(object), city=mapped['city'].astype(object))
+    return pts.merge(mapped[['lat', 'lon', 'province', 'city']], how='left', on=['lat', 'lon'])
+
+
+class AdminWeights(AdminUnits):
+    """面积重叠权重：city_weights / county_weights 为格点 × 单元的稀疏矩阵，省级由市级按归属相加。"""
+
+    def __init__(self, province_names, city_names, city_province, city_weights,
+                 county_names=None, county_ids=None, county_city=None, county_weights=None,
+                 area_weighted: bool = True):
+        super().__init__(province_names, city_names, city_province,
+                         county_names=county_names, county_ids=county_ids, county_city=county_city)
+        self.city_weights = city_weights.tocsr()
+        self.county_weights = None if county_weights is None else county_weights.tocsr()
+        self.area_weighted = bool(area_weighted)
+
+    @property
+    def n_cells(self) -> int:
+        return int(self.city_weights.shape[0])
+
+    @property
+    def has_county(self) -> bool:
+        return self.county_weights is not None and self.county_names.size > 0
+
+    def weight_matrix(self, level: str):
+        if level == 'city':
+            return self.city_weights
+        if level == 'province':
+            return (self.city_weights @ _one_hot(self.city_province, self.province_names.size)).tocsr()
+        if level == 'county':
+            if not self.has_county:
+                raise ValueError('权重中没有区县层级（需要 GADM level 3 边界）')
+            return self.county_weights
+        raise ValueError(f'未知的行政层级: {level}')
+
+    # ---- 持久化 ----
+
+    def save(self, path: str) -> str:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        arrays = {
+            'province_names': self.province_names.astype(str), 'city_names': self.city_names.astype(str),
+            'city_province': self.city_province, 'county_names': self.county_names.astype(str),
+            'county_ids': self.county_ids.astype(str), 'county_city': self.county_city,
+            'area_weighted': np.array(self.area_weighted),
+        }
+        for name, m in (('city', self.city_weights), ('county', self.county_weights)):
+            if m is None:
+                continue
+            arrays.update({f'{name}_data': m.data, f'{name}_indices': m.indices, f'{name}_indptr': m.indptr,
+                           f'{name}_shape': np.array(m.shape)})
+        tmp = path + '.tmp.npz'
+        np.savez_compressed(tmp, **arrays)
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> 'AdminWeights':
+        from scipy import sparse
+
+        with np.load(path, allow_pickle=False) as z:
+            def _matrix(name):
+                if f'{name}_data' not in z.files:
+                    return None
+                return sparse.csr_matrix((z[f'{name}_data'], z[f'{name}_indices'], z[f'{name}_indptr']),
+                                         shape=tuple(z[f'{name}_shape']))
+            return cls(z['province_names'].tolist(), z['city_names'].tolist(), z['city_province'], _matrix('city'),
+                       county_names=z['county_names'].tolist(), county_ids=z['county_ids'].tolist(),
+                       county_city=z['county_city'], county_weights=_matrix('county'),
+                       area_weighted=bool(z['area_weighted']))
+
+
+def build_admin_weights(lat, lon, admin_geojson: str, county_geojson: Optional[str] = None,
+                        area_weighted: bool = True, debug: bool = False) -> AdminWeights:
+    """计算格点足迹与行政区多边形的重叠权重（不读写缓存）。lat/lon 为按行展开的格点中心。"""
+    from .geo_utils import read_admin_polygons
+    from .grid_geometry import reshape_grid, cell_polygons, cell_areas_km2
+
+    lat2d, lon2d = reshape_grid(lat, lon)
+    cells = cell_polygons(lat2d, lon2d)
+    scale = cell_areas_km2(lat2d, lon2d) if area_weighted else None
+
+    def _scaled(m):
+        if scale is None:
+            return m
+        from scipy import sparse
+        return (sparse.diags(scale) @ m).tocsr()
+
+    gdf = read_admin_polygons(admin_geojson)
+    feat_keys = _representative_city_keys(gdf, admin_geojson, debug=debug)
+    named = feat_keys['province'].notna() & feat_keys['city'].notna()
+    pairs = sorted(set(zip(feat_keys.loc[named, 'province'], feat_keys.loc[named, 'city'])))
+    province_names = sorted({p for p, _ in pairs})
+    prov_lookup = {p: i for i, p in enumerate(province_names)}
+    pair_lookup = {pc: i for i, pc in enumerate(pairs)}
+    city_names = [c for _, c in pairs]
+    city_province = np.array([prov_lookup[p] for p, _ in pairs], dtype=np.int32)
+    feat_city = np.array([pair_lookup.get((p, c), -1) if ok else -1
+                          for p, c, ok in zip(feat_keys['province'], feat_keys['city'], named)], dtype=np.int32)
+    frac = overlap_fractions(cells, np.asarray(gdf.geometry.values, dtype=object))
+    city_weights = _scaled(frac @ _one_hot(feat_city, len(pairs)))
+
+    county_names = county_ids = county_city = county_weights = None
+    if county_geojson and os.path.exists(county_geojson):
+        gdf3 = read_admin_polygons(county_geojson)
+        names, ids = county_names_and_ids(gdf3.drop(columns=[gdf3.geometry.name]))
+        parents = _representative_city_keys(gdf3, admin_geojson, debug=debug)
+        parent_code = np.array([pair_lookup.get((p, c), -1) for p, c in zip(parents['province'], parents['city'])],
+                               dtype=np.int32)
+        valid = names.notna().to_numpy() & ids.notna().to_numpy()
+        uniq = sorted(set(ids[valid]))
+        first = {}
+        for i in np.flatnonzero(valid):
+            first.setdefault(ids.iloc[i], i)
+
+        def _sort_key(cid):
+            i = first[cid]
+            p = parent_code[i]
+            return (province_names[city_province[p]] if p >= 0 else '￿',
+                    city_names[p] if p >= 0 else '￿', names.iloc[i], cid)
+
+        county_ids = sorted(uniq, key=_sort_key)
+        lookup = {cid: k for k, cid in enumerate(county_ids)}
+        county_names = [names.iloc[first[cid]] for cid in county_ids]
+        county_city = np.array([parent_code[first[cid]] for cid in county_ids], dtype=np.int32)
+        feat_county = np.array([lookup[ids.iloc[i]] if valid[i] else -1 for i in range(len(gdf3))], dtype=np.int32)
+        frac3 = overlap_fractions(cells, np.asarray(gdf3.geometry.values, dtype=object))
+        county_weights = _scaled(frac3 @ _one_hot(feat_county, len(county_ids)))
+
+    return AdminWeights(province_names, city_names, city_province, city_weights,
+                        county_names=county_names, county_ids=county_ids, county_city=county_city,
+                        county_weights=county_weights, area_weighted=area_weighted)
+
+
+_LOADED: Dict[Tuple, AdminWeights] = {}
+# 与 admin_index 相同：未命中进程内缓存时在锁内复查，并发线程不会重复计算同一网格的权重
+_LOAD_LOCK = threading.Lock()
+
+
+def get_admin_weights(lat, lon, admin_geojson: str, county_geojson: Optional[str] = None,
+                      area_weighted: Optional[bool] = None, cache_dir: Optional[str] = None,
+                      debug: bool = False) -> AdminWeights:
+    """返回网格的重叠权重：依次查进程内缓存、磁盘缓存，都没有时计算并写入磁盘。"""
+    if area_weighted is None:
+        area_weighted = _config.ADMIN_AREA_WEIGHTED
+    if county_geojson and not os.path.exists(county_geojson):
+        county_geojson = None
+    lat_r, lon_r = _round_coords(lat, lon)
+    key = (grid_key(lat_r, lon_r), source_key(admin_geojson, county_geojson), bool(area_weighted))
+    weights = _LOADED.get(key)
+    if weights is not None:
+        return weights
+    with _LOAD_LOCK:
+        weights = _LOADED.get(key)
+        if weights is not None:
+            return weights
+        cache_dir = cache_dir or _config.ADMIN_INDEX_DIR
+        path = os.path.join(cache_dir, f"{key[0]}_{key[1]}_overlap_{'area' if area_weighted else 'frac'}.npz")
+        if os.path.exists(path):
+            try:
+                weights = AdminWeights.load(path)
+            except Exception:
+                weights = None
+        if weights is None or weights.n_cells != lat_r.size:
+            weights = build_admin_weights(lat, lon, admin_geojson, county_geojson, area_weighted=area_weighted,
+                                          debug=debug)
+            try:
+                weights.save(path)
+                print(f"[admin-weights] built {path} (cities={weights.city_names.size} "
+                      f"counties={weights.county_names.size} nnz={weights.city_weights.nnz})")
+            except Exception as e:
+                print(f"[admin-weights] could not save {path}: {e}")
+        _LOADED[key] = weights
+    return weights
+
+
+def get_admin_units(lat, lon, admin_geojson: str, county_geojson: Optional[str] = None,
+                    weighting: Optional[str] = None, area_weighted: Optional[bool] = None,
+                    debug: bool = False) -> AdminUnits:
+    """按 weighting（'centroid' 中心点归属 / 'overlap' 面积重叠）返回网格的行政区单元。"""
+    weighting = weighting or _config.ADMIN_WEIGHTING
+    if weighting == 'overlap':
+        return get_admin_weights(lat, lon, admin_geojson, county_geojson=county_geojson,
+                                 area_weighted=area_weighted, debug=debug)
+    if weighting == 'centroid':
+        from .admin_index import get_admin_index
+        return get_admin_index(lat, lon, admin_geojson, county_geojson=county_geojson, debug=debug)
+    raise ValueError(f'未知的 weighting: {weighting}')
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+xarray 读取后端的一次性校准。
+
+在样本成员上分别计时内存路径（h5netcdf / scipy / netCDF4 memory）与解压到磁盘
+后的路径（netcdf4 / h5netcdf / scipy），按实测耗时排序后写入
+BACKEND_CALIBRATION_FILE，以环境指纹（Python、平台与各后端库版本）为键。
+io_utils.engine_order 读取该结果；环境变化（如升级 netCDF4）后指纹不同，会重新校准。
+
+用法（在 processing 目录下）：
+    python -m src.util.backend_calibration path/to/CN-Reanalysis20130101.zip [--force]
+也可通过 run_pipeline.py calibrate 调用。
+"""
+import argparse
+import functools
+import hashlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import datetime
+from importlib import metadata
+from typing import Dict, List, Optional
+
+from src import config as _config
+from src.util import io_utils
+
+_FINGERPRINT_MODULES = ('xarray', 'netCDF4', 'h5netcdf', 'h5py', 'scipy', 'numpy')
+# 进程内缓存：{path: {fingerprint_key: entry}}
+_LOADED: Dict[str, Dict] = {}
+
+
+@functools.lru_cache(maxsize=1)
+def _installed_versions() -> tuple:
+    # 读取发行包元数据而不导入模块本身，避免仅为查校准结果就加载 netCDF4/h5py 等
+    versions = []
+    for name in _FINGERPRINT_MODULES:
+        try:
+            versions.append((name, metadata.version(name)))
+        except Exception:
+            versions.append((name, 'missing'))
+    return tuple(versions)
+
+
+def environment_fingerprint() -> Dict[str, str]:
+    fp = {'python': platform.python_version(), 'platform': sys.platform, 'machine': platform.machine()}
+    fp.update(dict(_installed_versions()))
+    return fp
+
+
+def fingerprint_key(fp: Optional[Dict[str, str]] = None) -> str:
+    fp = fp or environment_fingerprint()
+    raw = json.dumps(fp, sort_keys=True).encode('utf-8')
+    return hashlib.sha1(raw).hexdigest()[:16]
+
+
+def _calibration_path(path: Optional[str] = None) -> str:
+    return path or _config.BACKEND_CALIBRATION_FILE
+
+
+def _read_all(path: str) -> Dict:
+    try:
+        with open(path, 'r', encoding='utf-8') as fh:
+            data = json.load(fh)
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+def load_calibration(path: Optional[str] = None) -> Optional[Dict]:
+    """返回当前环境的校准结果；没有时返回 None。"""
+    path = _calibration_path(path)
+    if path not in _LOADED:
+        _LOADED[path] = _read_all(path)
+    return _LOADED[path].get(fingerprint_key())
+
+
+def preferred_engines(mode: str, path: Optional[str] = None) -> List[str]:
+    entry = load_calibration(path)
+    if not entry:
+        return []
+    return list(entry.get(mode) or [])
+
+
+def _time_open(open_fn, repeat: int) -> float:
+    best = None
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        ds = open_fn()
+        try:
+            ds.load()
+        finally:
+            ds.close()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best
+
+
+def _rank(timings: Dict[str, Optional[float]]) -> List[str]:
+    ok = [(t, e) for e, t in timings.items() if t is not None]
+    return [e for _, e in sorted(ok)]
+
+
+def _sample_member(zip_path: str, member: Optional[str]) -> str:
+    if member:
+        return member
+    with zipfile.ZipFile(zip_path) as zf:
+        names = sorted(n for n in zf.namelist() if n.lower().endswith('.nc'))
+    if not names:
+        raise FileNotFoundError(f"No .nc found in {zip_path}")
+    return names[0]
+
+
+def calibrate(sample_zip: str, member: Optional[str] = None, repeat: int = 3,
+              path: Optional[str] = None, save: bool = True) -> Dict:
+    """在 sample_zip 的一个成员上为两种路径计时，返回（并可保存）当前环境的校准结果。"""
+    member = _sample_member(sample_zip, member)
+    data = io_utils.read_nc_bytes(sample_zip, member)
+
+    memory_timings = {}
+    for eng in io_utils.DEFAULT_ENGINE_ORDER['memory']:
+        if not io_utils._engine_usable(eng):
+            continue
+        try:
+            memory_timings[eng] = _time_open(lambda: io_utils.open_with_engine(data, eng), repeat)
+        except Exception:
+            memory_timings[eng] = None
+
+    disk_timings = {}
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        nc_path = os.path.join(tmp_dir, os.path.basename(member))
+        with open(nc_path, 'wb') as fh:
+            fh.write(data)
+        for eng in io_utils.DEFAULT_ENGINE_ORDER['disk']:
+            if eng not in io_utils.supported_engines():
+                continue
+            try:
+                disk_timings[eng] = _time_open(lambda: io_utils._xr().open_dataset(nc_path, engine=eng), repeat)
+            except Exception:
+                disk_timings[eng] = None
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    fp = environment_fingerprint()
+    entry = {
+        'fingerprint': fp,
+        'memory': _rank(memory_timings),
+        'disk': _rank(disk_timings),
+        'timings': {'memory': memory_timings, 'disk': disk_timings},
+        'sample': f"{os.path.basename(sample_zip)}:{member}",
+        'bytes': len(data),
+        'calibrated_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    if save:
+        path = _calibration_path(path)
+        all_entries = _read_all(path)
+        all_entries[fingerprint_key(fp)] = entry
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump(all_entries, fh, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+        _LOADED[path] = all_entries
+    return entry
+
+
+def ensure_calibrated(sample_zip: str, force: bool = False, path: Optional[str] = None) -> Optional[Dict]:
+    """当前环境尚未校准（或 force=True）时用 sample_zip 校准一次；失败时不影响调用方。"""
+    entry = None if force else load_calibration(path)
+    if entry is not None:
+        return entry
+    try:
+        entry = calibrate(sample_zip, path=path)
+        print(f"[calibrate] memory={entry['memory']} disk={entry['disk']} (saved to {_calibration_path(path)})")
+        return entry
+    except Exception as e:
+        print(f"[calibrate] backend calibration failed, using default engine order: {e}")
+        return None
+
+
+def format_entry(entry: Dict) -> str:
+    lines = [f"sample: {entry.get('sample')} ({entry.get('bytes')} bytes) at {entry.get('calibrated_at')}"]
+    for mode in ('memory', 'disk'):
+        timings = entry.get('timings', {}).get(mode, {})
+        parts = [f"{e}={'failed' if t is None else f'{t * 1000:.1f}ms'}" for e, t in timings.items()]
+        lines.append(f"{mode:>6}: order={entry.get(mode)}  [{', '.join(parts)}]")
+    return '\n'.join(lines)
+
+
+def main():
+    p = argparse.ArgumentParser(description='time xarray backends on a sample member and persist the fastest order')
+    p.add_argument('zip_path', help='CN-Reanalysis 日压缩包（作为样本）')
+    p.add_argument('--member', help='样本成员名（默认第一个 .nc）')
+    p.add_argument('--repeat', type=int, default=3)
+    p.add_argument('--force', action='store_true', help='即使已有当前环境的结果也重新校准')
+    args = p.parse_args()
+
+    entry = None if args.force else load_calibration()
+    if entry is None:
+        entry = calibrate(args.zip_path, member=args.member, repeat=args.repeat)
+        print(f"calibrated environment {fingerprint_key()} -> {_calibration_path()}")
+    else:
+        print(f"environment {fingerprint_key()} already calibrated (use --force to re-run)")
+    print(format_entry(entry))
+
+
+if __name__ == '__main__':
+    main()
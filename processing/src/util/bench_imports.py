@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+测量 CLI 与各模块的冷启动导入耗时（每次在新的解释器进程中执行，取最快一次）。
+
+“快速”目标（--help、export 以及趋势/热图工具）需要在 --budget 秒内完成，
+超出时以非零状态退出，便于在改动导入结构后做回归检查；
+--top N 额外列出某个模块导入链中最耗时的 N 个子模块（基于 python -X importtime）。
+
+用法（在 processing 目录下）：
+    python -m src.util.bench_imports --repeat 5 --budget 1.0
+    python -m src.util.bench_imports --top 10 --module src.preprocess
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+# (标签, 参数列表, 是否计入预算)
+TARGETS = [
+    ('python -c pass', ['-c', 'pass'], False),
+    ('run_pipeline.py --help', ['run_pipeline.py', '--help'], True),
+    ('run_pipeline.py export --help', ['run_pipeline.py', 'export', '--help'], True),
+    ('import src.visualize', ['-c', 'import src.visualize'], True),
+    ('import src.util.generate_trend_csvs', ['-c', 'import src.util.generate_trend_csvs'], True),
+    ('import src.util.precompute_heatmaps', ['-c', 'import src.util.precompute_heatmaps'], True),
+    ('import src.aggregate', ['-c', 'import src.aggregate'], False),
+    ('import src.preprocess', ['-c', 'import src.preprocess'], False),
+    ('import src.pipeline', ['-c', 'import src.pipeline'], False),
+    ('import src.util.geo_utils', ['-c', 'import src.util.geo_utils'], False),
+]
+
+
+def time_command(argv, repeat):
+    best = None
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable] + argv, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best
+
+
+def top_imports(module, n):
+    """返回 module 导入链中累计耗时最高的 n 个子模块 [(秒, 模块名)]。"""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        parts = line.split('|')
+        try:
+            rows.append((int(parts[1]) / 1e6, parts[2].strip()))
+        except (IndexError, ValueError):
+            continue
+    return sorted(rows, reverse=True)[:n]
+
+
+def main():
+    p = argparse.ArgumentParser(description='benchmark cold import time of CLI commands and modules')
+    p.add_argument('--repeat', type=int, default=3)
+    p.add_argument('--budget', type=float, default=1.0, help='seconds allowed for fast targets (help/export/trends/heatmaps)')
+    p.add_argument('--module', default='run_pipeline', help='module to break down with --top')
+    p.add_argument('--top', type=int, default=0, help='list the N slowest imports of --module')
+    args = p.parse_args()
+
+    over = []
+    for label, argv, budgeted in TARGETS:
+        dt = time_command(argv, args.repeat)
+        flag = ''
+        if budgeted and dt > args.budget:
+            flag = '  OVER BUDGET'
+            over.append(label)
+        print(f"{label:<40} {dt * 1000:8.0f} ms{flag}")
+
+    if args.top:
+        print(f"\nslowest imports under {args.module}:")
+        for sec, name in top_imports(args.module, args.top):
+            print(f"  {sec * 1000:8.1f} ms  {name}")
+
+    if over:
+        print(f"\n{len(over)} target(s) exceeded {args.budget:.2f}s: {', '.join(over)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
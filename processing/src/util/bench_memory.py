@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+测量单日处理（build_day_frame）的峰值内存。
+
+默认合成一个全尺寸的日压缩包（339×432 网格、24 个小时成员、11 个变量，与
+CN-Reanalysis 布局一致），也可用 --zip 指定真实文件；每种 dtype 策略在独立的
+子进程中运行，用 tracemalloc 记录 Python/numpy 分配的峰值，同时报告进程 RSS 峰值。
+--granularity city 时自动合成一个覆盖网格范围的矩形行政区 GeoJSON（或用 --admin-geojson 指定）。
+
+--check / --budget-mb 把它当作回归检查：任一策略的 tracemalloc 峰值超过预算时以非零状态退出。
+默认预算（DAY_PEAK_BUDGET_MB）按全尺寸合成日设定，实测约为 grid 37 MB、city 141 MB，
+留有余量；在单日路径里重新引入整表复制（每份约 8~13 MB）会很快越线。
+
+用法（在 processing 目录下）：
+    python -m src.util.bench_memory                       # float32 与 float64 策略对比（grid）
+    python -m src.util.bench_memory --granularity city --hours 6
+    python -m src.util.bench_memory --policies float32 --check
+    python -m src.util.bench_memory --granularity city --policies float32 --budget-mb 150
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+VARS = ('pm25', 'pm10', 'so2', 'no2', 'co', 'o3', 'temp', 'rh', 'psfc', 'u', 'v')
+_BASE = {'temp': 285.0, 'psfc': 95000.0, 'rh': 60.0, 'co': 1.0, 'u': 0.0, 'v': 0.0}
+DOMAIN = (15.0, 55.0, 70.0, 140.0)  # lat_min, lat_max, lon_min, lon_max
+# 全尺寸合成日（339×432×24）单日处理的 tracemalloc 峰值预算（MB）
+DAY_PEAK_BUDGET_MB = {'grid': 40.0, 'county': 160.0, 'city': 160.0, 'province': 160.0}
+
+
+def synthetic_grid(ny, nx):
+    lat_min, lat_max, lon_min, lon_max = DOMAIN
+    j, i = np.mgrid[0:ny, 0:nx]
+    lat2d = (lat_min + (lat_max - lat_min) * j / max(ny - 1, 1) + 0.01 * i / max(nx - 1, 1)).astype('float32')
+    lon2d = (lon_min + (lon_max - lon_min) * i / max(nx - 1, 1) + 0.01 * j / max(ny - 1, 1)).astype('float32')
+    return lat2d, lon2d
+
+
+def make_synthetic_day(out_dir, ny=339, nx=432, hours=24, stored=False, seed=0, day='20130101'):
+    """写出一个 CN-Reanalysis 布局的日压缩包，返回路径（需要 h5netcdf）。"""
+    import h5netcdf
+
+    lat2d, lon2d = synthetic_grid(ny, nx)
+    rng = np.random.default_rng(seed)
+    zip_path = os.path.join(out_dir, f'CN-Reanalysis{day}.zip')
+    member_path = os.path.join(out_dir, '_member.nc')
+    compression = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+    with zipfile.ZipFile(zip_path, 'w', compression) as zf:
+        for h in range(hours):
+            with h5netcdf.File(member_path, 'w') as f:
+                f.dimensions = {'bottom-top': 1, 'south-north': ny, 'west-east': nx}
+                for name, arr in (('lat2d', lat2d), ('lon2d', lon2d)):
+                    f.create_variable(name, ('south-north', 'west-east'), 'f4')[:] = arr
+                for v in VARS:
+                    data = _BASE.get(v, 40.0) + rng.normal(0, 5, (1, ny, nx))
+                    f.create_variable(v, ('bottom-top', 'south-north', 'west-east'), 'f4')[:] = data.astype('f4')
+            zf.write(member_path, f'CN-Reanalysis{day}{h:02d}.nc')
+    os.remove(member_path)
+    return zip_path
+
+
+def make_synthetic_admin(out_dir, rows=6, cols=8):
+    """按网格范围切分 rows×cols 个矩形“城市”，每行属于同一个“省”，字段与 GADM 一致。"""
+    lat_min, lat_max, lon_min, lon_max = DOMAIN
+    lat_edges = np.linspace(lat_min - 1, lat_max + 1, rows + 1)
+    lon_edges = np.linspace(lon_min - 1, lon_max + 1, cols + 1)
+    feats = []
+    for r in range(rows):
+        for c in range(cols):
+            la0, la1, lo0, lo1 = lat_edges[r], lat_edges[r + 1], lon_edges[c], lon_edges[c + 1]
+            feats.append({'type': 'Feature',
+                          'properties': {'NAME_1': f'Prov{r}', 'NL_NAME_1': f'省{r:02d}',
+                                         'NAME_2': f'City{r}{c}', 'NL_NAME_2': f'市{r:02d}{c:02d}',
+                                         'GID_2': f'CHN.{r}.{c}'},
+                          'geometry': {'type': 'Polygon', 'coordinates': [[[lo0, la0], [lo1, la0], [lo1, la1],
+                                                                           [lo0, la1], [lo0, la0]]]}})
+    path = os.path.join(out_dir, 'admin.json')
+    with open(path, 'w', encoding='utf-8') as fh:
+        json.dump({'type': 'FeatureCollection', 'features': feats}, fh, ensure_ascii=False)
+    return path
+
+
+def measure_day(zip_path, granularity='grid', admin_geojson=None, value_dtype=None, categorical=None):
+    """在当前进程中处理一天，返回 {'peak_mb','rss_mb','seconds','rows'}。"""
+    import tracemalloc
+    import gc
+    from src import config as _config
+    if value_dtype is not None:
+        _config.VALUE_DTYPE = value_dtype
+    if categorical is not None:
+        _config.CATEGORICAL_ADMIN_KEYS = categorical
+    from src.preprocess import build_day_frame
+
+    gc.collect()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    _, out_gran, df = build_day_frame(zip_path, granularity=granularity, admin_geojson=admin_geojson,
+                                      aggregate_mean=True, member_workers=1)
+    seconds = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_mb = None
+    try:
+        import resource
+        rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        rss_mb = rss_kb / 1024 if sys.platform != 'darwin' else rss_kb / 1024 / 1024
+    except Exception:
+        pass
+    return {'peak_mb': peak / 1024 / 1024, 'rss_mb': rss_mb, 'seconds': seconds, 'rows': len(df),
+            'granularity': out_gran, 'value_bytes': int(df.select_dtypes('number').memory_usage(index=False).sum())}
+
+
+def _run_child(args, value_dtype, categorical):
+    cmd = [sys.executable, '-m', 'src.util.bench_memory', '--child', '--zip', args.zip,
+           '--granularity', args.granularity, '--value-dtype', value_dtype,
+           '--categorical', '1' if categorical else '0']
+    if args.admin_geojson:
+        cmd += ['--admin-geojson', args.admin_geojson]
+    env = dict(os.environ, PREPROCESS_SKIP_IQR=os.environ.get('PREPROCESS_SKIP_IQR', '1'))
+    proc = subprocess.run(cmd, cwd=ROOT, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip() or proc.stdout.strip())
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    p = argparse.ArgumentParser(description='measure peak memory of processing one day')
+    p.add_argument('--zip', help='day ZIP to process (default: synthesize a full-size day)')
+    p.add_argument('--granularity', choices=['grid', 'county', 'city', 'province'], default='grid')
+    p.add_argument('--admin-geojson', help='admin polygons for city/province (default: synthetic rectangles)')
+    p.add_argument('--hours', type=int, default=24, help='hourly members in the synthetic day')
+    p.add_argument('--ny', type=int, default=339)
+    p.add_argument('--nx', type=int, default=432)
+    p.add_argument('--stored', action='store_true', help='store synthetic members uncompressed (ZIP_STORED)')
+    p.add_argument('--policies', default='float32,float64', help='comma-separated VALUE_DTYPE values to compare')
+    p.add_argument('--budget-mb', type=float, help='fail (exit 1) when any policy peaks above this many MB')
+    p.add_argument('--check', action='store_true', help='use the default per-granularity budget (DAY_PEAK_BUDGET_MB)')
+    p.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    p.add_argument('--value-dtype', help=argparse.SUPPRESS)
+    p.add_argument('--categorical', help=argparse.SUPPRESS)
+    args = p.parse_args()
+
+    if args.child:
+        res = measure_day(args.zip, args.granularity, args.admin_geojson, args.value_dtype, args.categorical == '1')
+        print(json.dumps(res))
+        return
+
+    budget = args.budget_mb
+    if budget is None and args.check:
+        budget = DAY_PEAK_BUDGET_MB[args.granularity]
+
+    over = []
+    with tempfile.TemporaryDirectory() as tmp:
+        if not args.zip:
+            t0 = time.perf_counter()
+            args.zip = make_synthetic_day(tmp, ny=args.ny, nx=args.nx, hours=args.hours, stored=args.stored)
+            print(f"synthesized {args.ny}x{args.nx}x{args.hours} day in {time.perf_counter() - t0:.1f}s: "
+                  f"{os.path.getsize(args.zip) / 1024 / 1024:.1f} MB")
+        if args.granularity != 'grid' and not args.admin_geojson:
+            args.admin_geojson = make_synthetic_admin(tmp)
+
+        results = {}
+        for policy in [s.strip() for s in args.policies.split(',') if s.strip()]:
+            # float64 对照组同时关闭 category 键，对应引入 dtype 策略之前的行为
+            categorical = policy != 'float64'
+            results[policy] = _run_child(args, policy, categorical)
+            r = results[policy]
+            rss = f"{r['rss_mb']:.0f}" if r['rss_mb'] is not None else 'n/a'
+            flag = ''
+            if budget is not None and r['peak_mb'] > budget:
+                flag = '  OVER BUDGET'
+                over.append(policy)
+            print(f"{policy:>8}: peak={r['peak_mb']:8.1f} MB  rss={rss:>6} MB  values={r['value_bytes'] / 1024 / 1024:7.1f} MB  "
+                  f"rows={r['rows']} ({r['granularity']})  {r['seconds']:.1f}s{flag}")
+        if 'float32' in results and 'float64' in results:
+            a, b = results['float32']['peak_mb'], results['float64']['peak_mb']
+            print(f"peak reduction float64 -> float32: {b - a:.1f} MB ({(1 - a / b) * 100:.0f}%)")
+
+    if over:
+        print(f"\n{len(over)} policy(ies) exceeded the {budget:.0f} MB per-day peak budget: {', '.join(over)}")
+        sys.exit(1)
+    if budget is not None:
+        print(f"within the {budget:.0f} MB per-day peak budget")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+对比小时成员的几种读取方式的耗时，并校验结果一致。
+
+ - read_nc_from_zip：io_utils 原有路径（按成员名打开，xarray 构建 Dataset 后取 .values）
+ - xarray：build_day_frame 的回退路径（ZipMemberReader + xr.open_dataset(engine='h5netcdf')）
+ - h5py：util/h5_reader.py 的快速路径（预分配 float32 缓冲区）
+
+用法（在 processing 目录下）：
+    python -m src.util.bench_readers path/to/CN-Reanalysis20130101.zip --members 6 --repeat 3
+"""
+import argparse
+import time
+
+import numpy as np
+import xarray as xr
+
+from src.util.io_utils import read_nc_from_zip, ZipMemberReader, cleanup_tmp_dirs
+from src.util import h5_reader
+
+VARS = h5_reader.MEMBER_VARS
+
+
+def _arrays_from_ds(ds):
+    out = {'lat': ds['lat2d'].values, 'lon': ds['lon2d'].values}
+    for v in VARS:
+        if v in ds.variables:
+            out[v] = ds[v].values
+    return out
+
+
+def bench_read_nc_from_zip(zip_path, names):
+    results = []
+    for n in names:
+        ds, tmp_dir = read_nc_from_zip(zip_path, n)
+        try:
+            results.append(_arrays_from_ds(ds))
+        finally:
+            ds.close()
+    cleanup_tmp_dirs()
+    return results
+
+
+def bench_xarray(zip_path, names):
+    results = []
+    with ZipMemberReader(zip_path) as reader:
+        for n in names:
+            with xr.open_dataset(reader.open_member(n), engine='h5netcdf') as ds:
+                results.append(_arrays_from_ds(ds))
+    return results
+
+
+def bench_h5py(zip_path, names):
+    results = []
+    fast = h5_reader.H5MemberReader()
+    with ZipMemberReader(zip_path) as reader:
+        for n in names:
+            # 基准中保留每个成员的结果用于校验，因此不复用缓冲区
+            results.append(fast.read(reader.open_member(n), reuse=False))
+    return results
+
+
+def _max_abs_diff(a, b):
+    worst = 0.0
+    for k, ref in a.items():
+        if k not in b:
+            raise AssertionError(f'{k} 缺失')
+        x = np.asarray(ref, dtype=np.float64).reshape(-1)
+        y = np.asarray(b[k], dtype=np.float64).reshape(-1)
+        if not np.array_equal(np.isnan(x), np.isnan(y)):
+            raise AssertionError(f'{k} 的缺测位置不一致')
+        m = ~np.isnan(x)
+        if m.any():
+            worst = max(worst, float(np.max(np.abs(x[m] - y[m]))))
+    return worst
+
+
+def main():
+    p = argparse.ArgumentParser(description='benchmark hourly member readers')
+    p.add_argument('zip_path', help='CN-Reanalysis 日压缩包')
+    p.add_argument('--members', type=int, default=None, help='只测前 N 个成员（默认全部）')
+    p.add_argument('--repeat', type=int, default=3, help='每种方式重复次数，取最快一次')
+    args = p.parse_args()
+
+    with ZipMemberReader(args.zip_path) as reader:
+        names = sorted(n for n in reader.namelist() if n.lower().endswith('.nc'))
+    if args.members:
+        names = names[:args.members]
+    if not names:
+        raise SystemExit(f'{args.zip_path} 中没有 .nc 成员')
+
+    cases = [('read_nc_from_zip', bench_read_nc_from_zip), ('xarray', bench_xarray)]
+    if h5_reader.available():
+        cases.append(('h5py', bench_h5py))
+    timings = {}
+    outputs = {}
+    for label, fn in cases:
+        best = None
+        for _ in range(max(1, args.repeat)):
+            t0 = time.perf_counter()
+            outputs[label] = fn(args.zip_path, names)
+            dt = time.perf_counter() - t0
+            best = dt if best is None else min(best, dt)
+        timings[label] = best
+
+    base = timings['read_nc_from_zip']
+    print(f"members={len(names)} repeat={args.repeat}")
+    for label, dt in timings.items():
+        print(f"{label:>18}: {dt * 1000 / len(names):8.1f} ms/member  (x{base / dt:.2f} vs read_nc_from_zip)")
+    ref = outputs['read_nc_from_zip']
+    for label, res in outputs.items():
+        if label == 'read_nc_from_zip':
+            continue
+        diff = max(_max_abs_diff(a, b) for a, b in zip(ref, res))
+        print(f"{label:>18}: max |diff| vs read_nc_from_zip = {diff:.3g}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,389 @@
+"""网页地图用的简化、量化边界（TopoJSON 风格的共享弧段）。
+
+前端直接下载完整的 GADM level 2 GeoJSON 绘制底图，体积与解析时间都很大。这里在构建时：
+  1. 把 GADM 多边形按与聚合结果相同的 (省, 市) 键合并（键规则同 admin_weights，地图名称与导出的单元一致），
+     另合并出省界；
+  2. 坐标量化到 quantization × quantization 的整数网格（TopoJSON transform），去掉量化后重合的相邻点；
+  3. 切出共享弧段：某点在各环中的前后邻点不一致时为结点，环在结点处切断，相同（或反向相同）的弧段只存一次；
+  4. 每个容差下对每条弧段做一次保拓扑 Douglas-Peucker（弧段两端固定），相邻单元共用同一条简化边界，
+     不会出现缝隙或重叠；简化后面积塌缩过半的环改用原弧段，面积小于容差平方的小岛/小洞删除
+     （每个单元至少保留最大的一块，飞地连同对应的洞一起保留）。
+每个容差写出 <stem>_<容差>.topo.json（差分编码的整数弧段）与可直接 echarts.registerMap 的
+<stem>_<容差>.json（GeoJSON），并写 .gz 预压缩副本；manifest.json 记录文件、体积、顶点数与面积误差
+（每个单元 |简化面积 − 原面积| / 原面积 与对称差面积 / 原面积 的最大值、均值、95 分位和误差最大的单元）。
+
+用法（在 processing 目录下）：
+    python run_pipeline.py boundaries --tolerances 0.002,0.01,0.05
+"""
+import json
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src import config as _config
+
+MANIFEST = 'manifest.json'
+
+
+def unit_geometries(admin_geojson: str, province: bool = True, debug: bool = False) -> Dict[str, pd.DataFrame]:
+    """{对象名: DataFrame(键列..., geometry)}：市按 (省, 市) 合并，省由各市合并。"""
+    import shapely
+    from .geo_utils import read_admin_polygons
+    from .admin_weights import _representative_city_keys
+
+    gdf = read_admin_polygons(admin_geojson)
+    geoms = np.asarray(gdf.geometry.values, dtype=object)
+    keys = _representative_city_keys(gdf, admin_geojson, debug=debug)
+    ok = keys['province'].notna() & keys['city'].notna()
+    keys = keys.loc[ok, ['province', 'city']].reset_index(drop=True)
+    geoms = geoms[ok.to_numpy()]
+    objects = {}
+    levels = [('city', ['province', 'city'])] + ([('province', ['province'])] if province else [])
+    for name, cols in levels:
+        groups = keys.groupby(cols, sort=True).indices
+        merged = [shapely.union_all(geoms[idx]) if len(idx) > 1 else geoms[idx[0]] for idx in groups.values()]
+        df = pd.DataFrame(list(groups.keys()), columns=cols)
+        df['geometry'] = merged
+        objects[name] = df
+    return objects
+
+
+def _polygon_rings(geom) -> List[List[np.ndarray]]:
+    # 每个多边形一个 [外环, 洞...]，坐标不含闭合点
+    import shapely
+
+    parts = shapely.get_parts(geom)
+    out = []
+    for poly in parts:
+        if shapely.get_type_id(poly) != 3 or shapely.is_empty(poly):
+            continue
+        rings = [shapely.get_exterior_ring(poly)] + [shapely.get_interior_ring(poly, i)
+                                                     for i in range(shapely.get_num_interior_rings(poly))]
+        out.append([shapely.get_coordinates(r)[:-1] for r in rings])
+    return out
+
+
+def _arc_terms(arcs: List[np.ndarray]) -> np.ndarray:
+    # 每条弧段的鞋带公式部分和 Σ(x_i·y_{i+1} − x_{i+1}·y_i)；环由弧段首尾相接而成，
+    # 环的有向面积 = 0.5 × Σ(正向 +、反向 −)，不必逐环拼坐标
+    xy = np.concatenate(arcs).astype(np.float64)
+    seg = xy[:-1, 0] * xy[1:, 1] - xy[1:, 0] * xy[:-1, 1]
+    ends = np.cumsum([len(a) for a in arcs])
+    seg[ends[:-1] - 1] = 0.0  # 跨弧段的“段”不计
+    return np.bincount(np.repeat(np.arange(len(arcs)), [len(a) for a in arcs])[:-1], weights=seg,
+                       minlength=len(arcs))
+
+
+def _ring_area(refs: Sequence[int], terms: np.ndarray) -> float:
+    return 0.5 * abs(sum(terms[r] if r >= 0 else -terms[~r] for r in refs))
+
+
+class Topology:
+    """量化后的共享弧段拓扑：arcs 为整数坐标数组列表，objects 为 {对象: [每个单元: [每个多边形: [每个环: 弧段引用]]]}。
+
+    弧段引用为 TopoJSON 约定：i 为正向，~i（= -i-1）为反向。
+    """
+
+    def __init__(self, objects: Dict[str, pd.DataFrame], quantization: int = 100000):
+        import shapely
+
+        self.quantization = int(quantization)
+        all_geoms = np.concatenate([df['geometry'].to_numpy() for df in objects.values()])
+        x0, y0, x1, y1 = shapely.total_bounds(all_geoms)
+        n = self.quantization - 1
+        self.scale = ((x1 - x0) / n if x1 > x0 else 1.0, (y1 - y0) / n if y1 > y0 else 1.0)
+        self.translate = (float(x0), float(y0))
+        self.properties = {name: df.drop(columns=['geometry']).to_dict('records') for name, df in objects.items()}
+
+        # 全部环的顶点拼成一个数组，环号 -> 单元/多边形位置另记
+        coords, ring_len, where = [], [], []
+        for name, df in objects.items():
+            for u, geom in enumerate(df['geometry']):
+                for p, rings in enumerate(_polygon_rings(geom)):
+                    for r, xy in enumerate(rings):
+                        coords.append(xy)
+                        ring_len.append(len(xy))
+                        where.append((name, u, p, r))
+        q = np.rint((np.concatenate(coords) - self.translate) / self.scale).astype(np.int64) if coords \
+            else np.zeros((0, 2), dtype=np.int64)
+        # 整数网格上的点按一维键去重（比 np.unique(axis=0) 快得多）
+        keys, pid = np.unique(q[:, 0] * self.quantization + q[:, 1], return_inverse=True)
+        self.points = np.stack([keys // self.quantization, keys % self.quantization], axis=1)
+        pid = pid.ravel()
+        ring_len = np.asarray(ring_len, dtype=np.int64)
+
+        # 去掉量化后与前一点重合的顶点，再丢弃不足 3 点的环
+        ring_of = np.repeat(np.arange(ring_len.size), ring_len)
+        starts = np.r_[0, np.cumsum(ring_len)[:-1]]
+        pos = np.arange(pid.size) - starts[ring_of]
+        keep = pid != pid[starts[ring_of] + (pos - 1) % ring_len[ring_of]]
+        keep |= ring_len[ring_of] == 1
+        pid, ring_of = pid[keep], ring_of[keep]
+        ring_len = np.bincount(ring_of, minlength=ring_len.size)
+        starts = np.r_[0, np.cumsum(ring_len)[:-1]]
+
+        # 结点：各次出现的（无序）前后邻点对不一致的点
+        valid = ring_len[ring_of] >= 3
+        pos = np.arange(pid.size) - starts[ring_of]
+        prev = pid[starts[ring_of] + (pos - 1) % np.maximum(ring_len[ring_of], 1)]
+        nxt = pid[starts[ring_of] + (pos + 1) % np.maximum(ring_len[ring_of], 1)]
+        n_pts = np.int64(self.points.shape[0])
+        pair = np.minimum(prev, nxt) * n_pts + np.maximum(prev, nxt)
+        uniq = np.unique(np.stack([pid[valid], pair[valid]], axis=1), axis=0)
+        self.junction = np.bincount(uniq[:, 0], minlength=int(n_pts)) > 1
+
+        self.arcs: List[np.ndarray] = []
+        lookup: Dict[bytes, int] = {}
+        self.objects: Dict[str, List] = {name: [[] for _ in range(len(df))] for name, df in objects.items()}
+        kept = set()
+        for k, (name, u, p, r) in enumerate(where):
+            # 量化后退化的外环连同其洞一起丢弃
+            if ring_len[k] < 3 or (r > 0 and (name, u, p) not in kept):
+                continue
+            refs = self._cut(pid[starts[k]:starts[k] + ring_len[k]], lookup)
+            polys = self.objects[name][u]
+            if r == 0:
+                kept.add((name, u, p))
+                polys.append([refs])
+            else:
+                polys[-1].append(refs)
+        self.terms = _arc_terms(self.arcs) if self.arcs else np.zeros(0)
+
+    def _add_arc(self, seq: np.ndarray, lookup: Dict[bytes, int]) -> int:
+        key = seq.tobytes()
+        i = lookup.get(key)
+        if i is not None:
+            return i
+        i = lookup.get(seq[::-1].tobytes())
+        if i is not None:
+            return ~i
+        lookup[key] = len(self.arcs)
+        self.arcs.append(self.points[seq])
+        return len(self.arcs) - 1
+
+    def _cut(self, ring: np.ndarray, lookup: Dict[bytes, int]) -> List[int]:
+        j = np.flatnonzero(self.junction[ring])
+        if j.size == 0:
+            # 没有结点的环（岛、飞地）整体为一条闭合弧段，从最小点号起切，使共用同一环的单元能匹配（正向或反向）
+            rot = np.roll(ring, -int(np.argmin(ring)))
+            return [self._add_arc(np.r_[rot, rot[:1]], lookup)]
+        rot = np.roll(ring, -int(j[0]))
+        cuts = np.r_[j - j[0], ring.size]
+        closed = np.r_[rot, rot[:1]]
+        return [self._add_arc(closed[a:b + 1], lookup) for a, b in zip(cuts[:-1], cuts[1:])]
+
+    # ---- 简化 ----
+
+    def simplified_arcs(self, tolerance: float) -> List[np.ndarray]:
+        """按容差（度）对每条弧段做保拓扑 Douglas-Peucker，返回整数坐标弧段（两端不变）。"""
+        import shapely
+
+        # 在经纬度上简化（x、y 量化步长不同）；选中的都是原顶点，反量化后再取整即回到原整数坐标
+        lines = shapely.linestrings(np.concatenate(self.arcs) * self.scale + self.translate,
+                                    indices=np.repeat(np.arange(len(self.arcs)), [len(a) for a in self.arcs]))
+        simple = shapely.simplify(lines, tolerance, preserve_topology=True)
+        coords, idx = shapely.get_coordinates(simple, return_index=True)
+        q = np.rint((coords - self.translate) / self.scale).astype(np.int64)
+        bounds = np.r_[0, np.cumsum(np.bincount(idx, minlength=len(self.arcs)))]
+        return [q[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+
+    def _ring_xy(self, refs: Sequence[int], arcs: List[np.ndarray]) -> np.ndarray:
+        parts = []
+        for k, ref in enumerate(refs):
+            arc = arcs[ref] if ref >= 0 else arcs[~ref][::-1]
+            parts.append(arc if k == 0 else arc[1:])
+        return np.concatenate(parts)
+
+    def resolve(self, tolerance: float) -> Tuple[List[np.ndarray], Dict[str, List]]:
+        """返回 (该容差下的弧段, 去掉小岛/小洞后的对象)；面积塌缩的环改用原弧段。"""
+        arcs = self.simplified_arcs(tolerance) if tolerance > 0 else list(self.arcs)
+        min_area = (tolerance / self.scale[0]) * (tolerance / self.scale[1])
+        orig_terms = self.terms
+        for _ in range(2):
+            restored = False
+            terms = _arc_terms(arcs)
+            for polys in (p for units in self.objects.values() for p in units):
+                for rings in polys:
+                    for refs in rings:
+                        orig = _ring_area(refs, orig_terms)
+                        if orig > 0 and _ring_area(refs, terms) < 0.5 * orig:
+                            for ref in refs:
+                                i = ref if ref >= 0 else ~ref
+                                if arcs[i] is not self.arcs[i]:
+                                    arcs[i] = self.arcs[i]
+                                    restored = True
+            if not restored:
+                break
+        drop = self._droppable(min_area)
+        objects = {}
+        for name, units in self.objects.items():
+            objects[name] = [[[rings[0]] + [refs for refs in rings[1:] if not self._dropped(refs, drop)]
+                              for rings in polys if not self._dropped(rings[0], drop)] for polys in units]
+        return arcs, objects
+
+    def _droppable(self, min_area: float) -> set:
+        # 面积小于阈值的闭合弧段环（小岛、小洞）；是某个单元最大一块的外环除外（飞地的外环因此连同对应的洞一起保留）
+        small = {i for i, arc in enumerate(self.arcs)
+                 if len(arc) > 1 and np.array_equal(arc[0], arc[-1]) and _ring_area([i], self.terms) < min_area}
+        for units in self.objects.values():
+            for polys in units:
+                if not polys:
+                    continue
+                areas = [_ring_area(rings[0], self.terms) for rings in polys]
+                refs = polys[int(np.argmax(areas))][0]
+                if len(refs) == 1:
+                    small.discard(refs[0] if refs[0] >= 0 else ~refs[0])
+        return small
+
+    @staticmethod
+    def _dropped(refs: Sequence[int], drop: set) -> bool:
+        return len(refs) == 1 and (refs[0] if refs[0] >= 0 else ~refs[0]) in drop
+
+    # ---- 输出 ----
+
+    def topojson(self, arcs: List[np.ndarray], objects: Dict[str, List]) -> Dict:
+        """TopoJSON（quantized，弧段差分编码）；只保留被引用的弧段并重新编号。"""
+        used = sorted({r if r >= 0 else ~r for units in objects.values() for polys in units
+                       for rings in polys for refs in rings for r in refs})
+        remap = {old: new for new, old in enumerate(used)}
+
+        def ref(r):
+            return remap[r] if r >= 0 else ~remap[~r]
+
+        out_objects = {}
+        for name, units in objects.items():
+            geoms = []
+            for props, polys in zip(self.properties[name], units):
+                arcs_ = [[[ref(r) for r in refs] for refs in rings] for rings in polys]
+                if not arcs_:
+                    geoms.append({'type': None, 'properties': props})
+                elif len(arcs_) == 1:
+                    geoms.append({'type': 'Polygon', 'arcs': arcs_[0], 'properties': props})
+                else:
+                    geoms.append({'type': 'MultiPolygon', 'arcs': arcs_, 'properties': props})
+            out_objects[name] = {'type': 'GeometryCollection', 'geometries': geoms}
+        encoded = []
+        for i in used:
+            a = arcs[i]
+            encoded.append(np.vstack([a[:1], np.diff(a, axis=0)]).tolist())
+        return {'type': 'Topology', 'transform': {'scale': list(self.scale), 'translate': list(self.translate)},
+                'objects': out_objects, 'arcs': encoded}
+
+    def decimals(self) -> int:
+        return int(max(0, np.ceil(-np.log10(min(self.scale)))))
+
+    def geojson(self, arcs: List[np.ndarray], objects: Dict[str, List], name: str = 'city') -> Dict:
+        """单个对象的 GeoJSON FeatureCollection（反量化后按量化步长保留小数位），properties.name 为地图名称。"""
+        dec = self.decimals()
+        feats = []
+        for props, polys in zip(self.properties[name], objects[name]):
+            rings_xy = [[np.round(self._ring_xy(refs, arcs) * self.scale + self.translate, dec).tolist()
+                         for refs in rings] for rings in polys]
+            if not rings_xy:
+                continue
+            geom = {'type': 'Polygon', 'coordinates': rings_xy[0]} if len(rings_xy) == 1 else \
+                {'type': 'MultiPolygon', 'coordinates': rings_xy}
+            feats.append({'type': 'Feature', 'properties': {'name': props.get(name), **props}, 'geometry': geom})
+        return {'type': 'FeatureCollection', 'features': feats}
+
+    def shapes(self, arcs: List[np.ndarray], objects: Dict[str, List], name: str) -> np.ndarray:
+        """对象中每个单元的 shapely 几何（经纬度），用于计算面积误差。"""
+        import shapely
+
+        out = []
+        for polys in objects[name]:
+            parts = []
+            for rings in polys:
+                xy = [self._ring_xy(refs, arcs) * self.scale + self.translate for refs in rings]
+                parts.append(shapely.Polygon(xy[0], xy[1:]))
+            out.append(shapely.make_valid(shapely.multipolygons(parts)) if parts else shapely.Polygon())
+        return np.asarray(out, dtype=object)
+
+    def n_vertices(self, arcs: List[np.ndarray], objects: Dict[str, List]) -> int:
+        used = {r if r >= 0 else ~r for units in objects.values() for polys in units
+                for rings in polys for refs in rings for r in refs}
+        return int(sum(len(arcs[i]) for i in used))
+
+
+def area_errors(original: np.ndarray, simplified: np.ndarray, names: Sequence[str], worst: int = 5) -> Dict:
+    """每个单元的相对面积变化与对称差比例的统计（平面经纬度面积之比，单元内的纬度畸变基本抵消）。"""
+    import shapely
+
+    a0 = shapely.area(original)
+    a1 = shapely.area(simplified)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        change = np.abs(a1 - a0) / a0
+        try:
+            sym = shapely.area(shapely.symmetric_difference(shapely.make_valid(original), simplified)) / a0
+        except Exception:
+            sym = np.full(a0.shape, np.nan)
+    order = np.argsort(-np.nan_to_num(sym, nan=-1.0))[:worst]
+
+    def stats(v):
+        v = v[np.isfinite(v)]
+        if v.size == 0:
+            return {'max': None, 'mean': None, 'p95': None}
+        return {'max': round(float(v.max()), 6), 'mean': round(float(v.mean()), 6),
+                'p95': round(float(np.percentile(v, 95)), 6)}
+
+    return {'area_change': stats(change), 'sym_diff': stats(sym),
+            'worst': [[str(names[i]), round(float(sym[i]), 6)] for i in order if np.isfinite(sym[i])]}
+
+
+def build_boundaries(admin_geojson: Optional[str] = None, out_dir: Optional[str] = None,
+                     tolerances: Optional[Sequence[float]] = None, quantization: Optional[int] = None,
+                     province: bool = True, stem: str = 'china_city', compress: Sequence[str] = ('gz', 'br'),
+                     debug: bool = False) -> Dict:
+    """写出各容差的 TopoJSON/GeoJSON 与 manifest.json，返回 manifest（默认值见 config.BOUNDARY_*）。"""
+    from .echarts_compact import write_precompressed
+
+    admin_geojson = admin_geojson or _config.ADMIN_GEOJSON
+    out_dir = out_dir or _config.BOUNDARY_DIR
+    tolerances = _config.BOUNDARY_TOLERANCES if tolerances is None else tolerances
+    quantization = quantization or _config.BOUNDARY_QUANTIZATION
+
+    objects = unit_geometries(admin_geojson, province=province, debug=debug)
+    topo = Topology(objects, quantization=quantization)
+    os.makedirs(out_dir, exist_ok=True)
+    names = {name: [p.get(name) for p in topo.properties[name]] for name in objects}
+    originals = {name: np.asarray(df['geometry'].to_numpy(), dtype=object) for name, df in objects.items()}
+    manifest = {'version': 1, 'source': os.path.abspath(admin_geojson),
+                'source_bytes': os.path.getsize(admin_geojson), 'quantization': topo.quantization,
+                'transform': {'scale': list(topo.scale), 'translate': list(topo.translate)},
+                'objects': {name: len(df) for name, df in objects.items()},
+                'arcs': len(topo.arcs), 'vertices': topo.n_vertices(topo.arcs, topo.objects), 'levels': []}
+    for tol in tolerances:
+        arcs, objs = topo.resolve(float(tol))
+        label = f'{tol:g}'
+        entry = {'tolerance': float(tol), 'vertices': topo.n_vertices(arcs, objs), 'files': {}, 'area_error': {}}
+        for kind, payload in (('topojson', topo.topojson(arcs, objs)), ('geojson', topo.geojson(arcs, objs, 'city'))):
+            path = os.path.join(out_dir, f'{stem}_{label}.topo.json' if kind == 'topojson' else f'{stem}_{label}.json')
+            data = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            with open(path, 'wb') as fh:
+                fh.write(data)
+            sizes = {'bytes': len(data)}
+            for extra in write_precompressed(path, data, compress):
+                sizes[os.path.splitext(extra)[1][1:] + '_bytes'] = os.path.getsize(extra)
+            entry['files'][kind] = {'path': os.path.basename(path), **sizes}
+        for name in objects:
+            entry['area_error'][name] = area_errors(originals[name], topo.shapes(arcs, objs, name), names[name])
+        manifest['levels'].append(entry)
+    with open(os.path.join(out_dir, MANIFEST), 'w', encoding='utf-8') as fh:
+        json.dump(manifest, fh, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def format_report(manifest: Dict) -> str:
+    lines = [f"source {manifest['source_bytes'] / 1e6:.1f} MB, {manifest['vertices']} vertices in "
+             f"{manifest['arcs']} shared arcs ({', '.join(f'{k}={v}' for k, v in manifest['objects'].items())})"]
+    for lv in manifest['levels']:
+        files = lv['files']
+        err = lv['area_error'].get('city', {})
+        sym, chg = err.get('sym_diff', {}), err.get('area_change', {})
+        lines.append(f"tol {lv['tolerance']:g}: {lv['vertices']} vertices, topojson {files['topojson']['bytes'] / 1e3:.0f} kB"
+                     f" (gz {files['topojson'].get('gz_bytes', 0) / 1e3:.0f} kB), geojson "
+                     f"{files['geojson']['bytes'] / 1e3:.0f} kB | city area change max {chg.get('max')} "
+                     f"mean {chg.get('mean')}, sym diff max {sym.get('max')} p95 {sym.get('p95')}")
+    return '\n'.join(lines)
@@ -0,0 +1,222 @@
+"""长时间序列的多分辨率降采样（趋势 CSV 与分片导出共用）。
+
+每条序列预先生成若干分辨率级别，前端按当前缩放与像素宽度取合适的一级：
+  - 'weekly' / 'monthly'：按周（周一开始，标签为周一日期）/ 自然月（标签为当月 1 日）求 nanmean；
+  - 'lttb_<N>'：Largest-Triangle-Three-Buckets 选出最多 N 个原始点，保留峰谷形状（每个变量单独选点）。
+只生成点数少于原序列的级别（例如月度趋势不再生成 weekly）。
+
+用法（在 processing 目录下）：
+    python -m src.util.downsample --n 5000 --budget 500     # 随机游走序列上比较 LTTB 与均匀抽样的误差
+"""
+import json
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+MS_PER_DAY = 86400000
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """返回 LTTB 选中的点下标（升序，含首尾点）；x 需升序，y 中 NaN 的点不参与选点。"""
+    return lttb_rows(x, np.asarray(y, dtype=np.float64)[None, :], n_out)[0]
+
+
+def lttb_rows(x: np.ndarray, ys: np.ndarray, n_out: int) -> List[np.ndarray]:
+    """对共用 x 的多行 y（k × n）同时做 LTTB，返回每行选中的下标；每行只在自己的非 NaN 点上分桶。
+
+    逐桶的循环对所有行一起做（桶宽不同的行用掩码补齐），下一个桶的均值由累加和一次算出。
+    """
+    x = np.asarray(x, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    k, n = ys.shape
+    valid = ~np.isnan(ys)
+    counts = valid.sum(axis=1)
+    # 每行的有效点前移：pos[r, :counts[r]] 为该行有效点的原下标
+    pos = np.argsort(~valid, axis=1, kind='stable')
+    out: List[np.ndarray] = [pos[r, :counts[r]] for r in range(k)]
+    todo = np.flatnonzero((counts > n_out) & (n_out >= 3))
+    if todo.size == 0:
+        return out
+    pos, c = pos[todo], counts[todo]
+    rows = np.arange(todo.size)[:, None]
+    xv, yv = x[pos], ys[todo[:, None], pos]
+    every = (c - 2) / (n_out - 2)
+    edges = (np.floor(np.arange(n_out - 1)[None, :] * every[:, None]) + 1).astype(np.int64)
+    edges[:, -1] = c - 1
+    # 桶 j 的均值（j = 1 .. n_out-2 对应 edges[j:j+1]），最后一个“桶”为末点
+    cx = np.concatenate([np.zeros((todo.size, 1)), np.cumsum(np.where(np.arange(n)[None, :] < c[:, None], xv, 0), 1)], 1)
+    cy = np.concatenate([np.zeros((todo.size, 1)), np.cumsum(np.where(np.arange(n)[None, :] < c[:, None], yv, 0), 1)], 1)
+    lo_next, hi_next = edges[:, 1:-1], edges[:, 2:]
+    width = hi_next - lo_next
+    avg_x = np.concatenate([(np.take_along_axis(cx, hi_next, 1) - np.take_along_axis(cx, lo_next, 1)) / width,
+                            xv[rows[:, 0], c - 1][:, None]], 1)
+    avg_y = np.concatenate([(np.take_along_axis(cy, hi_next, 1) - np.take_along_axis(cy, lo_next, 1)) / width,
+                            yv[rows[:, 0], c - 1][:, None]], 1)
+    picked = np.empty((todo.size, n_out), dtype=np.int64)
+    picked[:, 0], picked[:, -1] = 0, c - 1
+    a = np.zeros(todo.size, dtype=np.int64)
+    for i in range(n_out - 2):
+        lo, hi = edges[:, i], edges[:, i + 1]
+        idx = lo[:, None] + np.arange(int((hi - lo).max()))[None, :]
+        inside = idx < hi[:, None]
+        idx = np.minimum(idx, n - 1)
+        px, py = np.take_along_axis(xv, idx, 1), np.take_along_axis(yv, idx, 1)
+        ax, ay = xv[rows[:, 0], a][:, None], yv[rows[:, 0], a][:, None]
+        area = np.abs((ax - avg_x[:, i:i + 1]) * (py - ay) - (ax - px) * (avg_y[:, i:i + 1] - ay))
+        a = lo + np.argmax(np.where(inside, area, -1.0), axis=1)
+        picked[:, i + 1] = a
+    for j, r in enumerate(todo):
+        out[r] = pos[j, picked[j]]
+    return out
+
+
+def period_starts(dates: np.ndarray, level: str) -> np.ndarray:
+    """每个日期所在周期的起始日（datetime64[D]）：'weekly' 为周一，'monthly' 为当月 1 日。"""
+    d = np.asarray(dates, dtype='datetime64[D]')
+    if level == 'weekly':
+        days = d.astype(np.int64)
+        # 1970-01-01 是周四：(days + 3) % 7 为距周一的天数
+        return (days - (days + 3) % 7).astype('datetime64[D]')
+    if level == 'monthly':
+        return d.astype('datetime64[M]').astype('datetime64[D]')
+    raise ValueError(f'未知的级别: {level}')
+
+
+def resample_mean(dates: np.ndarray, values: Dict[str, np.ndarray], level: str):
+    """按周/月对已排序的逐日序列求 nanmean，返回 (周期起始日, {变量: 均值})。"""
+    starts = period_starts(dates, level)
+    labels, codes = np.unique(starts, return_inverse=True)
+    out = {}
+    for var, v in values.items():
+        v = np.asarray(v, dtype=np.float64)
+        ok = ~np.isnan(v)
+        sums = np.bincount(codes, weights=np.where(ok, v, 0.0), minlength=labels.size)
+        counts = np.bincount(codes, weights=ok, minlength=labels.size)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out[var] = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+    return labels, out
+
+
+def parse_levels(levels: Sequence[str]) -> List[str]:
+    out = []
+    for lv in levels:
+        lv = str(lv).strip()
+        if lv in ('weekly', 'monthly') or (lv.startswith('lttb_') and lv[5:].isdigit()):
+            out.append(lv)
+        elif lv:
+            raise ValueError(f'未知的级别: {lv}（可用 weekly、monthly、lttb_<点数>）')
+    return out
+
+
+def applicable_levels(dates: np.ndarray, levels: Sequence[str]) -> List[str]:
+    """series_levels 会为这条序列生成的级别（只看日期，不计算数值）。"""
+    d = np.asarray(dates, dtype='datetime64[D]')
+    out = []
+    for lv in parse_levels(levels):
+        n = int(lv[5:]) if lv.startswith('lttb_') else np.unique(period_starts(d, lv)).size
+        if n < d.size:
+            out.append(lv)
+    return out
+
+
+def series_levels(dates: np.ndarray, values: Dict[str, np.ndarray], levels: Sequence[str]) -> Dict[str, Dict]:
+    """为一条（多变量）逐日序列生成各级别。
+
+    weekly/monthly 返回 {'date': 周期起始日[D], 变量: 数组}（各变量共用日期轴）；
+    lttb_<N> 返回 {变量: {'date': 选中日期[D], 'value': 数组}}。点数不少于原序列的级别省略。
+    """
+    return series_levels_many([(dates, values)], levels)[0]
+
+
+def series_levels_many(items: Sequence, levels: Sequence[str]) -> List[Dict[str, Dict]]:
+    """对 [(dates, values)] 逐条生成级别，结果与逐条调用 series_levels 相同；
+    日期轴相同的序列（如同一年的各城市）把全部变量叠成一个矩阵一起做 LTTB。"""
+    out: List[Dict[str, Dict]] = []
+    same_axis: Dict[bytes, List[int]] = {}
+    for i, (dates, values) in enumerate(items):
+        d = np.asarray(dates, dtype='datetime64[D]')
+        out.append({})
+        same_axis.setdefault(d.tobytes(), []).append(i)
+        for lv in applicable_levels(d, levels):
+            if lv.startswith('lttb_'):
+                out[i][lv] = {}
+            else:
+                labels, means = resample_mean(d, values, lv)
+                out[i][lv] = {'date': labels, **means}
+    for members in same_axis.values():
+        d = np.asarray(items[members[0]][0], dtype='datetime64[D]')
+        x = d.astype(np.int64).astype(np.float64)
+        owners = [(i, var) for i in members for var in items[i][1]]
+        if not owners:
+            continue
+        ys = np.stack([np.asarray(items[i][1][var], dtype=np.float64) for i, var in owners])
+        for lv in applicable_levels(d, levels):
+            if not lv.startswith('lttb_'):
+                continue
+            for row, ((i, var), idx) in enumerate(zip(owners, lttb_rows(x, ys, int(lv[5:])))):
+                out[i][lv][var] = {'date': d[idx], 'value': ys[row, idx]}
+    return out
+
+
+def _json_list(arr, decimals: Optional[int] = 3) -> List:
+    a = np.asarray(arr)
+    if a.dtype.kind == 'M':
+        return a.astype('datetime64[D]').astype(str).tolist()
+    if decimals is not None:
+        a = np.round(a.astype(np.float64), decimals)
+    return [None if v != v else v for v in a.tolist()]
+
+
+def level_payload(level: str, data: Dict) -> Dict:
+    """series_levels 的一级转换为可 JSON 序列化的字典（日期为 YYYY-MM-DD）。"""
+    if level.startswith('lttb_'):
+        return {'level': level, 'series': {var: {'date': _json_list(s['date']), 'value': _json_list(s['value'])}
+                                           for var, s in data.items()}}
+    return {'level': level, **{k: _json_list(v) for k, v in data.items()}}
+
+
+def level_files(items: Sequence, levels: Sequence[str]) -> Dict[str, bytes]:
+    """items 为 [(file_stem, dates, values)]，返回各级别的 JSON 内容 {levels/<级别>/<file_stem>.json: bytes}
+    （由调用方决定如何写入）。"""
+    files = {}
+    results = series_levels_many([(dates, values) for _, dates, values in items], levels)
+    for (file_stem, _, _), result in zip(items, results):
+        for lv, data in result.items():
+            files[f"levels/{lv}/{file_stem}.json"] = json.dumps(level_payload(lv, data), ensure_ascii=False,
+                                                                separators=(',', ':')).encode('utf-8')
+    return files
+
+
+def levels_index(index: Dict[str, Dict[str, str]], levels: Sequence[str]) -> Dict[str, bytes]:
+    """levels/index.json 的内容：{levels: [...], series: {名称: {级别: 相对路径}}}。"""
+    data = json.dumps({'levels': parse_levels(levels), 'series': index}, ensure_ascii=False, separators=(',', ':'))
+    return {'levels/index.json': data.encode('utf-8')}
+
+
+def main(argv: Optional[List[str]] = None):
+    """在随机游走序列上比较 LTTB 与均匀抽样：线性插值回原序列后的最大误差与峰值保留情况。"""
+    import argparse
+    import time
+
+    p = argparse.ArgumentParser(description=main.__doc__)
+    p.add_argument('--n', type=int, default=5000)
+    p.add_argument('--budget', type=int, default=500)
+    p.add_argument('--seed', type=int, default=0)
+    args = p.parse_args(argv)
+    rng = np.random.default_rng(args.seed)
+    y = np.cumsum(rng.normal(size=args.n))
+    y[rng.integers(args.n)] += 25  # 一个尖峰
+    x = np.arange(args.n, dtype=np.float64)
+    t0 = time.perf_counter()
+    idx = lttb(x, y, args.budget)
+    dt = time.perf_counter() - t0
+    uni = np.linspace(0, args.n - 1, args.budget).round().astype(np.int64)
+    for label, sel in (('lttb', idx), ('uniform', uni)):
+        err = np.abs(np.interp(x, x[sel], y[sel]) - y)
+        print(f"{label:8s} points={sel.size} max_err={err.max():.3f} mean_err={err.mean():.3f} "
+              f"peak_kept={bool(np.argmax(y) in set(sel.tolist()))}")
+    print(f"lttb {args.n} -> {args.budget} in {dt * 1e3:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
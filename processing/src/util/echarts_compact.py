@@ -0,0 +1,151 @@
+"""紧凑列式的 ECharts 数据包（export --compact）。
+
+map_series_data.json / timeseries_data.json 中每个点都是 [毫秒时间戳, 值]、每条序列都重复名称；这里改为一个文件：
+  - names：字典编码的行政单元名称（province|city 等），序列按下标引用；
+  - time：一条时间轴，等间隔时为 {start, step, count}（step 为毫秒），逐月为 {start, unit: 'month', count}，
+    否则为 {values: [毫秒...]}；
+  - series：{变量: 扁平数组}，按 名称 × 时间 行优先排列，保留 decimals 位小数，缺测为 null；
+  - map：{periods: ['YYYY-MM'...], values: {变量: 扁平数组（周期 × 名称）}}。
+前端取第 i 个名称第 j 个时间点的值为 series[var][i * count + j]。同时写出预压缩的 .gz
+（以及安装了 brotli 时的 .br）副本，静态服务器可直接按 Accept-Encoding 返回；
+echarts_compact.arrow 为同一数据的 Arrow IPC 长表（name 为字典列、time 为 timestamp[ms]、变量为 float32），
+前端用 apache-arrow 读取无需 JSON 解析。
+"""
+import gzip
+import json
+import os
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+COMPACT_NAME = 'echarts_compact'
+_MONTH_MS_MIN, _MONTH_MS_MAX = 28 * 86400000, 31 * 86400000
+_WARNED_BROTLI = False
+
+
+def time_axis(times_ms: np.ndarray) -> Dict:
+    """把升序的唯一毫秒时间戳编码为一条时间轴描述。"""
+    t = np.asarray(times_ms, dtype=np.int64)
+    if t.size == 0:
+        return {'values': []}
+    if t.size == 1:
+        return {'start': int(t[0]), 'step': 0, 'count': 1}
+    diff = np.diff(t)
+    if (diff == diff[0]).all():
+        return {'start': int(t[0]), 'step': int(diff[0]), 'count': int(t.size)}
+    months = t.astype('datetime64[ms]').astype('datetime64[M]')
+    if ((diff >= _MONTH_MS_MIN) & (diff <= _MONTH_MS_MAX)).all() and (np.diff(months.astype(np.int64)) == 1).all() \
+            and (months.astype('datetime64[ms]').astype(np.int64) == t).all():
+        return {'start': int(t[0]), 'unit': 'month', 'count': int(t.size)}
+    return {'values': t.tolist()}
+
+
+def _pivot_mean(rows: np.ndarray, cols: np.ndarray, n_rows: int, n_cols: int, values: np.ndarray) -> np.ndarray:
+    # 返回 (n_rows, n_cols)；同一 (行, 列) 有多条记录时取均值（跳过 NaN），没有记录为 NaN
+    v = np.asarray(values, dtype=np.float64)
+    ok = ~np.isnan(v)
+    flat = rows.astype(np.int64) * n_cols + cols
+    sums = np.bincount(flat, weights=np.where(ok, v, 0.0), minlength=n_rows * n_cols)
+    counts = np.bincount(flat, weights=ok, minlength=n_rows * n_cols)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan).reshape(n_rows, n_cols)
+
+
+def _rounded(arr: np.ndarray, decimals: int) -> List:
+    vals = np.round(arr, decimals).ravel().tolist()
+    return [None if v != v else v for v in vals]
+
+
+def build_compact_payload(names: np.ndarray, values: Dict[str, np.ndarray], times: Optional[np.ndarray] = None,
+                          periods: Optional[np.ndarray] = None, keys: Sequence[str] = (), decimals: int = 2):
+    """names/times（datetime64）/periods（'YYYY-MM' 或 None）/values 为逐行数组；
+    返回 (payload 字典, Arrow 表所需的 (名称, 毫秒时间轴, {变量: 名称 × 时间})；无时间时为 None)。
+    """
+    uniq_names, name_codes = np.unique(np.asarray(names, dtype=str), return_inverse=True)
+    payload = {'version': 1, 'keys': list(keys), 'names': uniq_names.tolist(), 'metrics': list(values),
+               'decimals': int(decimals)}
+    cells = None
+    if times is not None:
+        times = np.asarray(times, dtype='datetime64[ms]')
+        ok = ~np.isnat(times)
+        uniq_t, t_codes = np.unique(times[ok].astype(np.int64), return_inverse=True)
+        payload['time'] = time_axis(uniq_t)
+        series, grids = {}, {}
+        for m, v in values.items():
+            grids[m] = _pivot_mean(name_codes[ok], t_codes, uniq_names.size, uniq_t.size, v[ok])
+            series[m] = _rounded(grids[m], decimals)
+        payload['series'] = series
+        cells = (uniq_names, uniq_t, grids)
+    if periods is not None:
+        has = np.array([p is not None and p == p for p in periods], dtype=bool)
+        uniq_p, p_codes = np.unique(np.asarray(periods[has], dtype=str), return_inverse=True)
+        payload['map'] = {'periods': uniq_p.tolist(),
+                          'values': {m: _rounded(_pivot_mean(p_codes, name_codes[has], uniq_p.size, uniq_names.size,
+                                                             v[has]), decimals) for m, v in values.items()}}
+    return payload, cells
+
+
+def write_precompressed(path: str, data: bytes, formats: Sequence[str] = ('gz', 'br')) -> List[str]:
+    """写出 data 的 .gz / .br 副本（brotli 未安装时跳过 .br），返回写出的路径。"""
+    out = []
+    for fmt in formats:
+        if fmt == 'gz':
+            with open(path + '.gz', 'wb') as fh:
+                # mtime=0 使相同内容的压缩结果逐字节一致；级别 9 比 6 慢数倍而体积只小 1~2%
+                fh.write(gzip.compress(data, compresslevel=6, mtime=0))
+            out.append(path + '.gz')
+        elif fmt == 'br':
+            try:
+                import brotli
+            except ImportError:
+                global _WARNED_BROTLI
+                if not _WARNED_BROTLI:
+                    print("[echarts] brotli 未安装，跳过 .br（pip install brotli）")
+                    _WARNED_BROTLI = True
+                continue
+            with open(path + '.br', 'wb') as fh:
+                fh.write(brotli.compress(data, quality=11))
+            out.append(path + '.br')
+    return out
+
+
+def write_arrow(path: str, cells, decimals: int) -> Optional[str]:
+    """把 名称 × 时间 的格网写成 Arrow IPC 文件（只保留至少有一个变量非缺测的格）；pyarrow 不可用时返回 None。"""
+    try:
+        import pyarrow as pa
+    except ImportError:
+        print("[echarts] pyarrow 不可用，跳过 Arrow 输出")
+        return None
+    names, times, grids = cells
+    stacked = np.stack(list(grids.values())) if grids else np.empty((0, names.size, times.size))
+    keep = ~np.isnan(stacked).all(axis=0)
+    ni, ti = np.nonzero(keep)
+    columns = {'name': pa.DictionaryArray.from_arrays(pa.array(ni.astype(np.int32)), pa.array(names.tolist())),
+               'time': pa.array(times[ti], type=pa.timestamp('ms'))}
+    for m, g in grids.items():
+        columns[m] = pa.array(np.round(g[ni, ti], decimals).astype(np.float32), from_pandas=True)
+    table = pa.table(columns)
+    with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return path
+
+
+def write_compact_payload(output_dir: str, names: np.ndarray, values: Dict[str, np.ndarray],
+                          times: Optional[np.ndarray] = None, periods: Optional[np.ndarray] = None,
+                          keys: Sequence[str] = (), decimals: int = 2, compress: Sequence[str] = ('gz', 'br'),
+                          arrow: bool = True) -> List[str]:
+    """写出 echarts_compact.json（及预压缩副本）与 echarts_compact.arrow，返回写出的路径。"""
+    payload, cells = build_compact_payload(names, values, times=times, periods=periods, keys=keys,
+                                           decimals=decimals)
+    path = os.path.join(output_dir, f'{COMPACT_NAME}.json')
+    data = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    with open(path, 'wb') as fh:
+        fh.write(data)
+    written = [path] + write_precompressed(path, data, compress)
+    if arrow and cells is not None:
+        arrow_path = write_arrow(os.path.join(output_dir, f'{COMPACT_NAME}.arrow'), cells, decimals)
+        if arrow_path:
+            written.append(arrow_path)
+            with open(arrow_path, 'rb') as fh:
+                written += write_precompressed(arrow_path, fh.read(), compress)
+    return written
@@ -0,0 +1,146 @@
+"""按视图分片的 ECharts 导出（export --sharded）。
+
+前端一次只显示一个指标的一个月地图、或一个省内各市的一个指标曲线，没必要下载整年的全部数据。分片布局：
+  map/<指标>/<YYYY-MM>.json        该周期全部单元的 [{name, value}]（ECharts 地图序列）
+  series/<指标>/<单元 id>.json      一个顶层单元（省，或 admin_name）内各序列的 [{name, type, data: [[毫秒, 值]]}]
+  series_<级别>/<指标>/<单元 id>.json  同一分片的降采样级别（weekly/monthly/lttb_<N>，见 util.downsample）
+  manifest.json                    指标、周期、单元名称 -> {id, 序列名称} 以及上述路径模板
+只有能减少最长序列点数的级别才会写出（月度输入不生成 weekly 等），级别内较短的序列保持原样。
+单元 id 为 u000 形式，避免 URL 中的中文转义问题。每个分片逐条 json.dumps 后写入文件，
+导出过程中不会把整年的嵌套列表同时留在内存里。
+"""
+import json
+import os
+import shutil
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+MANIFEST = 'manifest.json'
+MAP_PATH = 'map/{metric}/{period}.json'
+SERIES_PATH = 'series/{metric}/{unit}.json'
+SERIES_LEVEL_PATH = 'series_{level}/{metric}/{unit}.json'
+
+
+def write_json_items(path: str, items: Iterable) -> int:
+    """把可迭代的条目逐条编码写成一个 JSON 数组，返回条目数。"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    n = 0
+    with open(path, 'w', encoding='utf-8') as fh:
+        fh.write('[')
+        for item in items:
+            if n:
+                fh.write(',')
+            fh.write(json.dumps(item, ensure_ascii=False, separators=(',', ':')))
+            n += 1
+        fh.write(']')
+    return n
+
+
+def write_json_pairs(path: str, pairs: Iterable[Tuple[str, object]]) -> int:
+    """把可迭代的 (键, 值) 逐对编码写成一个 JSON 对象，返回键数。"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    n = 0
+    with open(path, 'w', encoding='utf-8') as fh:
+        fh.write('{')
+        for key, value in pairs:
+            if n:
+                fh.write(',')
+            fh.write(json.dumps(str(key), ensure_ascii=False))
+            fh.write(':')
+            fh.write(json.dumps(value, ensure_ascii=False, separators=(',', ':')))
+            n += 1
+        fh.write('}')
+    return n
+
+
+def group_bounds(labels: np.ndarray) -> List[Tuple[int, int]]:
+    """已排序标签数组中每段相同值的 [起, 止) 区间（visualize 与趋势 CSV 共用）。"""
+    if len(labels) == 0:
+        return []
+    starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+    return list(zip(starts.tolist(), np.r_[starts[1:], len(labels)].tolist()))
+
+
+def json_values(arr: np.ndarray) -> List:
+    """NaN -> None，其余转为 Python 数值。"""
+    return [None if v != v else v for v in np.asarray(arr).tolist()]
+
+
+def _active_levels(levels: Sequence[str], ts_ms: np.ndarray, bounds) -> List[str]:
+    from .downsample import parse_levels, period_starts
+
+    longest = max((y - x for x, y in bounds), default=0)
+    days = np.asarray(ts_ms, dtype='datetime64[ms]').astype('datetime64[D]')
+    out = []
+    for lv in parse_levels(levels):
+        if lv.startswith('lttb_'):
+            if longest > int(lv[5:]):
+                out.append(lv)
+        elif np.unique(period_starts(days, lv)).size < np.unique(ts_ms).size:
+            out.append(lv)
+    return out
+
+
+def _level_points(level: str, ms: np.ndarray, values: np.ndarray) -> List:
+    # 一条序列的某一级别：[[毫秒, 值]]
+    from .downsample import lttb, resample_mean
+
+    if level.startswith('lttb_'):
+        idx = lttb(ms.astype(np.float64), values, int(level[5:]))
+        return list(map(list, zip(ms[idx].tolist(), json_values(np.asarray(values)[idx]))))
+    labels, means = resample_mean(ms.astype('datetime64[ms]').astype('datetime64[D]'), {'v': values}, level)
+    return list(map(list, zip(labels.astype('datetime64[ms]').astype(np.int64).tolist(), json_values(means['v']))))
+
+
+def write_echarts_shards(out_dir: str, keys: Sequence[str], metrics: Sequence[str],
+                         map_periods: np.ndarray, map_names: np.ndarray, map_values: Dict[str, np.ndarray],
+                         ts_units: Optional[np.ndarray] = None, ts_names: Optional[np.ndarray] = None,
+                         ts_ms: Optional[np.ndarray] = None, ts_values: Optional[Dict[str, np.ndarray]] = None,
+                         levels: Sequence[str] = ()) -> Dict:
+    """写出全部分片与 manifest，返回 manifest。
+
+    map_* 为按 (周期, 名称) 排序的逐行数组；ts_* 为按 (单元, 名称, 时间) 排序的逐行数组（无时间时为 None）。
+    out_dir 下原有的分片会先被清空，避免残留已不存在的周期或单元。
+    """
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {'version': 1, 'keys': list(keys), 'metrics': list(metrics), 'map': MAP_PATH,
+                'series': SERIES_PATH if ts_units is not None else None, 'series_levels': {}, 'periods': [],
+                'units': {}}
+
+    map_bounds = group_bounds(map_periods)
+    manifest['periods'] = [str(map_periods[a]) for a, _ in map_bounds]
+    names = map_names.tolist()
+    for m in metrics:
+        vals = json_values(map_values[m])
+        for a, b in map_bounds:
+            path = os.path.join(out_dir, MAP_PATH.format(metric=m, period=map_periods[a]))
+            write_json_items(path, ({'name': n, 'value': v} for n, v in zip(names[a:b], vals[a:b])))
+
+    if ts_units is not None:
+        unit_bounds = group_bounds(ts_units)
+        name_bounds = [[(a + x, a + y) for x, y in group_bounds(ts_names[a:b])] for a, b in unit_bounds]
+        for i, ((a, _), series) in enumerate(zip(unit_bounds, name_bounds)):
+            manifest['units'][str(ts_units[a])] = {'id': f'u{i:03d}', 'names': [str(ts_names[x]) for x, _ in series]}
+        ms = ts_ms.tolist()
+        for m in metrics:
+            vals = json_values(ts_values[m])
+            for i, series in enumerate(name_bounds):
+                path = os.path.join(out_dir, SERIES_PATH.format(metric=m, unit=f'u{i:03d}'))
+                write_json_items(path, ({'name': str(ts_names[x]), 'type': 'line',
+                                         'data': list(map(list, zip(ms[x:y], vals[x:y])))} for x, y in series))
+        for lv in _active_levels(levels, ts_ms, [b for series in name_bounds for b in series]):
+            template = SERIES_LEVEL_PATH.format(level=lv, metric='{metric}', unit='{unit}')
+            manifest['series_levels'][lv] = template
+            for m in metrics:
+                for i, series in enumerate(name_bounds):
+                    path = os.path.join(out_dir, template.format(metric=m, unit=f'u{i:03d}'))
+                    write_json_items(path, ({'name': str(ts_names[x]), 'type': 'line',
+                                             'data': _level_points(lv, ts_ms[x:y], ts_values[m][x:y])}
+                                            for x, y in series))
+
+    with open(os.path.join(out_dir, MANIFEST), 'w', encoding='utf-8') as fh:
+        json.dump(manifest, fh, ensure_ascii=False, separators=(',', ':'))
+    return manifest
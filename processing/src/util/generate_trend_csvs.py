@@ -13,12 +13,27 @@
   资源/趋势/城市/Beijing_monthly.csv
   资源/趋势/city/Beijing_daily.csv
 列：日期、pm25、pm10、so2、no2、co、o3、temp、rh、psfc、u、v
+
+全部单元在一次 groupby 中按整数日期编码求均值，整张结果表只格式化一次再按单元切分。
+同一目录另写合并的 trends_{monthly,daily}.bin（每个单元一段 int32 日期编码 + float32 数值）与
+trends_*.json 偏移索引，read_trend_series 可随机读取单个单元。各单元的摘要记录在 .trend_hashes.json，
+分组结果未变的单元不再格式化和重写；其余文件由线程池并行写出（config.TREND_WRITE_WORKERS）。
 """
 import argparse
+import hashlib
 import os
 import glob
-import pandas as pd
 import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .echarts_shards import group_bounds
+except ImportError:
+    # 以独立脚本运行（无 src 包）时脚本所在目录在 sys.path 上
+    from echarts_shards import group_bounds
 
 
 DEFAULT_VARS = ['pm25','pm10','so2','no2','co','o3','temp','rh','psfc','u','v']
@@ -81,87 +96,293 @@ def read_processed_daily(year):
     return pd.DataFrame()
 
 
-def produce_monthly_trends(df, out_dir, group_field='province'):
-    """Group by group_field and __period (YYYY-MM) and compute mean for variables."""
-    if df.empty:
-        return
-    g = df.copy()
-    # ensure period exists (aggregated has __period; for processed we create YYYY-MM from time)
-    if '__period' not in g.columns:
-        if 'time' in g.columns:
-            g['__period'] = g['time'].astype(str).apply(lambda s: (s[:7] if len(s) >= 7 else s))
-        else:
-            g['__period'] = 'unknown'
-    # normalize group field
+def sanitize_filename(s):
+    # remove characters invalid on Windows filenames: <>:"/\\|?* and control chars
+    bad = '<>:"/\\|?*'
+    out = ''.join((c if c not in bad and ord(c) >= 32 else '_') for c in str(s))
+    # also strip surrounding whitespace and collapse consecutive underscores
+    out = out.strip()
+    while '__' in out:
+        out = out.replace('__', '_')
+    if not out:
+        out = 'item'
+    return out
+
+
+def _norm_day(x):
+    s = str(x)
+    # try YYYYMMDD or ISO
+    if len(s) >= 8 and s[:8].isdigit():
+        return s[:4] + '-' + s[4:6] + '-' + s[6:8]
+    return s[:10]
+
+
+def _norm_month(x):
+    s = str(x)
+    return s[:7] if len(s) >= 7 else s
+
+
+def _date_codes(values, norm):
+    """时间列 -> (每行整数编码, 有序的唯一日期标签)。
+
+    字符串归一化只对唯一值做一次；标签按字符串排序，编码顺序即 YYYY-MM(-DD) 的时间顺序。
+    """
+    codes, uniq = pd.factorize(np.asarray(values, dtype=object), use_na_sentinel=False)
+    labels, inverse = np.unique(np.array([norm(u) for u in uniq], dtype=object).astype(str), return_inverse=True)
+    return inverse[codes], labels
+
+
+def _config_value(name, default):
+    # 以独立脚本运行（无 src 包）时使用默认值
+    try:
+        from src import config
+    except ImportError:
+        return default
+    return getattr(config, name, default)
+
+
+def _group_means(df, group_field, date_codes, vars_present):
+    """一次 groupby 求 (单元, 日期) 均值；返回 (单元名称, 单元编码, 日期编码, 均值表)，按 (单元名称, 日期) 排序。"""
+    keys, names = pd.factorize(df[group_field], sort=True)
+    ok = keys >= 0
+    agg = df.loc[ok, vars_present].groupby([keys[ok], date_codes[ok]], sort=True).mean()
+    return (np.asarray(names), agg.index.get_level_values(0).to_numpy(), agg.index.get_level_values(1).to_numpy(),
+            agg)
+
+
+def _csv_files(names, keys, bounds, frame, suffix):
+    """整张表只调用一次 to_csv，再按单元切行，得到与逐组 to_csv 相同的文件内容。"""
+    text = frame.to_csv(index=False, lineterminator=os.linesep)
+    lines = text.split(os.linesep)
+    header, rows = lines[0], lines[1:-1]
+    files = {}
+    for a, b in bounds:
+        body = os.linesep.join([header] + rows[a:b]) + os.linesep
+        files[f"{sanitize_filename(names[keys[a]])}_{suffix}.csv"] = body.encode('utf-8')
+    return files
+
+
+# 合并二进制文件：每个单元一段 int32 日期编码（自 1970-01-01 的天数；monthly 为自 1970-01 的月数，无法解析为
+# INT32_MIN）后接 float32 的 count × 变量 数组（行优先，均为小端）；trends_<kind>.json 记录各单元的 [字节偏移, 点数]
+_NO_DATE = np.iinfo(np.int32).min
+
+
+def _label_dates(labels, unit):
+    parsed = pd.to_datetime(pd.Series(labels), errors='coerce', format='%Y-%m' if unit == 'M' else '%Y-%m-%d')
+    return parsed.to_numpy().astype(f'datetime64[{unit}]')
+
+
+def _binary_files(kind, names, keys, date_codes, bounds, values, vars_present, label_dates):
+    unit = np.datetime_data(label_dates.dtype)[0]
+    date_ints = np.where(np.isnat(label_dates), _NO_DATE, label_dates.astype(np.int64)).astype(np.int32)
+    chunks, series, offset = [], {}, 0
+    for a, b in bounds:
+        block = (date_ints[date_codes[a:b]].astype('<i4').tobytes()
+                 + np.ascontiguousarray(values[a:b], dtype='<f4').tobytes())
+        series[str(names[keys[a]])] = [offset, b - a]
+        chunks.append(block)
+        offset += len(block)
+    index = {'version': 1, 'kind': kind, 'date_unit': 'month' if unit == 'M' else 'day', 'vars': list(vars_present),
+             'series': series}
+    return {f"trends_{kind}.bin": b''.join(chunks),
+            f"trends_{kind}.json": json.dumps(index, ensure_ascii=False, separators=(',', ':')).encode('utf-8')}
+
+
+def read_trend_series(out_dir, kind, name):
+    """按索引从 trends_<kind>.bin 随机读取一个单元，返回 (日期 datetime64, {变量: float32 数组})。"""
+    with open(os.path.join(out_dir, f"trends_{kind}.json"), encoding='utf-8') as fh:
+        index = json.load(fh)
+    offset, count = index['series'][name]
+    n_vars = len(index['vars'])
+    path = os.path.join(out_dir, f"trends_{kind}.bin")
+    codes = np.fromfile(path, dtype='<i4', count=count, offset=offset)
+    values = np.fromfile(path, dtype='<f4', count=count * n_vars, offset=offset + 4 * count)
+    values = values.reshape(count, n_vars)
+    dates = codes.astype('datetime64[M]' if index['date_unit'] == 'month' else 'datetime64[D]')
+    dates[codes == _NO_DATE] = np.datetime64('NaT')
+    return dates, {v: values[:, i] for i, v in enumerate(index['vars'])}
+
+
+HASH_FILE = '.trend_hashes.json'
+
+
+def _load_hashes(out_dir):
+    try:
+        with open(os.path.join(out_dir, HASH_FILE), encoding='utf-8') as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def stale_files(out_dir, digests):
+    """{相对路径: 内容摘要} 中需要重写的路径：摘要与上次写入时不同，或文件已不存在。"""
+    known = _load_hashes(out_dir)
+    return {rel for rel, h in digests.items()
+            if known.get(rel) != h or not os.path.exists(os.path.join(out_dir, rel))}
+
+
+def _write_bytes(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+
+
+def write_files(out_dir, files, digests, workers=None):
+    """并行写出 {相对路径: bytes}，并把对应摘要合并进 out_dir/.trend_hashes.json（同一目录的月度与逐日趋势共用）。"""
+    workers = workers or _config_value('TREND_WRITE_WORKERS', 8)
+    items = [(os.path.join(out_dir, rel), data) for rel, data in files.items()]
+    if len(items) > 1 and workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            list(ex.map(lambda item: _write_bytes(*item), items))
+    else:
+        for path, data in items:
+            _write_bytes(path, data)
+    if files:
+        known = _load_hashes(out_dir)
+        known.update({rel: digests[rel] for rel in files})
+        _write_bytes(os.path.join(out_dir, HASH_FILE), json.dumps(known, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+
+
+def _digest(*parts):
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def _trend_levels(levels):
+    # 降采样级别默认取 config.TREND_LEVELS；以独立脚本运行（无 src 包）时不生成级别
+    try:
+        from .downsample import applicable_levels, level_files, levels_index
+    except ImportError:
+        return (), None, None, None
+    if levels is None:
+        levels = _config_value('TREND_LEVELS', ())
+    return levels, applicable_levels, level_files, levels_index
+
+
+def _trend_means(g, group_field, norm, date_col):
+    """(单元, 日期) 均值长表：group_field, date, 变量...，按 (单元名称, 日期) 排序；没有变量时返回 None。"""
     if group_field not in g.columns:
-        g[group_field] = g.get('province') if group_field == 'province' else g.get('city')
+        g = g.assign(**{group_field: g.get('province') if group_field == 'province' else g.get('city')})
     vars_present = [v for v in DEFAULT_VARS if v in g.columns]
     if not vars_present:
-        print('No numeric variables found to aggregate for monthly trends.')
+        return None
+    date_codes, labels = _date_codes(g[date_col], norm)
+    names, keys, codes, agg = _group_means(g, group_field, date_codes, vars_present)
+    frame = pd.DataFrame({group_field: names[keys], 'date': labels[codes]})
+    for v in vars_present:
+        frame[v] = agg[v].to_numpy()
+    return frame
+
+
+def trend_means(df, group_field, kind):
+    """一段数据的 (单元, 日期) 均值（kind 为 'monthly' 或 'daily'，日期列的选择同 produce_*_trends）。
+
+    各段的日期互不重叠时（流水线中每段是一个月），分段求均值再用 merge_trend_means 合并，与对整表求均值相同；
+    最后由 write_trend_means 写出。没有可用的变量或日期列时返回 None。
+    """
+    if df.empty:
+        return None
+    if kind == 'daily':
+        return _trend_means(df, group_field, _norm_day, 'time') if 'time' in df.columns else None
+    # ensure period exists (aggregated has __period; for processed we create YYYY-MM from time)
+    if '__period' in df.columns:
+        return _trend_means(df, group_field, _norm_month, '__period')
+    if 'time' in df.columns:
+        return _trend_means(df, group_field, _norm_month, 'time')
+    return _trend_means(df.assign(__period='unknown'), group_field, str, '__period')
+
+
+def merge_trend_means(parts, group_field):
+    """按单元名称稳定排序拼接各段的 trend_means（各段按日期先后给出，单元内日期仍有序）。"""
+    parts = [p for p in parts if p is not None and len(p)]
+    if not parts:
+        return None
+    if len(parts) == 1:
+        return parts[0]
+    frame = pd.concat(parts, ignore_index=True)
+    order = np.argsort(frame[group_field].to_numpy(dtype=object).astype(str), kind='stable')
+    return frame.iloc[order].reset_index(drop=True)
+
+
+def write_trend_means(frame, out_dir, group_field, kind, levels=()):
+    """把 (单元, 日期) 均值长表写成各单元 CSV、合并二进制与降采样级别文件（内容未变的不重写）。"""
+    if frame is None or frame.empty:
+        print(f'No numeric variables found to aggregate for {kind} trends.')
         return
-    grp = g.groupby([group_field, '__period'])[vars_present].mean().reset_index()
-    ensure_dir(out_dir)
-    # write one CSV per group (province/city)
-    def sanitize_filename(s):
-        # remove characters invalid on Windows filenames: <>:"/\\|?* and control chars
-        bad = '<>:"/\\|?*'
-        out = ''.join((c if c not in bad and ord(c) >= 32 else '_') for c in str(s))
-        # also strip surrounding whitespace and collapse consecutive underscores
-        out = out.strip()
-        while '__' in out:
-            out = out.replace('__', '_')
-        if not out:
-            out = 'item'
-        return out
-
-    for name, group in grp.groupby(group_field):
+    vars_present = [v for v in frame.columns if v not in (group_field, 'date')]
+    keys, names = pd.factorize(frame[group_field], sort=True)
+    names = np.asarray(names)
+    labels, codes = np.unique(frame['date'].to_numpy(dtype=object).astype(str), return_inverse=True)
+    agg = frame[vars_present]
+    bounds = group_bounds(keys)
+    label_dates = _label_dates(labels, 'M' if kind == 'monthly' else 'D')
+    levels, level_names, level_files, levels_index = _trend_levels(levels)
+
+    # 每个单元的摘要只由分组结果决定：未变化的单元既不格式化 CSV，也不重算降采样级别
+    header = (group_field, kind, *vars_present, *(str(frame[v].dtype) for v in vars_present))
+    files, digests, owners = {}, {}, {}
+    level_index = {}
+    for i, (a, b) in enumerate(bounds):
+        name = names[keys[a]]
         safe = sanitize_filename(name)
-        out_path = os.path.join(out_dir, f"{safe}_monthly.csv")
-        group = group.rename(columns={'__period': 'date'})
-        group = group.sort_values('date')
-        group.to_csv(out_path, index=False)
-        print('Wrote', out_path)
+        key = _digest(*header, name, labels[codes[a:b]].astype(str).tobytes(), agg.iloc[a:b].to_numpy().tobytes())
+        rels = [f"{safe}_{kind}.csv"]
+        if levels:
+            dates = label_dates[codes[a:b]]
+            level_rels = {lv: f"levels/{lv}/{safe}.json" for lv in level_names(dates[~np.isnat(dates)], levels)}
+            level_index[str(name)] = {kind: rels[0], **level_rels}
+            rels += list(level_rels.values())
+        for rel in rels:
+            digests[rel] = _digest(rel, key)
+            owners[rel] = i
+    binary = _binary_files(kind, names, keys, codes, bounds, agg.to_numpy(), vars_present, label_dates)
+    if levels:
+        binary.update(levels_index(level_index, levels))
+    digests.update({rel: _digest(data) for rel, data in binary.items()})
 
+    stale = stale_files(out_dir, digests)
+    csv_series = sorted({owners[rel] for rel in stale if rel.endswith('.csv') and rel in owners})
+    if csv_series:
+        rows = np.concatenate([np.arange(*bounds[i]) for i in csv_series])
+        sub_keys = keys[rows]
+        files.update(_csv_files(names, sub_keys, group_bounds(sub_keys), frame.iloc[rows], kind))
+    level_series = []
+    for i in sorted({owners[rel] for rel in stale if rel in owners and not rel.endswith('.csv')}):
+        a, b = bounds[i]
+        dates = label_dates[codes[a:b]]
+        ok = ~np.isnat(dates)
+        level_series.append((sanitize_filename(names[keys[a]]), dates[ok],
+                             {v: frame[v].to_numpy()[a:b][ok] for v in vars_present}))
+    if level_series:
+        files.update({rel: data for rel, data in level_files(level_series, levels).items() if rel in stale})
+    files.update({rel: data for rel, data in binary.items() if rel in stale})
+    write_files(out_dir, files, digests)
+    print(f'Wrote {len(files)} {kind} trend files to {out_dir} ({len(digests) - len(files)} unchanged, '
+          f'{len(bounds)} series)')
 
-def produce_daily_trends(df, out_dir, group_field='city'):
+
+def produce_monthly_trends(df, out_dir, group_field='province'):
+    """Group by group_field and __period (YYYY-MM) and compute mean for variables."""
     if df.empty:
         return
-    g = df.copy()
-    if 'time' not in g.columns:
-        print('No time column for daily trends')
+    write_trend_means(trend_means(df, group_field, 'monthly'), out_dir, group_field, 'monthly')
+
+
+def produce_daily_trends(df, out_dir, group_field='city', levels=None):
+    """按 group_field 与日期求均值，每个单元写一个 <名称>_daily.csv，并写合并的 trends_daily.bin/.json；
+    levels（默认 config.TREND_LEVELS）另写 levels/<级别>/<名称>.json 的周/月/LTTB 降采样与 levels/index.json。
+    内容与上次相同的文件不重写。"""
+    if df.empty:
         return
-    # normalize time to YYYY-MM-DD
-    def norm_day(x):
-        s = str(x)
-        # try YYYYMMDD or ISO
-        if len(s) >= 8 and s[:8].isdigit():
-            return s[:4] + '-' + s[4:6] + '-' + s[6:8]
-        return s[:10]
-    g['__day'] = g['time'].apply(norm_day)
-    if group_field not in g.columns:
-        g[group_field] = g.get('city')
-    vars_present = [v for v in DEFAULT_VARS if v in g.columns]
-    if not vars_present:
-        print('No numeric variables found to aggregate for daily trends.')
+    if 'time' not in df.columns:
+        print('No time column for daily trends')
         return
-    grp = g.groupby([group_field, '__day'])[vars_present].mean().reset_index()
-    ensure_dir(out_dir)
-    for name, group in grp.groupby(group_field):
-        def sanitize_filename(s):
-            bad = '<>:"/\\|?*'
-            out = ''.join((c if c not in bad and ord(c) >= 32 else '_') for c in str(s))
-            out = out.strip()
-            while '__' in out:
-                out = out.replace('__', '_')
-            if not out:
-                out = 'item'
-            return out
-        safe = sanitize_filename(name)
-        out_path = os.path.join(out_dir, f"{safe}_daily.csv")
-        group = group.rename(columns={'__day': 'date'})
-        group = group.sort_values('date')
-        group.to_csv(out_path, index=False)
-        print('Wrote', out_path)
+    write_trend_means(trend_means(df, group_field, 'daily'), out_dir, group_field, 'daily', levels=levels)
 
 
 def main():
@@ -1,8 +1,9 @@
 import geopandas as gpd
+import numpy as np
 import pandas as pd
 import re
-from shapely.geometry import Point
 import os
+import sys
 
 # Simple in-memory cache to avoid re-reading/parsing the same GeoJSON on every call.
 # Keyed by absolute path. Stores GeoDataFrame already converted to EPSG:4326.
@@ -24,6 +25,21 @@ def _choose_admin_name_column(gdf):
     return gdf.columns[0]
 
 
+def read_admin_polygons(admin_geojson_path: str) -> gpd.GeoDataFrame:
+    """读取（并按绝对路径缓存）行政区 GeoJSON，统一为 EPSG:4326。"""
+    abs_path = os.path.abspath(admin_geojson_path)
+    if abs_path in _GADM_CACHE:
+        return _GADM_CACHE[abs_path]
+    gdf_admin = gpd.read_file(abs_path)
+    # 确保crs是WGS84
+    try:
+        gdf_admin = gdf_admin.to_crs(epsg=4326)
+    except Exception:
+        pass
+    _GADM_CACHE[abs_path] = gdf_admin
+    return gdf_admin
+
+
 def map_points_to_admin(df: pd.DataFrame, admin_geojson_path: str, level: str = 'city') -> pd.DataFrame:
     """将 df 中的经纬度点映射到 GeoJSON 中的行政多边形。
     返回原始 df，并添加了列“admin_name”和“admin_level”。
@@ -34,20 +50,10 @@ def map_points_to_admin(df: pd.DataFrame, admin_geojson_path: str, level: str =
     if not os.path.exists(admin_geojson_path):
         raise FileNotFoundError(admin_geojson_path)
 
-    abs_path = os.path.abspath(admin_geojson_path)
-    if abs_path in _GADM_CACHE:
-        gdf_admin = _GADM_CACHE[abs_path]
-    else:
-        gdf_admin = gpd.read_file(abs_path)
-        # 确保crs是WGS84
-        try:
-            gdf_admin = gdf_admin.to_crs(epsg=4326)
-        except Exception:
-            pass
-        _GADM_CACHE[abs_path] = gdf_admin
+    gdf_admin = read_admin_polygons(admin_geojson_path)
 
-    # 构建点 gdf
-    pts = gpd.GeoDataFrame(df.copy(), geometry=[Point(xy) for xy in zip(df['lon'], df['lat'])], crs='EPSG:4326')
+    # 构建点 gdf（GeoDataFrame 只在新对象上挂几何列，不修改调用方的 df，无需整表复制）
+    pts = gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df['lon'], df['lat']), crs='EPSG:4326')
 
     # 空间连接（多边形内的点）
     joined = gpd.sjoin(pts, gdf_admin, how='left', predicate='within')
@@ -96,16 +102,11 @@ def map_points_to_admin(df: pd.DataFrame, admin_geojson_path: str, level: str =
         if not admin_like_cols:
             admin_like_cols = [c for c in joined.columns if c not in ('index_right', 'geometry')]
 
-        def _row_has_admin(series_row):
-            for c in admin_like_cols:
-                try:
-                    if c in series_row.index and pd.notna(series_row[c]) and str(series_row[c]).strip():
-                        return True
-                except Exception:
-                    continue
-            return False
-
-        mask_has = joined.apply(_row_has_admin, axis=1)
+        # 逐列向量化判断（任一类行政列非空即视为已匹配），避免按行 apply 时为每行构造 Series
+        mask_has = pd.Series(False, index=joined.index)
+        for c in admin_like_cols:
+            col = joined[c]
+            mask_has |= col.notna() & col.astype(str).str.strip().ne('')
         if mask_has.all():
             # everyone matched; no need for fallback
             pass
@@ -209,7 +210,7 @@ def map_points_to_admin(df: pd.DataFrame, admin_geojson_path: str, level: str =
     joined['admin_level'] = level
 
     # convert back to pandas DataFrame (drop geometry)
-    out = pd.DataFrame(joined.drop(columns=['geometry']))
+    out = pd.DataFrame(joined.drop(columns=['geometry']), copy=False)
     # ensure string types for province/city/admin_name to avoid encoding issues later
     for col in ('province', 'city', 'admin_name'):
         if col in out.columns:
@@ -322,40 +323,225 @@ def canonicalize_admin_mapping(df: pd.DataFrame, fill_english_if_missing: bool =
     out = out.loc[mask_keep].copy()
 
     # compute filled_count and examples where english fallback was used
+    # out 是 df 按 mask_keep 过滤后的结果，按位置对齐原始行，逐列向量化统计
     filled_count = 0
     english_samples = []
     try:
-        def _has_chinese(s):
-            try:
-                return bool(pd.notna(s) and bool(re.search(r'[\u4e00-\u9fff]', str(s))))
-            except Exception:
-                return False
-
-        for idx in out.index:
-            orig = df.loc[idx] if idx in df.index else None
-            if orig is None:
-                continue
-            # province
-            prov_orig_has_cn = False
-            if 'province' in orig.index and pd.notna(orig['province']):
-                prov_orig_has_cn = _has_chinese(orig['province'])
-            prov_now = out.at[idx, 'province'] if 'province' in out.columns else None
-            if not prov_orig_has_cn and pd.notna(prov_now):
-                filled_count += 1
-                if len(english_samples) < sample_limit:
-                    english_samples.append((None, str(prov_now)))
-            # city
-            city_orig_has_cn = False
-            if 'city' in orig.index and pd.notna(orig['city']):
-                city_orig_has_cn = _has_chinese(orig['city'])
-            city_now = out.at[idx, 'city'] if 'city' in out.columns else None
-            if not city_orig_has_cn and pd.notna(city_now):
-                filled_count += 1
-                if len(english_samples) < sample_limit:
-                    english_samples.append((None, str(city_now)))
+        orig = df.loc[mask_keep.to_numpy()]
+
+        def _orig_has_chinese(col):
+            if col not in orig.columns:
+                return np.zeros(len(out), dtype=bool)
+            s = orig[col]
+            return (s.notna() & s.astype(str).str.contains(r'[\u4e00-\u9fff]')).to_numpy()
+
+        prov_filled = ~_orig_has_chinese('province') & out['province'].notna().to_numpy()
+        city_filled = ~_orig_has_chinese('city') & out['city'].notna().to_numpy()
+        filled_count = int(prov_filled.sum() + city_filled.sum())
+        # 样本顺序与逐行扫描一致：每行先省后市
+        for pos in np.flatnonzero(prov_filled | city_filled):
+            if len(english_samples) >= sample_limit:
+                break
+            if prov_filled[pos]:
+                english_samples.append((None, str(out['province'].iat[pos])))
+            if city_filled[pos] and len(english_samples) < sample_limit:
+                english_samples.append((None, str(out['city'].iat[pos])))
     except Exception:
         filled_count = int(filled_count) if 'filled_count' in locals() else 0
 
     after_rows = len(out)
     stats = {'before_rows': before_rows, 'after_rows': after_rows, 'filled_count': int(filled_count), 'english_samples': english_samples}
     return out, stats
+
+
+def resolve_admin_names(coords: pd.DataFrame, admin_geojson_path: str, level: str = 'city', debug: bool = False) -> pd.DataFrame:
+    """把（去重后的）经纬度点映射为规范化的省/市名称。
+
+    依次执行 map_points_to_admin、列名归一、canonicalize_admin_mapping、占位值清理与英文名回退，
+    返回 lat/lon/admin_name/province/city 列（每个点一行；边界点可能落在多个多边形上而出现多行，
+    完全没有匹配的点不出现在结果中）。
+    """
+    mapped_coords = map_points_to_admin(coords, admin_geojson_path, level=level)
+    # 映射相关的调试信息
+    if debug:
+        try:
+            print('DEBUG mapped_coords.shape =', getattr(mapped_coords, 'shape', None))
+            print('DEBUG mapped_coords.columns =', list(mapped_coords.columns))
+            try:
+                print('DEBUG mapped_coords sample:\n', mapped_coords.head(10).to_string(index=False))
+            except Exception:
+                pass
+        except Exception:
+            pass
+
+    # 确保存在 admin_name 列
+    if 'admin_name' not in mapped_coords.columns:
+        candidates = [c for c in mapped_coords.columns if any(tok in c.upper() for tok in ['NL_NAME_2','NL_NAME_1','NAME_2','NAME_1','PROVINCE','CITY','NL_NAME'])]
+        if candidates:
+            mapped_coords = mapped_coords.rename(columns={candidates[0]: 'admin_name'})
+
+    # 若缺少 'province' 或 'city'，尝试从常见的 GADM 属性名中填充。
+    # 这是一个轻量的本地处理逻辑，用于避免当 geojson 使用不同列名时丢失行。
+    if 'province' not in mapped_coords.columns:
+        prov_candidates = [c for c in mapped_coords.columns if any(tok in c.upper() for tok in ['NAME_1','NL_NAME_1','PROVINCE','ADM1','PRV'])]
+        if prov_candidates:
+            mapped_coords = mapped_coords.rename(columns={prov_candidates[0]: 'province'})
+    if 'city' not in mapped_coords.columns:
+        city_candidates = [c for c in mapped_coords.columns if any(tok in c.upper() for tok in ['NAME_2','NL_NAME_2','CITY','ADM2','CNTY','MUN'])]
+        if city_candidates:
+            mapped_coords = mapped_coords.rename(columns={city_candidates[0]: 'city'})
+
+    # 仅保留必要的列：lat/lon/行政名相关列
+    keep_cols = ['lat', 'lon']
+    for c in ('admin_name', 'province', 'city'):
+        if c in mapped_coords.columns:
+            keep_cols.append(c)
+    mapped_coords = mapped_coords[[c for c in keep_cols if c in mapped_coords.columns]]
+
+    mapped, stats = canonicalize_admin_mapping(mapped_coords, fill_english_if_missing=True, sample_limit=50)
+    # 将占位字符串（"NA","N/A","<NA>",空串等）标准化为真实的缺失值
+    try:
+        placeholders = set(['', 'NA', 'N/A', 'NAN', '<NA>'])
+        for col in ('province', 'city', 'admin_name'):
+            if col in mapped.columns:
+                # strip whitespace and convert known placeholders (case-insensitive) to pd.NA
+                def _norm(v):
+                    try:
+                        if v is None or (isinstance(v, float) and pd.isna(v)):
+                            return pd.NA
+                        if isinstance(v, str):
+                            s = v.strip()
+                            if s == '':
+                                return pd.NA
+                            if s.upper() in placeholders:
+                                return pd.NA
+                            return s
+                        return v
+                    except Exception:
+                        return pd.NA
+                mapped[col] = mapped[col].apply(_norm)
+    except Exception:
+        pass
+
+    # 调试：打印原始 english_samples 的内容/数量，帮助诊断打印分支为何在过滤后被跳过。
+    if os.environ.get('PREPROCESS_DEBUG', '') == '1':
+        try:
+            raw_es = stats.get('english_samples')
+            print(f"[debug] raw english_samples count={len(raw_es) if raw_es is not None else 0}; raw={raw_es}")
+        except Exception:
+            pass
+
+    if stats.get('english_samples'):
+        try:
+            print('使用英文名作为替代:')
+            shown = 0
+            # filter out empty or placeholder values
+            samples = []
+            for pe, ce in stats.get('english_samples', []):
+                s_pe = '' if pe is None else str(pe).strip()
+                s_ce = '' if ce is None else str(ce).strip()
+                if s_ce and s_ce.upper() not in ('NA', 'NAN', '<NA>'):
+                    samples.append((s_pe, s_ce))
+                elif s_pe and s_pe.upper() not in ('NA', 'NAN', '<NA>'):
+                    samples.append((s_pe, s_ce))
+            for pe, ce in samples:
+                if shown >= 50:
+                    break
+                if pe and ce:
+                    print(f'  {pe} / {ce}')
+                elif ce:
+                    print(f'  {ce}')
+                elif pe:
+                    print(f'  {pe}')
+                shown += 1
+        except Exception:
+            pass
+
+    # 如果 canonicalize 未能填充某些名称，尝试对仍缺少 admin_name/province/city 的行
+    # 使用显式的英文列作为回退。按行从任何可用的英文类列填充；不删除行。最后将剩余的 NaN
+    # 用 'UNKNOWN' 替代，确保输出中没有 NaN（注意：此处代码保留为尽量不覆盖已有中文值）。
+    try:
+        # Build candidate columns (broad set) but we'll prefer Chinese text when available.
+        cand_cols = [c for c in mapped.columns if re.search(r'NAME|EN\b|ENG|VARNAME|NL_NAME|CITY|PROVINCE|ADM', c, re.I)]
+
+        def _choose_preferred(series_df, candidates):
+            """
+            Choose preferred string per-row from candidates:
+            - First prefer values containing CJK/Chinese characters.
+            - If none contain Chinese, pick the first non-empty candidate (assumed English).
+            - If still none, return NaN (will be dropped later if desired).
+            Returns a pandas Series aligned with series_df.index.
+            """
+            idx = series_df.index
+            out = pd.Series([pd.NA] * len(idx), index=idx, dtype=object)
+            # helper to normalize a column to string but keep NA as NA
+            def _col_series(name):
+                if name not in series_df.columns:
+                    return pd.Series([pd.NA] * len(idx), index=idx, dtype=object)
+                s = series_df[name].astype(object).where(series_df[name].notna(), pd.NA)
+                return s
+
+            # first pass: prefer Chinese characters
+            chinese_re = re.compile(r'[\u4e00-\u9fff]')
+            for c in candidates:
+                s = _col_series(c)
+                mask = s.notna() & s.astype(str).str.strip().ne('') & s.astype(str).str.contains(chinese_re)
+                if mask.any():
+                    # fill only where out is not set
+                    to_fill = mask & out.isna()
+                    out[to_fill] = s[to_fill]
+            # second pass: first non-empty (english/fallback)
+            for c in candidates:
+                s = _col_series(c)
+                mask = s.notna() & s.astype(str).str.strip().ne('')
+                if mask.any():
+                    to_fill = mask & out.isna()
+                    out[to_fill] = s[to_fill]
+            # leave remaining as pd.NA
+            out = out.replace({pd.NA: pd.NA})
+            return out
+
+        # Candidate ordering: prefer NAME_1/NAME_2 style then generic city/province columns
+        prov_cands = [c for c in cand_cols if re.search(r'NAME[_\.]?1|PROVINCE|ADM1|VARNAME[_\.]?1|NL_NAME[_\.]?1', c, re.I)] + [c for c in cand_cols if c not in []]
+        city_cands = [c for c in cand_cols if re.search(r'NAME[_\.]?2|CITY|ADM2|VARNAME[_\.]?2|NL_NAME[_\.]?2', c, re.I)] + [c for c in cand_cols if c not in []]
+
+        # Ensure we don't duplicate columns in candidate lists
+        prov_cands = [c for i, c in enumerate(prov_cands) if c and prov_cands.index(c) == i]
+        city_cands = [c for i, c in enumerate(city_cands) if c and city_cands.index(c) == i]
+
+        # If canonical columns already present and non-empty, keep them
+        if 'province' in mapped.columns and mapped['province'].notna().any():
+            prov_series = mapped['province'].astype(object).where(mapped['province'].notna(), pd.NA)
+        else:
+            prov_series = _choose_preferred(mapped, prov_cands)
+        if 'city' in mapped.columns and mapped['city'].notna().any():
+            city_series = mapped['city'].astype(object).where(mapped['city'].notna(), pd.NA)
+        else:
+            city_series = _choose_preferred(mapped, city_cands)
+
+            # admin_name：优先保留已存在的 admin_name，否则在可用时由 city/province 组合得到
+        if 'admin_name' in mapped.columns and mapped['admin_name'].notna().any():
+            admin_series = mapped['admin_name'].astype(object).where(mapped['admin_name'].notna(), pd.NA)
+        else:
+            # prefer city, then province
+            admin_series = city_series.where(city_series.notna(), prov_series)
+
+            # 赋值回列（不要覆盖已有的非空值）
+        mapped['province'] = mapped.get('province').where(mapped.get('province').notna(), prov_series)
+        mapped['city'] = mapped.get('city').where(mapped.get('city').notna(), city_series)
+        mapped['admin_name'] = mapped.get('admin_name').where(mapped.get('admin_name').notna(), admin_series)
+
+        # Note: per your request, we leave rows with no province AND no city as NaN so they can be dropped
+        if debug:
+            try:
+                prov_count = int(mapped['province'].notna().sum()) if 'province' in mapped.columns else 0
+                city_count = int(mapped['city'].notna().sum()) if 'city' in mapped.columns else 0
+                admin_count = int(mapped['admin_name'].notna().sum()) if 'admin_name' in mapped.columns else 0
+                print(f"[task-debug] after-fallback counts: province={prov_count} city={city_count} admin_name={admin_count}")
+                sys.stdout.flush()
+            except Exception:
+                pass
+    except Exception:
+        pass
+
+    return mapped
@@ -0,0 +1,155 @@
+"""把 grid 粒度的日文件堆叠为 (天 × 格点) 数组（GridCube）。
+
+extract --granularity grid 每天写一个 PROCESSED_DIR/grid/YYYY/MM/DD/YYYYMMDD.parquet（lat/lon + 变量列）；
+这里按日期范围读取并按天堆叠，供整年一次性的稀疏矩阵聚合（AdminUnits.aggregate_cube）等使用。
+各天的格点坐标必须一致（同一张网格），否则报错；未使用 --aggregate-mean 时日文件逐小时重复网格，读取时取日均值。
+GRID_STORE='compact' 写出的 YYYYMMDD.npz（util.grid_store）直接解码为数组，不经过 DataFrame。
+"""
+import glob
+import os
+import warnings
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src import config as _config
+
+DEFAULT_VARS = ('pm25', 'pm10', 'so2', 'no2', 'co', 'o3', 'temp', 'rh', 'psfc', 'u', 'v')
+
+
+class GridCube:
+    """days 为 'YYYYMMDD' 列表；lat/lon 为按行展开的格点中心；values 为 {变量: (天 × 格点) 数组}。"""
+
+    def __init__(self, days: List[str], lat: np.ndarray, lon: np.ndarray, values: Dict[str, np.ndarray]):
+        self.days = list(days)
+        self.lat = lat
+        self.lon = lon
+        self.values = values
+
+    @property
+    def n_cells(self) -> int:
+        return int(self.lat.size)
+
+    def __repr__(self):
+        return f"GridCube(days={len(self.days)}, cells={self.n_cells}, vars={list(self.values)})"
+
+
+_FORMAT_RANK = {'npz': 0, 'parquet': 1, 'csv': 2}
+
+
+def _ext(path: str) -> str:
+    return path.rsplit('.', 1)[-1]
+
+
+def _day_of(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0][:8]
+
+
+def list_grid_days(year: Optional[int] = None, processed_root: Optional[str] = None,
+                   start: Optional[str] = None, end: Optional[str] = None) -> List[Tuple[str, str]]:
+    """返回 [(YYYYMMDD, 路径)]，按日期排序；start/end 为闭区间（YYYYMMDD 或 YYYY-MM-DD）。"""
+    root = os.path.join(processed_root or _config.PROCESSED_DIR, 'grid')
+    sub = str(year) if year is not None else '*'
+    paths = [p for ext in ('parquet', 'npz', 'csv') for p in glob.glob(os.path.join(root, sub, '*', '*', f'*.{ext}'))]
+    lo = start.replace('-', '') if start else None
+    hi = end.replace('-', '') if end else None
+    by_day = {}
+    for p in sorted(paths):
+        d = _day_of(p)
+        if not d.isdigit() or (lo and d < lo) or (hi and d > hi):
+            continue
+        # 同一天有多种格式时依次优先 npz（紧凑格式）、parquet、csv
+        if d not in by_day or _FORMAT_RANK[_ext(p)] < _FORMAT_RANK[_ext(by_day[d])]:
+            by_day[d] = p
+    return sorted(by_day.items())
+
+
+def _read_day(path: str, columns: Sequence[str]):
+    import pandas as pd
+    if path.endswith('.npz'):
+        from .grid_store import read_day_frame
+        df = read_day_frame(path)
+        return df[[c for c in columns if c in df.columns]]
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        present = set(pq.read_schema(path).names)
+        return pd.read_parquet(path, columns=[c for c in columns if c in present])
+    df = pd.read_csv(path)
+    return df[[c for c in columns if c in df.columns]]
+
+
+def _repeat_period(lat: np.ndarray, lon: np.ndarray) -> int:
+    # 未使用 --aggregate-mean 时日文件按小时重复整张网格；返回一张网格的格点数（不重复时为总行数）
+    same = np.flatnonzero((lat[1:] == lat[0]) & (lon[1:] == lon[0]))
+    for i in same + 1:
+        if lat.size % i == 0 and np.array_equal(lat.reshape(-1, i), np.broadcast_to(lat[:i], (lat.size // i, i))) \
+                and np.array_equal(lon.reshape(-1, i), np.broadcast_to(lon[:i], (lon.size // i, i))):
+            return int(i)
+    return int(lat.size)
+
+
+def _require_days(year, processed_root, start, end) -> List[Tuple[str, str]]:
+    days = list_grid_days(year, processed_root, start, end)
+    if not days:
+        raise FileNotFoundError(f"no grid day files for year={year} start={start} end={end} "
+                                f"under {os.path.join(processed_root or _config.PROCESSED_DIR, 'grid')}")
+    return days
+
+
+def grid_coords(year: Optional[int] = None, processed_root: Optional[str] = None,
+                start: Optional[str] = None, end: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """只读第一天的格点中心坐标（按行展开），用于在加载数值之前建立空间索引。"""
+    _, path = _require_days(year, processed_root, start, end)[0]
+    if path.endswith('.npz'):
+        from .grid_store import grid_of
+        return grid_of(path, processed_root)
+    df = _read_day(path, ['lat', 'lon'])
+    lat = df['lat'].to_numpy(dtype=np.float64)
+    lon = df['lon'].to_numpy(dtype=np.float64)
+    n = _repeat_period(lat, lon)
+    return lat[:n].copy(), lon[:n].copy()
+
+
+def load_grid_cube(year: Optional[int] = None, variables: Optional[Sequence[str]] = None,
+                   processed_root: Optional[str] = None, start: Optional[str] = None,
+                   end: Optional[str] = None, dtype=None, cells: Optional[np.ndarray] = None) -> GridCube:
+    """读取日期范围内的 grid 日文件，返回 GridCube（缺失的变量填 NaN）。
+
+    cells 为格点下标数组时只保留这些格点（例如站点附近的格点），数组按 (天 × len(cells)) 分配。
+    """
+    days = _require_days(year, processed_root, start, end)
+    variables = list(variables or DEFAULT_VARS)
+    dtype = np.dtype(dtype or _config.VALUE_DTYPE)
+    if all(p.endswith('.npz') for _, p in days):
+        from .grid_store import load_compact_days
+        lat, lon, values = load_compact_days([p for _, p in days], variables, cells=cells, dtype=dtype.type,
+                                             processed_root=processed_root)
+        return GridCube([d for d, _ in days], lat, lon, values)
+    lat = lon = None
+    values: Dict[str, np.ndarray] = {}
+    for k, (day, path) in enumerate(days):
+        df = _read_day(path, ['lat', 'lon'] + variables)
+        day_lat = df['lat'].to_numpy(dtype=np.float64)
+        day_lon = df['lon'].to_numpy(dtype=np.float64)
+        n = _repeat_period(day_lat, day_lon)
+        if lat is None:
+            lat, lon = day_lat[:n].copy(), day_lon[:n].copy()
+            width = n if cells is None else len(cells)
+            values = {v: np.full((len(days), width), np.nan, dtype=dtype) for v in variables}
+        elif n != lat.size or not (np.allclose(day_lat[:n], lat) and np.allclose(day_lon[:n], lon)):
+            raise ValueError(f"{path}: grid differs from {days[0][1]}")
+        for v in variables:
+            if v not in df.columns:
+                continue
+            arr = df[v].to_numpy(dtype=dtype).reshape(-1, n)
+            if cells is not None:
+                arr = arr[:, cells]
+            if arr.shape[0] > 1:
+                # 逐小时重复的网格：取各小时的 nanmean
+                with np.errstate(invalid='ignore'), warnings.catch_warnings():
+                    warnings.simplefilter('ignore', RuntimeWarning)
+                    arr = np.nanmean(arr, axis=0, keepdims=True).astype(dtype)
+            values[v][k] = arr[0]
+    if cells is not None:
+        lat, lon = lat[cells], lon[cells]
+    return GridCube([d for d, _ in days], lat, lon, values)
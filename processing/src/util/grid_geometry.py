@@ -0,0 +1,79 @@
+"""CN-Reanalysis 曲线网格（lat2d/lon2d）的几何工具：网格形状、格点四边形足迹与面积。
+
+日结果只保存按行展开的格点中心（lat/lon 两列），这里从中心坐标恢复 (ny, nx) 形状，
+用相邻中心的平均值估计格点角点，得到每个格点的四边形足迹，供重叠权重、区域掩膜与重网格化使用。
+"""
+from typing import Tuple
+
+import numpy as np
+
+# 1 度经线/纬线（赤道处）约 111.32 km
+KM_PER_DEGREE = 111.32
+
+
+def infer_grid_shape(lat, lon) -> Tuple[int, int]:
+    """从按行（C 顺序）展开的格点中心恢复 (ny, nx)：行内经度递增，换行处经度回落。"""
+    lon = np.asarray(lon, dtype=np.float64).ravel()
+    lat = np.asarray(lat, dtype=np.float64).ravel()
+    if lon.size < 4:
+        raise ValueError('网格太小，无法推断形状')
+    drops = np.flatnonzero(np.diff(lon) < 0)
+    if drops.size == 0:
+        raise ValueError('经度在展开后单调递增，无法推断网格形状（需要二维格点）')
+    nx = int(drops[0]) + 1
+    if lon.size % nx != 0:
+        raise ValueError(f'格点数 {lon.size} 不能被推断的列数 {nx} 整除')
+    ny = lon.size // nx
+    # 校验：每一行的换行位置都一致
+    if ny > 1 and not np.all(np.diff(lon.reshape(ny, nx), axis=1) >= 0):
+        raise ValueError('格点不是按行展开的曲线网格')
+    return ny, nx
+
+
+def _pad_extrapolate(a: np.ndarray) -> np.ndarray:
+    # 在四周各外推一行/列（线性外推），用于边缘格点的角点
+    out = np.empty((a.shape[0] + 2, a.shape[1] + 2), dtype=np.float64)
+    out[1:-1, 1:-1] = a
+    out[0, 1:-1] = 2 * a[0] - a[1] if a.shape[0] > 1 else a[0]
+    out[-1, 1:-1] = 2 * a[-1] - a[-2] if a.shape[0] > 1 else a[-1]
+    out[:, 0] = 2 * out[:, 1] - out[:, 2] if a.shape[1] > 1 else out[:, 1]
+    out[:, -1] = 2 * out[:, -2] - out[:, -3] if a.shape[1] > 1 else out[:, -2]
+    return out
+
+
+def cell_corners(lat2d, lon2d) -> Tuple[np.ndarray, np.ndarray]:
+    """格点角点 (ny+1, nx+1)：相邻四个格点中心的平均（边缘由外推得到）。"""
+    corners = []
+    for a in (np.asarray(lat2d, dtype=np.float64), np.asarray(lon2d, dtype=np.float64)):
+        p = _pad_extrapolate(a)
+        corners.append(0.25 * (p[:-1, :-1] + p[1:, :-1] + p[:-1, 1:] + p[1:, 1:]))
+    return corners[0], corners[1]
+
+
+def cell_polygons(lat2d, lon2d):
+    """每个格点的四边形足迹（shapely 多边形数组，按行展开，与日结果的行顺序一致）。"""
+    import shapely
+
+    clat, clon = cell_corners(lat2d, lon2d)
+    # 逆时针：左下、右下、右上、左上
+    xs = np.stack([clon[:-1, :-1], clon[:-1, 1:], clon[1:, 1:], clon[1:, :-1]], axis=-1).reshape(-1, 4)
+    ys = np.stack([clat[:-1, :-1], clat[:-1, 1:], clat[1:, 1:], clat[1:, :-1]], axis=-1).reshape(-1, 4)
+    return shapely.polygons(np.stack([xs, ys], axis=-1))
+
+
+def cell_areas_km2(lat2d, lon2d) -> np.ndarray:
+    """格点面积的近似值（km²）：角点四边形的经纬度面积乘以 cos(纬度)。"""
+    clat, clon = cell_corners(lat2d, lon2d)
+    x = np.stack([clon[:-1, :-1], clon[:-1, 1:], clon[1:, 1:], clon[1:, :-1]], axis=-1)
+    y = np.stack([clat[:-1, :-1], clat[:-1, 1:], clat[1:, 1:], clat[1:, :-1]], axis=-1)
+    # 鞋带公式
+    area_deg = 0.5 * np.abs(np.sum(x * np.roll(y, -1, axis=-1) - np.roll(x, -1, axis=-1) * y, axis=-1))
+    coslat = np.cos(np.deg2rad(np.asarray(lat2d, dtype=np.float64)))
+    return (area_deg * coslat * KM_PER_DEGREE ** 2).ravel()
+
+
+def reshape_grid(lat, lon) -> Tuple[np.ndarray, np.ndarray]:
+    """把按行展开的格点中心恢复为 (ny, nx) 的 lat2d/lon2d。"""
+    ny, nx = infer_grid_shape(lat, lon)
+    return (np.asarray(lat, dtype=np.float64).reshape(ny, nx),
+            np.asarray(lon, dtype=np.float64).reshape(ny, nx))
@@ -0,0 +1,222 @@
+"""grid 粒度日文件的紧凑存储（GRID_STORE='compact'）。
+
+parquet 日文件每行都重复 float64 的 lat/lon，每天约 146k 行；紧凑格式把两者分开：
+  - 坐标按网格指纹只写一次：PROCESSED_DIR/grid/_coords/<grid_key>.npz（lat/lon 按行展开的格点中心）；
+  - 每天一个 YYYYMMDD.npz（np.savez_compressed），每个变量一个 (时次 × 格点) 数组：
+    'int16' 为定点码值（value = offset + code * scale，-32768 为缺测，scale/offset 按天按变量取值范围确定），
+    'float32' 为原值。未使用 --aggregate-mean 时时次为逐小时，读取时取日均值。
+load_compact_days 直接把一段日期解码为 {变量: (天 × 格点)} 数组，不经过 DataFrame；
+read_day_frame 仍可还原为 lat/lon + 变量列的 DataFrame，供月度汇总等按行处理的步骤使用。
+
+用法（在 processing 目录下）：
+    GRID_STORE=compact python run_pipeline.py extract --year 2013 --granularity grid --aggregate-mean
+    python -m src.util.grid_store --year 2013        # 对比已有 parquet 与紧凑格式的体积和误差
+"""
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src import config as _config
+from .admin_index import grid_key, _round_coords
+
+FILL_INT16 = np.int16(-32768)
+_CODE_MAX = 32767
+COORDS_DIRNAME = '_coords'
+_COORDS: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+
+def _coords_dir(processed_root: Optional[str] = None) -> str:
+    return os.path.join(processed_root or _config.PROCESSED_DIR, 'grid', COORDS_DIRNAME)
+
+
+def encode_int16(values: np.ndarray) -> Tuple[np.ndarray, float, float]:
+    """把浮点数组编码为 int16 码值，返回 (codes, scale, offset)；全部缺测时 scale=1, offset=0。"""
+    v = np.asarray(values, dtype=np.float64)
+    ok = np.isfinite(v)
+    if not ok.any():
+        return np.full(v.shape, FILL_INT16, dtype=np.int16), 1.0, 0.0
+    lo, hi = float(v[ok].min()), float(v[ok].max())
+    offset = (lo + hi) / 2
+    scale = (hi - lo) / (2 * _CODE_MAX) if hi > lo else 1.0
+    codes = np.clip(np.rint((np.where(ok, v, offset) - offset) / scale), -_CODE_MAX, _CODE_MAX)
+    return np.where(ok, codes, FILL_INT16).astype(np.int16), scale, offset
+
+
+def decode(arr: np.ndarray, scale: float, offset: float, dtype=np.float32) -> np.ndarray:
+    """int16 码值还原为浮点（缺测为 NaN）；float 数组原样转换 dtype。"""
+    if arr.dtype != np.int16:
+        return arr.astype(dtype, copy=False)
+    out = arr.astype(dtype) * dtype(scale) + dtype(offset)
+    out[arr == FILL_INT16] = np.nan
+    return out
+
+
+def _grid_cells(lat: np.ndarray, lon: np.ndarray) -> int:
+    from .grid_cube import _repeat_period
+    return _repeat_period(lat, lon)
+
+
+def write_coords(lat, lon, processed_root: Optional[str] = None) -> str:
+    """写入（或复用）网格坐标文件，返回网格指纹。"""
+    lat_r, lon_r = _round_coords(lat, lon)
+    key = grid_key(lat_r, lon_r)
+    path = os.path.join(_coords_dir(processed_root), f"{key}.npz")
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 多个 worker 可能同时写同一张网格：先写临时文件再原子替换
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(tmp, lat=np.asarray(lat, dtype=np.float64), lon=np.asarray(lon, dtype=np.float64))
+        os.replace(tmp, path)
+    _COORDS.setdefault(key, (np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)))
+    return key
+
+
+def read_coords(key: str, processed_root: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+    coords = _COORDS.get(key)
+    if coords is None:
+        with np.load(os.path.join(_coords_dir(processed_root), f"{key}.npz"), allow_pickle=False) as z:
+            coords = _COORDS[key] = (z['lat'], z['lon'])
+    return coords
+
+
+def save_grid_day(df, path: str, dtype: str = 'int16', processed_root: Optional[str] = None) -> str:
+    """把 grid 日 DataFrame（lat/lon + 数值列，可能逐小时重复网格）写成紧凑 npz，返回路径。"""
+    if dtype not in ('int16', 'float32'):
+        raise ValueError(f'未知的 GRID_STORE_DTYPE: {dtype}')
+    lat = df['lat'].to_numpy(dtype=np.float64)
+    lon = df['lon'].to_numpy(dtype=np.float64)
+    n = _grid_cells(lat, lon)
+    key = write_coords(lat[:n], lon[:n], processed_root)
+    arrays = {}
+    names, scales, offsets = [], [], []
+    for col in df.columns:
+        if col in ('lat', 'lon', 'time') or not np.issubdtype(df[col].dtype, np.number):
+            continue
+        values = df[col].to_numpy(dtype=np.float64).reshape(-1, n)
+        if dtype == 'int16':
+            arrays[col], scale, offset = encode_int16(values)
+        else:
+            arrays[col], scale, offset = values.astype(np.float32), 1.0, 0.0
+        names.append(col)
+        scales.append(scale)
+        offsets.append(offset)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp.npz'
+    np.savez_compressed(tmp, grid=np.array(key), vars=np.array(names, dtype=str),
+                        scale=np.array(scales, dtype=np.float64), offset=np.array(offsets, dtype=np.float64), **arrays)
+    os.replace(tmp, path)
+    return path
+
+
+def _daily(arr: np.ndarray) -> np.ndarray:
+    # 逐小时重复的网格取各小时的 nanmean
+    if arr.shape[0] == 1:
+        return arr[0]
+    import warnings
+    with np.errstate(invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanmean(arr, axis=0).astype(arr.dtype)
+
+
+def read_grid_day(path: str, variables: Optional[Sequence[str]] = None, cells: Optional[np.ndarray] = None,
+                  dtype=np.float32) -> Tuple[str, Dict[str, np.ndarray]]:
+    """返回 (网格指纹, {变量: (格点,) 日均值})；cells 为格点下标时先取子集再解码。"""
+    with np.load(path, allow_pickle=False) as z:
+        names = z['vars'].tolist()
+        scale, offset = z['scale'], z['offset']
+        out = {}
+        for i, v in enumerate(names):
+            if variables is not None and v not in variables:
+                continue
+            arr = z[v]
+            if cells is not None:
+                arr = arr[:, cells]
+            out[v] = _daily(decode(arr, scale[i], offset[i], dtype))
+        return str(z['grid']), out
+
+
+def load_compact_days(paths: Sequence[str], variables: Sequence[str], cells: Optional[np.ndarray] = None,
+                      dtype=np.float32, processed_root: Optional[str] = None):
+    """批量读取紧凑日文件，返回 (lat, lon, {变量: (天 × 格点)})；各天必须是同一张网格。"""
+    values: Dict[str, np.ndarray] = {}
+    key = None
+    for k, path in enumerate(paths):
+        day_key, fields = read_grid_day(path, variables, cells, dtype)
+        if key is None:
+            key = day_key
+            lat, lon = read_coords(key, processed_root or _root_of(path))
+            width = lat.size if cells is None else len(cells)
+            values = {v: np.full((len(paths), width), np.nan, dtype=dtype) for v in variables}
+        elif day_key != key:
+            raise ValueError(f"{path}: grid differs from {paths[0]}")
+        for v, arr in fields.items():
+            values[v][k] = arr
+    if cells is not None:
+        lat, lon = lat[cells], lon[cells]
+    return lat, lon, values
+
+
+def grid_of(path: str, processed_root: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """只读日文件的网格指纹并返回坐标（不解码数值）。"""
+    with np.load(path, allow_pickle=False) as z:
+        return read_coords(str(z['grid']), processed_root or _root_of(path))
+
+
+def read_day_frame(path: str, processed_root: Optional[str] = None):
+    """还原为 lat/lon + 变量列的 DataFrame（日均值，每格点一行）。"""
+    import pandas as pd
+
+    key, fields = read_grid_day(path, dtype=np.dtype(_config.VALUE_DTYPE).type)
+    lat, lon = read_coords(key, processed_root or _root_of(path))
+    df = pd.DataFrame({'lat': lat, 'lon': lon})
+    for v, arr in fields.items():
+        df[v] = arr
+    return df
+
+
+def _root_of(path: str) -> Optional[str]:
+    # .../<processed_root>/grid/YYYY/MM/DD/YYYYMMDD.npz
+    parts = os.path.abspath(path).split(os.sep)
+    if len(parts) > 5 and parts[-5] == 'grid':
+        return os.sep.join(parts[:-5])
+    return None
+
+
+def main(argv: Optional[List[str]] = None):
+    """对比同一天 parquet 与紧凑格式（int16/float32）的体积、读取时间与最大误差。"""
+    import argparse
+    import tempfile
+    import time
+    import pandas as pd
+    from .grid_cube import list_grid_days
+
+    p = argparse.ArgumentParser(description=main.__doc__)
+    p.add_argument('--year', type=int, default=None)
+    p.add_argument('--processed-root', default=None)
+    p.add_argument('--days', type=int, default=3, help='number of parquet day files to compare')
+    args = p.parse_args(argv)
+    days = [(d, f) for d, f in list_grid_days(args.year, args.processed_root) if f.endswith('.parquet')][:args.days]
+    if not days:
+        raise SystemExit('no parquet grid day files found')
+    with tempfile.TemporaryDirectory() as root:
+        for day, src in days:
+            df = pd.read_parquet(src)
+            t0 = time.perf_counter()
+            pd.read_parquet(src)
+            t_parquet = time.perf_counter() - t0
+            line = f"{day}: parquet {os.path.getsize(src) / 1e6:.2f} MB ({t_parquet * 1e3:.0f} ms)"
+            for dtype in ('int16', 'float32'):
+                path = save_grid_day(df, os.path.join(root, 'grid', dtype, f"{day}.npz"), dtype, processed_root=root)
+                t0 = time.perf_counter()
+                _, fields = read_grid_day(path)
+                t_read = time.perf_counter() - t0
+                n = next(iter(fields.values())).size
+                err = max((float(np.nanmax(np.abs(_daily(df[v].to_numpy(dtype=np.float64).reshape(-1, n)) - arr)))
+                           for v, arr in fields.items() if np.isfinite(arr).any()), default=0.0)
+                line += f" | {dtype} {os.path.getsize(path) / 1e6:.2f} MB ({t_read * 1e3:.0f} ms, max err {err:.3g})"
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
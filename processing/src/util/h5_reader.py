@@ -0,0 +1,139 @@
+"""CN-Reanalysis 小时成员的 h5py 快速读取路径。
+
+CN-Reanalysis 的每个 .nc 成员布局固定：11 个变量加 lat2d/lon2d，均位于
+south-north × west-east 网格上（变量可带长度为 1 的 bottom-top 维）。
+这里绕开 xr.Dataset 的构建（CF 解码、坐标索引、属性解析），用 h5py 直接把
+数组读入预分配的 float32 缓冲区，并自行处理 scale_factor/add_offset 与
+_FillValue/missing_value。布局不符时抛出 LayoutMismatch，由调用方回退到 xarray。
+"""
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+# h5py 为可选依赖，且首次使用时才导入（缺失时调用方直接走 xarray 路径）
+_h5py = None
+
+MEMBER_VARS = ('pm25', 'pm10', 'so2', 'no2', 'co', 'o3', 'temp', 'rh', 'psfc', 'u', 'v')
+
+
+class LayoutMismatch(ValueError):
+    """成员文件与 CN-Reanalysis 固定布局不一致（或不是 HDF5 文件）。"""
+
+
+def _load_h5py():
+    global _h5py
+    if _h5py is None:
+        try:
+            import h5py
+            _h5py = h5py
+        except Exception:
+            _h5py = False
+    return _h5py or None
+
+
+def available() -> bool:
+    return _load_h5py() is not None
+
+
+def _attr_scalar(attrs, name):
+    if name not in attrs:
+        return None
+    val = np.asarray(attrs[name]).ravel()
+    if val.size == 0:
+        return None
+    return val
+
+
+class H5MemberReader:
+    """把单个小时成员读入 float32 数组。
+
+    reuse=True 时复用上一次的缓冲区（调用方须在下一次 read 之前消费完结果，
+    例如立即归约进 DayMeanAccumulator）；否则每次分配新数组。
+    同一实例不是线程安全的，多线程时每个线程持有自己的实例。
+    """
+
+    def __init__(self, variables: Sequence[str] = MEMBER_VARS):
+        if _load_h5py() is None:
+            raise ImportError('h5py 不可用')
+        self.variables = tuple(variables)
+        self.shape = None
+        self._buffers: Dict[str, np.ndarray] = {}
+
+    def _buffer(self, name: str, shape, reuse: bool) -> np.ndarray:
+        buf = self._buffers.get(name) if reuse else None
+        if buf is None or buf.shape != shape:
+            buf = np.empty(shape, dtype=np.float32)
+            if reuse:
+                self._buffers[name] = buf
+        return buf
+
+    def _read_into(self, dset, name: str, shape, reuse: bool) -> np.ndarray:
+        # 变量允许带长度为 1 的前导维（如 bottom-top=1），去掉后须与网格一致
+        src_shape = tuple(dset.shape)
+        core = src_shape
+        while len(core) > len(shape) and core[0] == 1:
+            core = core[1:]
+        if core != shape:
+            raise LayoutMismatch(f'{name}: shape {src_shape} 与网格 {shape} 不一致')
+        if dset.dtype.kind not in 'fiu':
+            raise LayoutMismatch(f'{name}: 不支持的 dtype {dset.dtype}')
+        if '_Unsigned' in dset.attrs:
+            raise LayoutMismatch(f'{name}: 含 _Unsigned 属性')
+        buf = self._buffer(name, shape, reuse)
+        # HDF5 在读取时完成类型转换（int16 -> float32 等），不产生中间数组
+        dset.read_direct(buf.reshape(src_shape))
+
+        # 与 xarray 的 CF 解码顺序一致：先按原始值屏蔽填充值，再做线性变换
+        for attr in ('_FillValue', 'missing_value'):
+            fill = _attr_scalar(dset.attrs, attr)
+            if fill is None:
+                continue
+            for fv in fill:
+                try:
+                    fv = float(fv)
+                except Exception:
+                    raise LayoutMismatch(f'{name}: 无法解析 {attr}')
+                if np.isnan(fv):
+                    continue
+                buf[buf == np.float32(fv)] = np.nan
+        scale = _attr_scalar(dset.attrs, 'scale_factor')
+        offset = _attr_scalar(dset.attrs, 'add_offset')
+        if scale is not None:
+            np.multiply(buf, np.float32(scale[0]), out=buf)
+        if offset is not None:
+            np.add(buf, np.float32(offset[0]), out=buf)
+        return buf
+
+    def read(self, fileobj, reuse: bool = True) -> Dict[str, np.ndarray]:
+        """返回 {'lat','lon', 变量...} 的 float32 二维数组；布局不符时抛出 LayoutMismatch。"""
+        h5py = _load_h5py()
+        try:
+            f = h5py.File(fileobj, 'r')
+        except Exception as e:
+            # netCDF3 等非 HDF5 文件
+            raise LayoutMismatch(f'不是 HDF5 文件: {e}') from e
+        with f:
+            lat = f.get('lat2d')
+            lon = f.get('lon2d')
+            if not isinstance(lat, h5py.Dataset) or not isinstance(lon, h5py.Dataset):
+                raise LayoutMismatch('缺少 lat2d/lon2d')
+            shape = tuple(lat.shape)
+            if len(shape) != 2 or tuple(lon.shape) != shape:
+                raise LayoutMismatch(f'lat2d/lon2d 形状异常: {lat.shape} / {lon.shape}')
+            self.shape = shape
+            out = {'lat': self._read_into(lat, 'lat', shape, reuse),
+                   'lon': self._read_into(lon, 'lon', shape, reuse)}
+            for var in self.variables:
+                dset = f.get(var)
+                if dset is None:
+                    continue
+                if not isinstance(dset, h5py.Dataset):
+                    raise LayoutMismatch(f'{var} 不是数据集')
+                out[var] = self._read_into(dset, var, shape, reuse)
+        return out
+
+
+def read_member_arrays(fileobj, reader: Optional[H5MemberReader] = None, reuse: bool = False) -> Dict[str, np.ndarray]:
+    """便捷函数：用 H5MemberReader 读取单个成员。"""
+    reader = reader or H5MemberReader()
+    return reader.read(fileobj, reuse=reuse)
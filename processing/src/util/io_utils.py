@@ -1,13 +1,17 @@
 import zipfile
 import io
+import functools
+import mmap
+import struct
 import tempfile
 import os
 import shutil
-import xarray as xr
 import threading
-from src.config import TMP_CLEANUP_MANIFEST, MAX_IN_MEMORY_BYTES
+from src.config import (TMP_CLEANUP_MANIFEST, MAX_IN_MEMORY_BYTES, READAHEAD_DEPTH, READAHEAD_MAX_BYTES,
+                        READAHEAD_CHUNK_BYTES, MMAP_STORED_MEMBERS, INFLATE_CHUNK_BYTES)
 
 _HDF5_OPEN_LOCK = threading.Lock()
+_NETCDF4_LOCK = threading.Lock()
 # 全局锁，用于序列化 HDF5/netCDF 的打开操作（在导入时初始化以避免延迟竞争）
 # 缓存每个驱动器根下用于 ASCII 临时目录的路径，以避免创建/删除大量小目录
 # 键：驱动器根字符串（例如 'C:\\'）或表示系统临时的 'system'
@@ -18,6 +22,13 @@ _ASCII_TMP_ROOTS = {}
 USE_PURE_MEMORY = os.environ.get('PREPROCESS_PURE_MEMORY', '') == '1'
 
 
+def _xr():
+    # xarray 的导入耗时数百毫秒；只在真正打开数据集时才加载，
+    # 使只用到 ZIP 读取/预读的调用方（以及 h5py 快速路径）不必为它付出启动时间
+    import xarray
+    return xarray
+
+
 def set_pure_memory(enabled: bool):
     """运行时切换纯内存模式（仅影响当前进程）。
 
@@ -94,20 +105,95 @@ def _available_backends():
     return info
 
 
-def _try_open_with_engines(nc_path, engines=None):
-    def _get_supported_engine_names():
+@functools.lru_cache(maxsize=1)
+def supported_engines() -> frozenset:
+    """xarray 已安装的后端名称（进程内只探测一次）。"""
+    try:
+        info = _xr().backends.list_engines()
+    except Exception:
+        return frozenset()
+    names = set()
+    if isinstance(info, dict):
+        # 新版 xarray 返回 {name: BackendEntrypoint}；旧版可能返回 {kind: [names]}
+        for k, v in info.items():
+            if isinstance(v, (list, tuple)):
+                names.update(v)
+            else:
+                names.add(k)
+    return frozenset(names)
+
+
+# 默认的 engine 尝试顺序；'netcdf4-memory' 表示 netCDF4.Dataset(memory=...) 的内存模式。
+# 跑过 backend_calibration 后改用实测最快的顺序。
+DEFAULT_ENGINE_ORDER = {
+    'memory': ['h5netcdf', 'scipy', 'netcdf4-memory'],
+    'disk': ['netcdf4', 'h5netcdf', 'scipy'],
+}
+
+
+def engine_order(mode: str) -> list:
+    """返回 mode（'memory' 或 'disk'）下的 engine 尝试顺序：校准结果优先，其余按默认顺序补齐。"""
+    default = DEFAULT_ENGINE_ORDER[mode]
+    try:
+        from .backend_calibration import preferred_engines
+        calibrated = preferred_engines(mode) or []
+    except Exception:
+        calibrated = []
+    return list(calibrated) + [e for e in default if e not in calibrated]
+
+
+def _engine_usable(eng: str) -> bool:
+    if eng == 'netcdf4-memory':
+        return _available_backends().get('netCDF4', False)
+    return eng in supported_engines()
+
+
+def open_with_engine(src, eng: str):
+    """用指定 engine 打开内存中的成员；src 为 bytes 或可 seek 的文件对象。"""
+    if eng == 'netcdf4-memory':
+        import netCDF4
+        from xarray.backends import NetCDF4DataStore
+        if isinstance(src, (bytes, bytearray, memoryview)):
+            data = bytes(src)
+        else:
+            src.seek(0)
+            data = bytes(src.getbuffer()) if hasattr(src, 'getbuffer') else src.read()
+        # netCDF4-C 不是线程安全的：在锁内打开并立即载入，之后的 .values 不再触及 C 库
+        with _NETCDF4_LOCK:
+            nc4 = netCDF4.Dataset('inmemory', mode='r', memory=data)
+            try:
+                return _xr().open_dataset(NetCDF4DataStore(nc4)).load()
+            except Exception:
+                nc4.close()
+                raise
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        src = io.BytesIO(src)
+    else:
+        src.seek(0)
+    return _xr().open_dataset(src, engine=eng)
+
+
+def open_member_dataset(fileobj):
+    """按 engine_order('memory') 依次尝试打开内存中的成员，全部失败时交给 xarray 自动选择。"""
+    last_exc = None
+    for eng in engine_order('memory'):
+        if not _engine_usable(eng):
+            continue
         try:
-            info = xr.backends.list_engines()
-            names = set()
-            if isinstance(info, dict):
-                for v in info.values():
-                    if isinstance(v, (list, tuple)):
-                        names.update(v)
-            return names
-        except Exception:
-            return set()
+            return open_with_engine(fileobj, eng)
+        except Exception as e:
+            last_exc = e
+    try:
+        fileobj.seek(0)
+        return _xr().open_dataset(fileobj)
+    except Exception:
+        if last_exc is not None:
+            raise last_exc
+        raise
 
-    supported = _get_supported_engine_names()
+
+def _try_open_with_engines(nc_path, engines=None):
+    supported = supported_engines()
 
     if engines is None:
         candidates = [None]
@@ -131,9 +217,9 @@ def _try_open_with_engines(nc_path, engines=None):
         try:
             with _HDF5_OPEN_LOCK:
                 if eng is None:
-                    ds = xr.open_dataset(nc_path)
+                    ds = _xr().open_dataset(nc_path)
                 else:
-                    ds = xr.open_dataset(nc_path, engine=eng)
+                    ds = _xr().open_dataset(nc_path, engine=eng)
             return ds
         except Exception as e:
             last_exc = e
@@ -185,15 +271,7 @@ def read_nc_from_zip(zip_file_path, nc_file_name=None):
                 else:
                     # 仅在存在支持文件类对象的 engine 时才尝试内存打开
                     try:
-                        supported = set()
-                        try:
-                            info = xr.backends.list_engines()
-                            if isinstance(info, dict):
-                                for v in info.values():
-                                    if isinstance(v, (list, tuple)):
-                                        supported.update(v)
-                        except Exception:
-                            supported = set()
+                        supported = set(supported_engines())
                         if _debug:
                             print(f"[io_utils] supported engines: {supported}")
                         filelike_engines = {'h5netcdf', 'scipy'}
@@ -224,24 +302,14 @@ def read_nc_from_zip(zip_file_path, nc_file_name=None):
                         if _debug:
                             print(f"[io_utils] attempting in-memory open for {nc_file_name} (bytes={len(nc_bytes)})")
 
-                        # 优先尝试的引擎列表（用户要求只用 h5netcdf 和 scipy）
-                        preferred = ['h5netcdf', 'scipy']
-                        try:
-                            info = xr.backends.list_engines()
-                            supported = set()
-                            if isinstance(info, dict):
-                                for v in info.values():
-                                    if isinstance(v, (list, tuple)):
-                                        supported.update(v)
-                        except Exception:
-                            supported = set()
-
-                        engines = [e for e in preferred if e in supported]
-                        for eng in engines:
+                        # 引擎顺序：默认优先不依赖 HDF5 C 库的后端（'h5netcdf', 'scipy'），
+                        # netCDF4 的 memory 模式作为最后手段；跑过 backend_calibration 后按实测速度排序。
+                        for eng in engine_order('memory'):
+                            if not _engine_usable(eng):
+                                continue
                             try:
-                                bio = io.BytesIO(nc_bytes)
                                 with _HDF5_OPEN_LOCK:
-                                    ds = xr.open_dataset(bio, engine=eng)
+                                    ds = open_with_engine(nc_bytes, eng)
                                 if _debug:
                                     print(f"[io_utils] in-memory open succeeded for {nc_file_name} using engine={eng}")
                                 attempted_inmemory = True
@@ -249,29 +317,6 @@ def read_nc_from_zip(zip_file_path, nc_file_name=None):
                             except Exception as e_mem:
                                 if _debug:
                                     print(f"[io_utils] in-memory open with engine={eng} failed: {e_mem}")
-
-                        # 最后尝试 netCDF4 memory（若用户装了 netCDF4）作为兼容后备，但尽量避免依赖它
-                        try:
-                            import netCDF4
-                            try:
-                                nc4 = netCDF4.Dataset('inmemory', mode='r', memory=nc_bytes)
-                                try:
-                                    from xarray.backends import NetCDF4DataStore
-                                    xr_ds = xr.open_dataset(NetCDF4DataStore(nc4))
-                                except Exception:
-                                    xr_ds = xr.open_dataset(nc4)
-                                if _debug:
-                                    print(f"[io_utils] in-memory open succeeded for {nc_file_name} using netCDF4 memory")
-                                attempted_inmemory = True
-                                return xr_ds, None
-                            except Exception:
-                                try:
-                                    nc4.close()
-                                except Exception:
-                                    pass
-                        except Exception:
-                            # netCDF4 不可用或失败 -> 继续
-                            pass
                     else:
                         if _debug:
                             print(f"[io_utils] 无法读取或文件过大，size={None if nc_bytes is None else len(nc_bytes)}; try_in_memory={try_in_memory}")
@@ -369,7 +414,7 @@ def read_nc_from_zip(zip_file_path, nc_file_name=None):
                     print(f"[io_utils] extract failed: {e}")
                 raise RuntimeError(f"解压 {nc_file_name} 到临时目录 {tmp_dir} 时失败: {e}") from e
 
-            engines = ['netcdf4', 'h5netcdf', 'scipy']
+            engines = engine_order('disk')
             try:
                 if _debug:
                     print(f"[io_utils] attempting to open extracted file with engines: {engines}")
@@ -541,12 +586,12 @@ def read_nc_from_zip(zip_file_path, nc_file_name=None):
                 except Exception:
                     pass
 
-def read_nc_bytes(zip_path: str, nc_file_name: str = None) -> bytes:
+def read_nc_bytes(zip_path, nc_file_name: str = None) -> bytes:
     """
     从 ZIP 文件中安全地读取指定的 .nc 成员到内存（不落地），返回 bytes。
 
     参数:
-      zip_path: ZIP 文件路径
+      zip_path: ZIP 文件路径，或已打开的 zipfile.ZipFile（同一天的多个成员可复用，避免重复解析目录）
       nc_file_name: 可选，ZIP 内的成员名（例如 'folder/file.nc'）。
                     若为 None，则读取第一个以 .nc 结尾的成员。
 
@@ -555,13 +600,348 @@ def read_nc_bytes(zip_path: str, nc_file_name: str = None) -> bytes:
 
     注意: 本函数不会在磁盘创建任何临时文件。
     """
+    if isinstance(zip_path, zipfile.ZipFile):
+        return _read_member_bytes(zip_path, nc_file_name, zip_path.filename)
     with zipfile.ZipFile(zip_path, 'r') as zf:
-        if nc_file_name is None:
-            nc_names = [n for n in zf.namelist() if n.endswith('.nc')]
-            if not nc_names:
-                raise FileNotFoundError(f"No .nc found in {zip_path}")
-            nc_file_name = nc_names[0]
-
-        # 以只读模式打开成员并返回全部字节；不做任何落地写入
-        with zf.open(nc_file_name, 'r') as nc_file:
-            return nc_file.read()
\ No newline at end of file
+        return _read_member_bytes(zf, nc_file_name, zip_path)
+
+
+def _read_member_bytes(zf: zipfile.ZipFile, nc_file_name, label) -> bytes:
+    if nc_file_name is None:
+        nc_names = [n for n in zf.namelist() if n.endswith('.nc')]
+        if not nc_names:
+            raise FileNotFoundError(f"No .nc found in {label}")
+        nc_file_name = nc_names[0]
+
+    # 以只读模式打开成员并返回全部字节；不做任何落地写入
+    with zf.open(nc_file_name, 'r') as nc_file:
+        return nc_file.read()
+
+
+class ReadOnlyBufferFile(io.RawIOBase):
+    """只读、可 seek 的文件对象，直接建立在 bytes/bytearray/mmap 的内存视图之上。
+
+    与 io.BytesIO(bytearray) 不同，构造时不会复制底层缓冲区；zipfile 与 HDF5 后端
+    只会复制它们实际 read 的那部分。
+    """
+
+    def __init__(self, buffer, offset: int = 0, length: int = None, name: str = None):
+        super().__init__()
+        view = memoryview(buffer)
+        if view.ndim != 1 or view.itemsize != 1:
+            view = view.cast('B')
+        end = len(view) if length is None else offset + length
+        self._view = view[offset:end]
+        self._pos = 0
+        if name is not None:
+            self.name = name
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            new = pos
+        elif whence == io.SEEK_CUR:
+            new = self._pos + pos
+        elif whence == io.SEEK_END:
+            new = len(self._view) + pos
+        else:
+            raise ValueError(f"invalid whence: {whence}")
+        if new < 0:
+            raise ValueError("negative seek position")
+        self._pos = new
+        return new
+
+    def readinto(self, b):
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        n = max(0, min(len(b), len(self._view) - self._pos))
+        if n:
+            memoryview(b).cast('B')[:n] = self._view[self._pos:self._pos + n]
+            self._pos += n
+        return n
+
+    def read(self, size=-1):
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        if size is None or size < 0:
+            size = len(self._view) - self._pos
+        end = min(len(self._view), self._pos + size)
+        data = self._view[self._pos:end].tobytes()
+        self._pos = end
+        return data
+
+    def readall(self):
+        return self.read(-1)
+
+    def getbuffer(self):
+        return self._view
+
+    def __len__(self):
+        return len(self._view)
+
+    def close(self):
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+
+def open_zip(zip_path: str, zip_bytes=None) -> zipfile.ZipFile:
+    """打开 ZIP；若提供了预读的 zip_bytes（bytes/bytearray/memoryview），直接在内存上打开，不再访问磁盘。"""
+    if zip_bytes is not None:
+        return zipfile.ZipFile(ReadOnlyBufferFile(zip_bytes, name=zip_path), 'r')
+    return zipfile.ZipFile(zip_path, 'r')
+
+
+_ZIP_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+_ZIP_LOCAL_SIG = b'PK\x03\x04'
+
+
+def _stored_member_span(info: zipfile.ZipInfo, read_at):
+    """返回 STORED 成员数据在归档中的 (offset, length)；不能零拷贝访问时返回 None。
+
+    read_at(offset, n) 用于读取本地文件头（本地头里的 extra 长度可能与中央目录不同，必须以本地头为准）。
+    """
+    if info.compress_type != zipfile.ZIP_STORED or info.flag_bits & 0x1:
+        return None
+    header = read_at(info.header_offset, _ZIP_LOCAL_HEADER.size)
+    if len(header) != _ZIP_LOCAL_HEADER.size:
+        return None
+    fields = _ZIP_LOCAL_HEADER.unpack(header)
+    if fields[0] != _ZIP_LOCAL_SIG:
+        return None
+    name_len, extra_len = fields[9], fields[10]
+    return info.header_offset + _ZIP_LOCAL_HEADER.size + name_len + extra_len, info.file_size
+
+
+def _copy_range(buf, offset: int, n: int) -> bytes:
+    with memoryview(buf) as mv:
+        return bytes(mv[offset:offset + n])
+
+
+class ZipMemberReader:
+    """按成员访问一个日 ZIP，对 STORED（未压缩）成员提供零拷贝的只读文件视图。
+
+    STORED 成员直接返回建立在归档 mmap（或预读字节）之上的 ReadOnlyBufferFile，
+    不解压、不整体复制，HDF5 后端只会触及它实际读取的页；压缩成员仍按原方式解压为 bytes。
+    所有视图在 close() 前有效。
+    """
+
+    def __init__(self, zip_path: str, zip_bytes=None, use_mmap: bool = MMAP_STORED_MEMBERS):
+        self.zip_path = zip_path
+        self.use_mmap = use_mmap
+        self._buffer = zip_bytes
+        self._fh = None
+        self._mm = None
+        self._views = []
+        # 一天内的成员可能被多个线程并发打开（见 preprocess._reduce_members）
+        self._lock = threading.Lock()
+        # 压缩成员解压用的线程内复用缓冲区（见 open_member(reuse=True)）
+        self._scratch = threading.local()
+        self.zf = open_zip(zip_path, zip_bytes)
+
+    def namelist(self):
+        return self.zf.namelist()
+
+    def _archive_buffer(self):
+        if self._buffer is not None:
+            return self._buffer
+        with self._lock:
+            if self._mm is None:
+                self._fh = open(self.zip_path, 'rb')
+                self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mm
+
+    def member_view(self, name: str):
+        """STORED 成员返回零拷贝文件视图；其它情况返回 None。"""
+        if not self.use_mmap and self._buffer is None:
+            return None
+        info = self.zf.getinfo(name)
+        if info.compress_type != zipfile.ZIP_STORED:
+            return None
+        buf = self._archive_buffer()
+        span = _stored_member_span(info, lambda off, n: _copy_range(buf, off, n))
+        if span is None:
+            return None
+        offset, length = span
+        view = ReadOnlyBufferFile(buf, offset, length, name=name)
+        self._views.append(view)
+        return view
+
+    def _inflate_member(self, name: str, reuse: bool) -> ReadOnlyBufferFile:
+        # 按块解压到一次分配好的 bytearray：ZipExtFile.read() 会拼接 bytes，瞬时占用约两倍成员大小
+        info = self.zf.getinfo(name)
+        buf = getattr(self._scratch, 'buf', None) if reuse else None
+        if buf is None or len(buf) < info.file_size:
+            buf = bytearray(info.file_size)
+            if reuse:
+                self._scratch.buf = buf
+        view = memoryview(buf)
+        pos = 0
+        with self.zf.open(info, 'r') as fh:
+            while pos < info.file_size:
+                n = fh.readinto(view[pos:pos + INFLATE_CHUNK_BYTES])
+                if not n:
+                    break
+                pos += n
+        view.release()
+        return ReadOnlyBufferFile(buf, 0, pos, name=name)
+
+    def open_member(self, name: str, reuse: bool = False):
+        """返回可供 xarray/h5netcdf 打开的只读文件对象（STORED 成员零拷贝，其它成员解压到内存）。
+
+        reuse=True 时压缩成员解压到本线程复用的缓冲区，结果只在本线程下一次
+        open_member(reuse=True) 之前有效（调用方须先消费完，例如立即归约）。
+        """
+        try:
+            view = self.member_view(name)
+        except Exception:
+            view = None
+        if view is not None:
+            return view
+        return self._inflate_member(name, reuse)
+
+    def close(self):
+        for v in self._views:
+            try:
+                v.close()
+            except Exception:
+                pass
+        self._views = []
+        try:
+            self.zf.close()
+        except Exception:
+            pass
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except Exception:
+                pass
+            self._mm = None
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_file_bytes(path: str, chunk_size: int = READAHEAD_CHUNK_BYTES) -> bytearray:
+    """以大块顺序读取整个文件到预分配的 bytearray（readinto，无中间拷贝）。"""
+    size = os.path.getsize(path)
+    buf = bytearray(size)
+    view = memoryview(buf)
+    pos = 0
+    with open(path, 'rb', buffering=0) as fh:
+        while pos < size:
+            n = fh.readinto(view[pos:pos + chunk_size])
+            if not n:
+                break
+            pos += n
+    view.release()
+    if pos < size:
+        del buf[pos:]
+    return buf
+
+
+class ZipPrefetcher:
+    """有界的 ZIP 预读生产者：后台 I/O 线程按顺序以大块读取后续 N 个压缩包的字节。
+
+    迭代得到 (path, data, error)，data 为 bytearray（读取失败时为 None，error 为异常）。
+    消费者处理完一个包后必须调用 release(len(data))，以便 I/O 线程在内存上限内继续预读。
+    depth 限制已读取但未被取走的包数；max_bytes 限制已读取但未 release 的总字节数
+    （单个包超过上限时仍会在无在途字节时读取，避免死锁）。
+    """
+
+    def __init__(self, paths, depth: int = READAHEAD_DEPTH, max_bytes: int = READAHEAD_MAX_BYTES,
+                 chunk_size: int = READAHEAD_CHUNK_BYTES):
+        self.paths = list(paths)
+        self.depth = max(1, int(depth))
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self._queue = []
+        self._outstanding = 0
+        self._done = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='zip-prefetch', daemon=True)
+            self._thread.start()
+        return self
+
+    def _has_room(self, size):
+        if len(self._queue) >= self.depth:
+            return False
+        if self.max_bytes and self._outstanding > 0 and self._outstanding + size > self.max_bytes:
+            return False
+        return True
+
+    def _run(self):
+        try:
+            for p in self.paths:
+                try:
+                    size = os.path.getsize(p)
+                except Exception:
+                    size = 0
+                with self._cond:
+                    while not self._closed and not self._has_room(size):
+                        self._cond.wait()
+                    if self._closed:
+                        return
+                    # 先占用额度，读取在锁外进行
+                    self._outstanding += size
+                try:
+                    data, err = read_file_bytes(p, self.chunk_size), None
+                except Exception as e:
+                    data, err = None, e
+                with self._cond:
+                    actual = len(data) if data is not None else 0
+                    self._outstanding += actual - size
+                    self._queue.append((p, data, err))
+                    self._cond.notify_all()
+        finally:
+            with self._cond:
+                self._done = True
+                self._cond.notify_all()
+
+    def __iter__(self):
+        self.start()
+        while True:
+            with self._cond:
+                while not self._queue and not self._done:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                item = self._queue.pop(0)
+                self._cond.notify_all()
+            yield item
+
+    def release(self, nbytes: int):
+        with self._cond:
+            self._outstanding = max(0, self._outstanding - int(nbytes or 0))
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._queue.clear()
+            self._cond.notify_all()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
\ No newline at end of file
@@ -3,8 +3,8 @@
 根据处理后的 CSV/聚合数据预先计算热图 JSON 文件和城市质心。
 
 该脚本将：
- -通过对每个城市的经度/纬度进行平均来计算“resources/city_centroids.json”
-   `resources/processed/city/{year}/**/*.csv` 其中存在 `lon` 和 `lat` 列。
+ -由 GADM 市级多边形（或各市拥有的格点，见 util.admin_points）计算每个市的质心与标注点，
+   写出 `resources/city_centroids.json`（按边界文件缓存，只算一次）。
  -在“resources/heatmap/monthly/{YYYYMM}.json”下生成每月热图 JSON 文件。
 
 热图 JSON 格式：对象列表 {"city":..., "province":..., "lon":..., "lat":..., "value":...}
@@ -22,90 +22,159 @@ def ensure_dir(p):
         os.makedirs(p, exist_ok=True)
 
 
-def compute_city_centroids(year=None):
-    base = os.path.join('resources', 'processed', 'city')
-    pattern = os.path.join(base, '**', '*.csv') if year is None else os.path.join(base, str(year), '**', '*.csv')
-    files = sorted(glob.glob(pattern, recursive=True))
-    records = {}
-    for f in files:
+def _admin_points_api():
+    # 以独立脚本运行（无 src 包）时无法计算质心，只能读取已有的 city_centroids.json
+    try:
+        from src import config as _config
+        from .admin_points import get_admin_points, city_records
+    except ImportError:
+        return None
+    return _config, get_admin_points, city_records
+
+
+def compute_city_centroids(year=None, admin_geojson=None, source=None, out=None):
+    """计算各市的质心与标注点（util.admin_points，按边界文件缓存）并写出 city_centroids.json。
+
+    source 默认 config.ADMIN_POINTS_SOURCE：'polygon' 用 GADM 多边形；'cells' 用 year 的 grid 日文件网格上
+    每个市拥有的格点（没有 grid 日文件时回退为 'polygon'）。边界文件不存在时返回空字典。
+    """
+    api = _admin_points_api()
+    if api is None:
+        print('city centroids need the src package (run from the processing directory)')
+        return {}
+    config, get_admin_points, city_records = api
+    admin_geojson = admin_geojson or config.ADMIN_GEOJSON
+    if not admin_geojson or not os.path.exists(admin_geojson):
+        print('No admin geojson found for city centroids:', admin_geojson)
+        return {}
+    source = source or config.ADMIN_POINTS_SOURCE
+    lat = lon = None
+    if source == 'cells':
+        from .grid_cube import grid_coords
         try:
-            df = pd.read_csv(f)
-            df.columns = [c.strip().lower() for c in df.columns]
-            if 'city' not in df.columns:
-                continue
-            if 'lon' not in df.columns or 'lat' not in df.columns:
-                continue
-            for _, r in df.iterrows():
-                city = r.get('city')
-                if pd.isna(city):
-                    continue
-                try:
-                    lon = float(r.get('lon'))
-                    lat = float(r.get('lat'))
-                except Exception:
-                    continue
-                key = str(city)
-                if key not in records:
-                    records[key] = { 'sum_lon': 0.0, 'sum_lat': 0.0, 'n': 0, 'province': r.get('province') }
-                records[key]['sum_lon'] += lon
-                records[key]['sum_lat'] += lat
-                records[key]['n'] += 1
-        except Exception as e:
-            print('skipping', f, e)
-    centroids = {}
-    for k, v in records.items():
-        if v['n'] > 0:
-            centroids[k] = { 'city': k, 'lon': v['sum_lon'] / v['n'], 'lat': v['sum_lat'] / v['n'], 'count': v['n'], 'province': v.get('province') }
-    out = os.path.join('resources', 'city_centroids.json')
-    ensure_dir(os.path.dirname(out))
-    with open(out, 'w', encoding='utf-8') as fh:
-        json.dump(centroids, fh, ensure_ascii=False, indent=2)
-    print('Wrote city centroids to', out, 'entries=', len(centroids))
+            lat, lon = grid_coords(year)
+        except FileNotFoundError as e:
+            # 内存流水线（city 等粒度的 all）通常不写 grid 日文件，此时改用多边形质心
+            print(f"{e}; using polygon centroids instead of cells")
+            source = 'polygon'
+    centroids = city_records(get_admin_points(admin_geojson, source=source, lat=lat, lon=lon), source=source)
+    out = out or config.CITY_CENTROIDS_JSON
+    text = json.dumps(centroids, ensure_ascii=False, indent=2)
+    old = None
+    if os.path.exists(out):
+        with open(out, 'r', encoding='utf-8') as fh:
+            old = fh.read()
+    if old != text:
+        ensure_dir(os.path.dirname(out))
+        with open(out, 'w', encoding='utf-8') as fh:
+            fh.write(text)
+        print('Wrote city centroids to', out, 'entries=', len(centroids))
     return centroids
 
 
+def _centroid_for(centroids, prov, city):
+    if not centroids or city is None or pd.isna(city):
+        return None
+    c = centroids.get(f'{prov}|{city}') or centroids.get(city)
+    if c is None:
+        return None
+    # 标注点保证落在市域内，优先于几何质心
+    return c.get('label_lon', c['lon']), c.get('label_lat', c['lat'])
+
+
+def heatmap_rows(df, centroids=None):
+    """把一个月的聚合 DataFrame 转成热图点列表（列名需已小写）。"""
+    rows = []
+    # prefer lon/lat in aggregated rows if present, else look up centroids by city
+    for _, r in df.iterrows():
+        city = r.get('city')
+        prov = r.get('province')
+        value = None
+        # choose a primary pollutant value if available (pm25) else first numeric
+        if 'pm25' in r and not pd.isna(r['pm25']):
+            value = float(r['pm25'])
+        else:
+            # try to find first numeric among common pollutants
+            for k in ['pm10','so2','no2','co','o3']:
+                if k in r and not pd.isna(r[k]):
+                    value = float(r[k]); break
+        lon = r.get('lon') if 'lon' in r else None
+        lat = r.get('lat') if 'lat' in r else None
+        try:
+            lon = float(lon) if lon is not None and str(lon) != '' else None
+            lat = float(lat) if lat is not None and str(lat) != '' else None
+        except Exception:
+            lon = lat = None
+        if lon is None or lat is None:
+            lon, lat = _centroid_for(centroids, prov, city) or (None, None)
+        if lon is None or lat is None:
+            continue
+        rows.append({'city': city, 'province': prov, 'lon': lon, 'lat': lat, 'value': value})
+    return rows
+
+
+def write_monthly_heatmap(df, ym, centroids=None, out_base=None):
+    """为单个月（ym 形如 '201301'）写出热图 JSON，返回输出路径。"""
+    out_base = out_base or os.path.join('resources', 'heatmap', 'monthly')
+    ensure_dir(out_base)
+    df = df.rename(columns={c: c.strip().lower() for c in df.columns})
+    rows = heatmap_rows(df, centroids)
+    out_file = os.path.join(out_base, f"{ym}.json")
+    with open(out_file, 'w', encoding='utf-8') as fh:
+        json.dump(rows, fh, ensure_ascii=False, indent=2)
+    print('Wrote heatmap', out_file, 'points=', len(rows))
+    return out_file
+
+
+def raster_heatmap_rows(raster, lat, lon):
+    """把规则栅格（ny × nx，见 util.regrid）转成热图点列表，每个非空格一个点（city/province 为空）。"""
+    import numpy as np
+    raster = np.asarray(raster)
+    j, i = np.nonzero(~np.isnan(raster))
+    return [{'city': None, 'province': None, 'lon': float(lon[b]), 'lat': float(lat[a]), 'value': float(raster[a, b])}
+            for a, b in zip(j, i)]
+
+
+def write_raster_heatmap(raster, lat, lon, ym, out_base=None):
+    """用重网格化后的栅格写出热图 JSON（替代按城市质心的点），返回输出路径。"""
+    out_base = out_base or os.path.join('resources', 'heatmap', 'raster')
+    ensure_dir(out_base)
+    rows = raster_heatmap_rows(raster, lat, lon)
+    out_file = os.path.join(out_base, f"{ym}.json")
+    with open(out_file, 'w', encoding='utf-8') as fh:
+        json.dump(rows, fh, ensure_ascii=False)
+    print('Wrote raster heatmap', out_file, 'points=', len(rows))
+    return out_file
+
+
+def load_city_centroids(path=None, admin_geojson=None):
+    """返回 {市: 质心/标注点}：有边界文件时由缓存的行政区点位生成（必要时更新 path），
+    否则读取之前写出的 city_centroids.json；都没有时返回空字典。"""
+    path = path or os.path.join('resources', 'city_centroids.json')
+    api = _admin_points_api()
+    if api is not None:
+        geo = admin_geojson or api[0].ADMIN_GEOJSON
+        if geo and os.path.exists(geo):
+            return compute_city_centroids(admin_geojson=geo, out=path)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as fh:
+            return json.load(fh)
+    except Exception as e:
+        print('Failed to read centroids', path, e)
+        return {}
+
+
 def build_monthly_heatmaps(year, centroids=None):
     agg_dir = os.path.join('resources', 'aggregated', str(year))
     pattern = os.path.join(agg_dir, '*.csv')
     files = sorted(glob.glob(pattern))
-    out_base = os.path.join('resources', 'heatmap', 'monthly')
-    ensure_dir(out_base)
     for f in files:
         try:
             df = pd.read_csv(f)
-            df.columns = [c.strip().lower() for c in df.columns]
-            fname = os.path.basename(f)
-            ym = os.path.splitext(fname)[0]
-            out_file = os.path.join(out_base, f"{ym}.json")
-            rows = []
-            # prefer lon/lat in aggregated rows if present, else look up centroids by city
-            for _, r in df.iterrows():
-                city = r.get('city')
-                prov = r.get('province')
-                value = None
-                # choose a primary pollutant value if available (pm25) else first numeric
-                if 'pm25' in r and not pd.isna(r['pm25']):
-                    value = float(r['pm25'])
-                else:
-                    # try to find first numeric among common pollutants
-                    for k in ['pm10','so2','no2','co','o3']:
-                        if k in r and not pd.isna(r[k]):
-                            value = float(r[k]); break
-                lon = r.get('lon') if 'lon' in r else None
-                lat = r.get('lat') if 'lat' in r else None
-                try:
-                    lon = float(lon) if lon is not None and str(lon) != '' else None
-                    lat = float(lat) if lat is not None and str(lat) != '' else None
-                except Exception:
-                    lon = lat = None
-                if (lon is None or lat is None) and centroids and city and city in centroids:
-                    lon = centroids[city]['lon']; lat = centroids[city]['lat']
-                if lon is None or lat is None:
-                    continue
-                rows.append({'city': city, 'province': prov, 'lon': lon, 'lat': lat, 'value': value})
-            with open(out_file, 'w', encoding='utf-8') as fh:
-                json.dump(rows, fh, ensure_ascii=False, indent=2)
-            print('Wrote heatmap', out_file, 'points=', len(rows))
+            ym = os.path.splitext(os.path.basename(f))[0]
+            write_monthly_heatmap(df, ym, centroids)
         except Exception as e:
             print('Failed to build heatmap for', f, e)
 
@@ -0,0 +1,170 @@
+"""自定义区域（京津冀、长三角、流域等任意多边形集合）的逐日序列。
+
+区域文件可以是任何 geopandas 能读取的多边形（GeoJSON/Shapefile/GeoPackage），无需改动 GADM 或重新 extract：
+第一次使用时把区域栅格化到 CN-Reanalysis 网格上，得到格点 × 区域的稀疏权重表
+（'overlap' 为格点足迹落在区域内的面积比例，默认乘以格点面积；'centroid' 为格点中心是否在区域内），
+按网格与区域文件的指纹缓存到 REGION_CACHE_DIR；之后任意日期范围都从 grid 日文件（或已加载的 GridCube）
+按变量做一次稀疏矩阵乘法得到区域均值。同名的多个多边形合并为一个区域，区域之间可以重叠。
+
+用法（在 processing 目录下）：
+    python run_pipeline.py regions --regions jjj_yrd.geojson --year 2013
+    python run_pipeline.py regions --regions basins.shp --name-field BASIN --start 20130101 --end 20130331 --output basins.csv
+"""
+import os
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src import config as _config
+from .admin_index import AdminUnits, grid_key, source_key, _round_coords
+
+_NAME_FIELDS = ('name', 'NAME', 'Name', 'region', 'REGION', 'NL_NAME_1', 'NAME_1', 'id', 'ID')
+
+
+def _name_column(gdf, name_field: Optional[str] = None) -> Optional[str]:
+    if name_field:
+        if name_field not in gdf.columns:
+            raise KeyError(f"name field {name_field!r} not in {list(gdf.columns)}")
+        return name_field
+    return next((c for c in _NAME_FIELDS if c in gdf.columns), None)
+
+
+def read_regions(regions_path: str, name_field: Optional[str] = None):
+    """读取区域多边形，返回 (名称列表[每个多边形], 几何数组)；没有名称列时用 region_<序号>。"""
+    import geopandas as gpd
+
+    gdf = gpd.read_file(regions_path)
+    try:
+        gdf = gdf.to_crs(epsg=4326)
+    except Exception:
+        pass
+    gdf = gdf[gdf.geometry.notna() & ~gdf.geometry.is_empty]
+    col = _name_column(gdf, name_field)
+    if col is None:
+        names = [f'region_{i}' for i in range(len(gdf))]
+    else:
+        names = [str(v).strip() if v is not None and str(v).strip() else f'region_{i}'
+                 for i, v in enumerate(gdf[col].tolist())]
+    return names, np.asarray(gdf.geometry.values, dtype=object)
+
+
+class RegionWeights(AdminUnits):
+    """格点 × 区域的稀疏权重；聚合接口与 AdminUnits 相同，层级固定为 'region'，键列为 region。"""
+
+    def __init__(self, names, matrix, method: str = 'overlap', area_weighted: bool = True):
+        super().__init__([], [], [])
+        self.names = np.asarray(names, dtype=object)
+        self.matrix = matrix.tocsr()
+        self.method = method
+        self.area_weighted = bool(area_weighted)
+
+    @property
+    def n_cells(self) -> int:
+        return int(self.matrix.shape[0])
+
+    def n_units(self, level: str = 'region') -> int:
+        return int(self.names.size)
+
+    def keys(self, level: str = 'region') -> pd.DataFrame:
+        return pd.DataFrame({'region': self.names})
+
+    def weight_matrix(self, level: str = 'region'):
+        return self.matrix
+
+    def save(self, path: str) -> str:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        m = self.matrix
+        tmp = path + '.tmp.npz'
+        np.savez_compressed(tmp, names=self.names.astype(str), data=m.data, indices=m.indices, indptr=m.indptr,
+                            shape=np.array(m.shape), method=np.array(self.method),
+                            area_weighted=np.array(self.area_weighted))
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> 'RegionWeights':
+        from scipy import sparse
+
+        with np.load(path, allow_pickle=False) as z:
+            m = sparse.csr_matrix((z['data'], z['indices'], z['indptr']), shape=tuple(z['shape']))
+            return cls(z['names'].tolist(), m, method=str(z['method']), area_weighted=bool(z['area_weighted']))
+
+
+def build_region_weights(lat, lon, regions_path: str, name_field: Optional[str] = None,
+                         method: str = 'overlap', area_weighted: bool = True) -> RegionWeights:
+    """把区域多边形栅格化到网格（lat/lon 为按行展开的格点中心），不读写缓存。"""
+    import shapely
+    from scipy import sparse
+    from .admin_weights import overlap_fractions, _one_hot
+
+    feat_names, geoms = read_regions(regions_path, name_field)
+    names = list(dict.fromkeys(feat_names))
+    lookup = {n: i for i, n in enumerate(names)}
+    feat_region = np.array([lookup[n] for n in feat_names], dtype=np.int32)
+    lat = np.asarray(lat, dtype=np.float64).ravel()
+    lon = np.asarray(lon, dtype=np.float64).ravel()
+
+    if method == 'overlap':
+        from .grid_geometry import reshape_grid, cell_polygons, cell_areas_km2
+        lat2d, lon2d = reshape_grid(lat, lon)
+        m = overlap_fractions(cell_polygons(lat2d, lon2d), geoms) @ _one_hot(feat_region, len(names))
+        # 同名多边形相互重叠时比例可能超过 1
+        m = m.tocsr()
+        m.data = np.minimum(m.data, 1.0)
+        if area_weighted:
+            m = sparse.diags(cell_areas_km2(lat2d, lon2d)) @ m
+    elif method == 'centroid':
+        tree = shapely.STRtree(geoms)
+        pi, gi = tree.query(shapely.points(lon, lat), predicate='within')
+        m = sparse.csr_matrix((np.ones(pi.size), (pi, feat_region[gi])), shape=(lat.size, len(names)))
+        m.data = np.minimum(m.data, 1.0)
+    else:
+        raise ValueError(f'未知的 method: {method}')
+    return RegionWeights(names, m.tocsr(), method=method, area_weighted=area_weighted and method == 'overlap')
+
+
+_LOADED: Dict[Tuple, RegionWeights] = {}
+
+
+def get_region_weights(lat, lon, regions_path: str, name_field: Optional[str] = None, method: str = 'overlap',
+                       area_weighted: bool = True, cache_dir: Optional[str] = None) -> RegionWeights:
+    """返回区域权重：依次查进程内缓存、磁盘缓存，都没有时栅格化并写入磁盘。"""
+    lat_r, lon_r = _round_coords(lat, lon)
+    key = (grid_key(lat_r, lon_r), source_key(regions_path), name_field or '', method, bool(area_weighted))
+    weights = _LOADED.get(key)
+    if weights is not None:
+        return weights
+    cache_dir = cache_dir or _config.REGION_CACHE_DIR
+    tag = f"{method}_{'area' if area_weighted and method == 'overlap' else 'frac'}"
+    field = f"_{name_field}" if name_field else ''
+    base = os.path.splitext(os.path.basename(regions_path))[0]
+    path = os.path.join(cache_dir, f"{base}{field}_{key[0]}_{key[1]}_{tag}.npz")
+    if os.path.exists(path):
+        try:
+            weights = RegionWeights.load(path)
+        except Exception:
+            weights = None
+    if weights is None or weights.n_cells != lat_r.size:
+        weights = build_region_weights(lat, lon, regions_path, name_field, method=method, area_weighted=area_weighted)
+        try:
+            weights.save(path)
+            print(f"[regions] built {path} (regions={weights.names.size} nnz={weights.matrix.nnz})")
+        except Exception as e:
+            print(f"[regions] could not save {path}: {e}")
+    _LOADED[key] = weights
+    return weights
+
+
+def region_series(regions_path: str, year: Optional[int] = None, start: Optional[str] = None,
+                  end: Optional[str] = None, variables: Optional[Sequence[str]] = None,
+                  name_field: Optional[str] = None, method: str = 'overlap', area_weighted: bool = True,
+                  processed_root: Optional[str] = None, cube=None) -> pd.DataFrame:
+    """区域逐日均值长表（time, region, 变量...）。cube 为已加载的 GridCube 时不再读取日文件。"""
+    if cube is None:
+        from .grid_cube import load_grid_cube
+        cube = load_grid_cube(year, variables=variables, processed_root=processed_root, start=start, end=end)
+    weights = get_region_weights(cube.lat, cube.lon, regions_path, name_field=name_field, method=method,
+                                 area_weighted=area_weighted)
+    values = cube.values if not variables else {v: cube.values[v] for v in variables if v in cube.values}
+    return weights.cube_frame(cube.days, values, 'region')
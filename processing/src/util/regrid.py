@@ -0,0 +1,209 @@
+"""曲线网格（lat2d/lon2d）到规则经纬度栅格（如 0.1° / 0.25°）的重网格化。
+
+权重只计算一次并以稀疏矩阵（目标栅格 × 源格点）缓存到 REGRID_CACHE_DIR，之后任意日/月/变量都是一次稀疏矩阵乘法：
+  - 'bilinear'：在源格点中心的 Delaunay 三角网上做重心坐标线性插值（曲线网格上与双线性等价的做法），
+    每个目标点 3 个权重；落在源网格外的目标点为 NaN。
+  - 'conservative'：一阶守恒，权重为目标格与源格点足迹（grid_geometry.cell_polygons）的重叠面积比例，
+    目标格均值等于其覆盖源格点的面积加权平均。
+缺测源格点会被跳过并对剩余权重重新归一化。
+
+用法（在 processing 目录下）：
+    python run_pipeline.py regrid --year 2013 --res 0.25 --period month
+    python run_pipeline.py regrid --year 2013 --res 0.1 --method conservative --period day --vars pm25 --format nc
+"""
+import os
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src import config as _config
+from .admin_index import grid_key, _round_coords
+
+METHODS = ('bilinear', 'conservative')
+
+
+class RegularGrid:
+    """规则经纬度栅格：lat/lon 为格心轴（升序），格距 res 度。"""
+
+    def __init__(self, lat_min: float, lat_max: float, lon_min: float, lon_max: float, res: float):
+        self.res = float(res)
+        self.lat = np.round(np.arange(lat_min + res / 2, lat_max, res), 6)
+        self.lon = np.round(np.arange(lon_min + res / 2, lon_max, res), 6)
+
+    @classmethod
+    def covering(cls, lat, lon, res: float) -> 'RegularGrid':
+        """覆盖源格点范围、边界对齐到 res 整数倍的栅格。"""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        return cls(np.floor(np.nanmin(lat) / res) * res, np.ceil(np.nanmax(lat) / res) * res,
+                   np.floor(np.nanmin(lon) / res) * res, np.ceil(np.nanmax(lon) / res) * res, res)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.lat.size, self.lon.size
+
+    def key(self) -> str:
+        return f"{self.res:g}_{self.lat[0]:g}_{self.lon[0]:g}_{self.lat.size}x{self.lon.size}"
+
+    def cell_boxes(self):
+        import shapely
+        lon2d, lat2d = np.meshgrid(self.lon, self.lat)
+        h = self.res / 2
+        return shapely.box((lon2d - h).ravel(), (lat2d - h).ravel(), (lon2d + h).ravel(), (lat2d + h).ravel())
+
+
+def bilinear_weights(lat, lon, target: RegularGrid):
+    """源格点中心 Delaunay 三角网上的重心坐标权重（目标点 × 源格点）。"""
+    from scipy import sparse
+    from scipy.spatial import Delaunay
+
+    lat = np.asarray(lat, dtype=np.float64).ravel()
+    lon = np.asarray(lon, dtype=np.float64).ravel()
+    # 经度按中心纬度的 cos 缩放，使三角形接近等距
+    scale = np.cos(np.deg2rad(np.nanmean(lat)))
+    tri = Delaunay(np.column_stack([lon * scale, lat]))
+    tlon, tlat = np.meshgrid(target.lon, target.lat)
+    pts = np.column_stack([tlon.ravel() * scale, tlat.ravel()])
+    simplex = tri.find_simplex(pts)
+    inside = np.flatnonzero(simplex >= 0)
+    trans = tri.transform[simplex[inside]]
+    b = np.einsum('ijk,ik->ij', trans[:, :2], pts[inside] - trans[:, 2])
+    bary = np.column_stack([b, 1 - b.sum(axis=1)])
+    cols = tri.simplices[simplex[inside]]
+    rows = np.repeat(inside, 3)
+    w = np.clip(bary.ravel(), 0, None)
+    keep = w > 0
+    return sparse.csr_matrix((w[keep], (rows[keep], cols.ravel()[keep])), shape=(pts.shape[0], lat.size))
+
+
+def conservative_weights(lat, lon, target: RegularGrid):
+    """目标格与源格点足迹的重叠面积比例（目标格 × 源格点）。"""
+    from .admin_weights import overlap_fractions
+    from .grid_geometry import reshape_grid, cell_polygons
+
+    lat2d, lon2d = reshape_grid(lat, lon)
+    # overlap_fractions(目标格, 源足迹) 的每个元素是目标格被该源格点覆盖的面积比例；源足迹是四边形，无需裁剪
+    return overlap_fractions(target.cell_boxes(), cell_polygons(lat2d, lon2d), clip=False)
+
+
+class Regridder:
+    """缓存的重网格化算子：matrix 为 (目标栅格格数 × 源格点数) 的稀疏权重。"""
+
+    def __init__(self, target: RegularGrid, matrix, method: str):
+        self.target = target
+        self.matrix = matrix.tocsr()
+        self.method = method
+
+    @property
+    def n_cells(self) -> int:
+        return int(self.matrix.shape[1])
+
+    def apply(self, values: np.ndarray) -> np.ndarray:
+        """values 为 (格点,) 或 (时次 × 格点)；返回 (ny, nx) 或 (时次, ny, nx) 的 float32 栅格，跳过 NaN。"""
+        arr = np.asarray(values)
+        single = arr.ndim == 1
+        block = np.atleast_2d(arr)
+        if block.shape[1] != self.n_cells:
+            raise ValueError(f'期望 {self.n_cells} 个格点，实际 {block.shape[1]}')
+        ok = ~np.isnan(block)
+        sums = np.asarray(self.matrix @ np.where(ok, block, 0).astype(np.float64).T).T
+        wsum = np.asarray(self.matrix @ ok.astype(np.float64).T).T
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out = np.where(wsum > 0, sums / np.where(wsum > 0, wsum, 1), np.nan).astype(np.float32)
+        out = out.reshape((-1,) + self.target.shape)
+        return out[0] if single else out
+
+    def save(self, path: str) -> str:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        m, t = self.matrix, self.target
+        tmp = path + '.tmp.npz'
+        np.savez_compressed(tmp, data=m.data, indices=m.indices, indptr=m.indptr, shape=np.array(m.shape),
+                            lat=t.lat, lon=t.lon, res=np.array(t.res), method=np.array(self.method))
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> 'Regridder':
+        from scipy import sparse
+
+        with np.load(path, allow_pickle=False) as z:
+            target = RegularGrid.__new__(RegularGrid)
+            target.res, target.lat, target.lon = float(z['res']), z['lat'], z['lon']
+            m = sparse.csr_matrix((z['data'], z['indices'], z['indptr']), shape=tuple(z['shape']))
+            return cls(target, m, str(z['method']))
+
+
+_LOADED: Dict[Tuple, Regridder] = {}
+
+
+def get_regridder(lat, lon, res: float = 0.25, method: str = 'bilinear', target: Optional[RegularGrid] = None,
+                  cache_dir: Optional[str] = None) -> Regridder:
+    """返回网格到规则栅格的重网格化算子：依次查进程内缓存、磁盘缓存，都没有时计算并写入磁盘。"""
+    if method not in METHODS:
+        raise ValueError(f'未知的 method: {method}')
+    target = target or RegularGrid.covering(lat, lon, res)
+    lat_r, lon_r = _round_coords(lat, lon)
+    key = (grid_key(lat_r, lon_r), target.key(), method)
+    rg = _LOADED.get(key)
+    if rg is not None:
+        return rg
+    path = os.path.join(cache_dir or _config.REGRID_CACHE_DIR, f"{key[0]}_{key[1]}_{method}.npz")
+    if os.path.exists(path):
+        try:
+            rg = Regridder.load(path)
+        except Exception:
+            rg = None
+    if rg is None or rg.n_cells != lat_r.size:
+        build = bilinear_weights if method == 'bilinear' else conservative_weights
+        rg = Regridder(target, build(lat, lon, target), method)
+        try:
+            rg.save(path)
+            print(f"[regrid] built {path} ({target.shape[0]}x{target.shape[1]} nnz={rg.matrix.nnz})")
+        except Exception as e:
+            print(f"[regrid] could not save {path}: {e}")
+    _LOADED[key] = rg
+    return rg
+
+
+def period_means(cube, period: str = 'month') -> Dict[str, Dict[str, np.ndarray]]:
+    """把 GridCube 按 day/month/all 分组为 {周期标签: {变量: (格点,) 均值}}（月/全部取各天的 nanmean）。"""
+    import warnings
+
+    if period == 'day':
+        return {d: {v: arr[i] for v, arr in cube.values.items()} for i, d in enumerate(cube.days)}
+    labels = [d[:6] for d in cube.days] if period == 'month' else ['all'] * len(cube.days)
+    out = {}
+    for label in dict.fromkeys(labels):
+        sel = np.array([lab == label for lab in labels])
+        with np.errstate(invalid='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            out[label] = {v: np.nanmean(arr[sel], axis=0) for v, arr in cube.values.items()}
+    return out
+
+
+def write_raster(path: str, target: RegularGrid, fields: Dict[str, np.ndarray], fmt: str = 'npz') -> str:
+    """保存一个周期的栅格：npz（lat/lon 轴 + 各变量 float32 数组）或 netCDF（需要 xarray）。"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    if fmt == 'nc':
+        import xarray as xr
+        ds = xr.Dataset({v: (('lat', 'lon'), a) for v, a in fields.items()}, coords={'lat': target.lat, 'lon': target.lon})
+        ds.attrs['res_deg'] = target.res
+        ds.to_netcdf(path)
+    else:
+        np.savez_compressed(path, lat=target.lat, lon=target.lon, **fields)
+    return path
+
+
+def regrid_cube(cube, res: float = 0.25, method: str = 'bilinear', period: str = 'month',
+                variables: Optional[Sequence[str]] = None) -> Tuple[RegularGrid, Dict[str, Dict[str, np.ndarray]]]:
+    """把 GridCube 重网格化：返回 (目标栅格, {周期标签: {变量: (ny, nx)}})。每个变量所有周期一次稀疏乘法。"""
+    rg = get_regridder(cube.lat, cube.lon, res=res, method=method)
+    means = period_means(cube, period)
+    labels = list(means)
+    names = [v for v in (variables or cube.values) if v in cube.values]
+    out = {label: {} for label in labels}
+    for v in names:
+        rasters = rg.apply(np.stack([means[label][v] for label in labels]))
+        for label, r in zip(labels, rasters):
+            out[label][v] = r
+    return rg.target, out
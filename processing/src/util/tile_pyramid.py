@@ -0,0 +1,175 @@
+"""可缩放污染地图用的多分辨率栅格瓦片金字塔。
+
+底层是重网格化后的规则经纬度栅格（util.regrid，默认 0.1°），逐级按 2×2、4×4、8×8 块做 NaN 感知的块平均；
+每级切成 tile_size × tile_size 的瓦片，数值量化为 uint8/uint16（value = offset + q * scale，最大码值表示缺测），
+以原始小端字节写成 {var}/{period}/{level}/{ty}_{tx}.bin，全空瓦片不写文件。
+manifest.json 记录各级的形状/分辨率/瓦片行列数、栅格边界（行 0 为最南端）以及每个变量与周期的 scale/offset，
+前端只需按当前视野与缩放级别取对应瓦片（0.1° 的 128×128 uint8 瓦片为 16 KB），不再下载整份热图 JSON。
+
+用法（在 processing 目录下）：
+    python run_pipeline.py tiles --year 2013 --period month --vars pm25,o3
+    python run_pipeline.py tiles --year 2013 --period day --bits 16 --levels 1,2,4,8,16
+"""
+import json
+import os
+import shutil
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+MANIFEST = 'manifest.json'
+
+
+def block_mean(raster: np.ndarray, factor: int) -> np.ndarray:
+    """factor × factor 块的 NaN 感知均值（边缘不足一块时按实际格数平均）。"""
+    if factor == 1:
+        return np.asarray(raster, dtype=np.float32)
+    ny, nx = raster.shape
+    py, px = -ny % factor, -nx % factor
+    a = np.pad(np.asarray(raster, dtype=np.float64), ((0, py), (0, px)), constant_values=np.nan)
+    ok = ~np.isnan(a)
+    shape = (a.shape[0] // factor, factor, a.shape[1] // factor, factor)
+    sums = np.where(ok, a, 0).reshape(shape).sum(axis=(1, 3))
+    counts = ok.reshape(shape).sum(axis=(1, 3))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan).astype(np.float32)
+
+
+def quantization(values: Iterable[np.ndarray], bits: int = 8) -> Tuple[float, float]:
+    """返回覆盖所有数组取值范围的 (scale, offset)；最大码值 2**bits-1 留作缺测。"""
+    lo, hi = np.inf, -np.inf
+    for v in values:
+        if np.isfinite(v).any():
+            lo = min(lo, float(np.nanmin(v)))
+            hi = max(hi, float(np.nanmax(v)))
+    if not np.isfinite(lo):
+        return 1.0, 0.0
+    levels = (1 << bits) - 2
+    return ((hi - lo) / levels) if hi > lo else 1.0, lo
+
+
+def quantize(raster: np.ndarray, scale: float, offset: float, bits: int = 8) -> np.ndarray:
+    dtype = np.uint8 if bits == 8 else np.uint16
+    nodata = (1 << bits) - 1
+    raster = np.asarray(raster, dtype=np.float64)
+    q = np.clip(np.rint(np.nan_to_num((raster - offset) / scale, nan=0.0)), 0, nodata - 1)
+    return np.where(np.isnan(raster), nodata, q).astype(dtype)
+
+
+def dequantize(codes: np.ndarray, scale: float, offset: float, bits: int = 8) -> np.ndarray:
+    """quantize 的逆变换（缺测码值还原为 NaN），便于校验与 Python 端读取。"""
+    out = offset + codes.astype(np.float32) * np.float32(scale)
+    return np.where(codes == (1 << bits) - 1, np.nan, out).astype(np.float32)
+
+
+def level_info(base_shape: Tuple[int, int], res: float, factors: Sequence[int], tile_size: int):
+    out = []
+    for level, f in enumerate(factors):
+        ny, nx = -(-base_shape[0] // f), -(-base_shape[1] // f)
+        out.append({'level': level, 'factor': int(f), 'res': round(res * f, 6), 'shape': [ny, nx],
+                    'tiles': [-(-ny // tile_size), -(-nx // tile_size)]})
+    return out
+
+
+def write_pyramid(out_dir: str, var: str, period: str, raster: np.ndarray, factors: Sequence[int],
+                  tile_size: int, bits: int, scale: float, offset: float) -> Dict[str, int]:
+    """写出一个变量/周期的全部瓦片，返回 {'tiles': 写出的瓦片数, 'bytes': 总字节数}。
+
+    先清空 {var}/{period}：重建后变为全空的瓦片不写文件，旧文件若留着前端会读到过期数据。
+    """
+    written = total = 0
+    nodata = (1 << bits) - 1
+    period_dir = os.path.join(out_dir, var, period)
+    if os.path.isdir(period_dir):
+        shutil.rmtree(period_dir)
+    for level, f in enumerate(factors):
+        codes = quantize(block_mean(raster, f), scale, offset, bits)
+        level_dir = os.path.join(period_dir, str(level))
+        for ty in range(0, codes.shape[0], tile_size):
+            for tx in range(0, codes.shape[1], tile_size):
+                tile = codes[ty:ty + tile_size, tx:tx + tile_size]
+                if (tile == nodata).all():
+                    continue
+                if tile.shape != (tile_size, tile_size):
+                    # 边缘瓦片补齐为完整尺寸（缺测码值），前端按固定尺寸解码
+                    full = np.full((tile_size, tile_size), nodata, dtype=tile.dtype)
+                    full[:tile.shape[0], :tile.shape[1]] = tile
+                    tile = full
+                os.makedirs(level_dir, exist_ok=True)
+                path = os.path.join(level_dir, f"{ty // tile_size}_{tx // tile_size}.bin")
+                data = tile.astype(tile.dtype.newbyteorder('<'), copy=False).tobytes()
+                with open(path, 'wb') as fh:
+                    fh.write(data)
+                written += 1
+                total += len(data)
+    return {'tiles': written, 'bytes': total}
+
+
+def _load_manifest(out_dir: str) -> Dict:
+    path = os.path.join(out_dir, MANIFEST)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as fh:
+                return json.load(fh)
+        except Exception:
+            pass
+    return {}
+
+
+def build_tiles(out_dir: str, target, rasters: Dict[str, Dict[str, np.ndarray]],
+                factors: Sequence[int] = (1, 2, 4, 8), tile_size: int = 128, bits: int = 8,
+                source: Optional[Dict] = None) -> Dict:
+    """把 {周期: {变量: 栅格}}（见 regrid.regrid_cube）写成瓦片金字塔并更新 manifest，返回 manifest。
+
+    同一变量的所有周期共用一组 scale/offset（各周期取值范围的并集），前端切换周期时色标保持一致；
+    manifest 中已有的其他周期/变量会保留。
+    """
+    if bits not in (8, 16):
+        raise ValueError('bits must be 8 or 16')
+    manifest = _load_manifest(out_dir)
+    grid = {'lat0': float(target.lat[0] - target.res / 2), 'lon0': float(target.lon[0] - target.res / 2),
+            'res': float(target.res), 'shape': [int(target.lat.size), int(target.lon.size)], 'row0': 'south'}
+    if manifest.get('grid') not in (None, grid) or manifest.get('tile_size') not in (None, tile_size) \
+            or manifest.get('factors') not in (None, list(factors)):
+        # 网格或切片方式变化：旧瓦片不再可用，删除后重新开始
+        for var in manifest.get('variables', {}):
+            if os.path.isdir(os.path.join(out_dir, var)):
+                shutil.rmtree(os.path.join(out_dir, var))
+        manifest = {}
+    manifest.update({'grid': grid, 'tile_size': int(tile_size), 'factors': [int(f) for f in factors],
+                     'levels': level_info(grid['shape'], grid['res'], factors, tile_size),
+                     'path': '{var}/{period}/{level}/{ty}_{tx}.bin', 'byteorder': 'little'})
+    if source:
+        manifest['source'] = source
+    variables = manifest.setdefault('variables', {})
+    var_names = list(dict.fromkeys(v for fields in rasters.values() for v in fields))
+    stats = {'tiles': 0, 'bytes': 0}
+    for var in var_names:
+        scale, offset = quantization((fields[var] for fields in rasters.values() if var in fields), bits=bits)
+        entry = variables.setdefault(var, {'periods': {}})
+        for period, fields in rasters.items():
+            if var not in fields:
+                continue
+            res = write_pyramid(out_dir, var, period, fields[var], factors, tile_size, bits, scale, offset)
+            entry['periods'][period] = {'scale': scale, 'offset': offset, 'bits': bits,
+                                        'dtype': 'uint8' if bits == 8 else 'uint16', 'nodata': (1 << bits) - 1,
+                                        'tiles': res['tiles']}
+            stats['tiles'] += res['tiles']
+            stats['bytes'] += res['bytes']
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, MANIFEST), 'w', encoding='utf-8') as fh:
+        json.dump(manifest, fh, ensure_ascii=False, indent=1)
+    manifest['_written'] = stats
+    return manifest
+
+
+def read_tile(out_dir: str, var: str, period: str, level: int, ty: int, tx: int) -> Optional[np.ndarray]:
+    """读取并反量化一个瓦片（不存在时返回 None，表示全部缺测）。"""
+    manifest = _load_manifest(out_dir)
+    meta = manifest['variables'][var]['periods'][period]
+    path = os.path.join(out_dir, var, period, str(level), f"{ty}_{tx}.bin")
+    if not os.path.exists(path):
+        return None
+    size = manifest['tile_size']
+    codes = np.fromfile(path, dtype=np.dtype(meta['dtype']).newbyteorder('<')).reshape(size, size)
+    return dequantize(codes, meta['scale'], meta['offset'], meta['bits'])
@@ -1,13 +1,27 @@
 import os
 import json
+import numpy as np
 import pandas as pd
 import re
+from typing import Dict, List, Optional, Sequence
+from .config import ECHARTS_COMPACT, ECHARTS_COMPACT_DECIMALS, ECHARTS_PRECOMPRESS, ECHARTS_SHARDED, \
+    TREND_LEVELS
+from .util.echarts_shards import group_bounds, json_values, write_json_items, write_json_pairs
 
-def convert_to_echarts_format(province_data: pd.DataFrame, output_dir: str = 'Data/output/echarts') -> str:
-    """从省级时间序列导出简单的 ECharts 兼容 JSON。
+def convert_to_echarts_format(province_data: pd.DataFrame, output_dir: str = 'Data/output/echarts',
+                              metrics: Optional[Sequence[str]] = None, compact: Optional[bool] = None,
+                              sharded: Optional[bool] = None) -> str:
+    """从省级时间序列导出 ECharts 兼容 JSON。
 
     Province_data：每个省份包含“时间”列和数字列或已按时间聚合的 DataFrame。
-    该函数写入两个 JSON 文件：timeseries 和 map_series（简化）并返回 output_dir。
+    写入 map_series_metrics.json（{指标: {YYYY-MM: [{name, value}]}}）与 timeseries_metrics.json
+    （{指标: [{name, type, data: [[毫秒时间戳, 值]]}]}），以及只含第一个指标的 map_series_data.json /
+    timeseries_data.json（原有格式）；metrics 可限定导出的指标。全部指标在一次 groupby 与按组切片中完成。
+    compact（默认 ECHARTS_COMPACT）时另写紧凑列式的 echarts_compact.json/.arrow 及 .gz/.br（见 util.echarts_compact）。
+    sharded（默认 ECHARTS_SHARDED）时全部指标改为按 指标 × 周期 / 指标 × 省 分片写到 output_dir/shards（见
+    util.echarts_shards），不再生成整年的 *_metrics.json；原格式的两个文件也按周期/名称逐条流式写出。
+    分组（_prepare_part）与写出（_write_part）分开：流水线按月调用 echarts_part，最后由 write_echarts_parts 合并写出。
+    返回 output_dir。
     """
     os.makedirs(output_dir, exist_ok=True)
 
@@ -38,76 +52,193 @@ def convert_to_echarts_format(province_data: pd.DataFrame, output_dir: str = 'Da
             print("[visualize] 警告: 输入数据中不包含 'time' 列，且未能从字段中推断出日期；将生成非时序的 map_series，timeseries 为空。")
             pass
 
-    # map_series_data：映射日期 -> 所选指标的 {name, value} 列表（使用第一个数字列）
-    numeric_cols = province_data.select_dtypes(include=['number']).columns.tolist()
+    numeric_cols = _metric_columns(province_data, metrics)
+    metric = numeric_cols[0]
+    sharded = ECHARTS_SHARDED if sharded is None else sharded
+
+    keys = _name_keys(province_data)
+    if keys:
+        return _write_part(_prepare_part(province_data, keys, numeric_cols, has_time), output_dir, compact, sharded)
+    if has_time:
+        # 后备：宽格式或无法推断名称时每个周期保留空列表
+        periods = sorted(province_data['time'].dt.strftime('%Y-%m').dropna().unique())
+        map_series = {m: {t: [] for t in periods} for m in numeric_cols}
+    else:
+        map_series = {m: {'ALL': []} for m in numeric_cols}
+    timeseries = {m: [] for m in numeric_cols}
+    _dump_json(os.path.join(output_dir, 'map_series_data.json'), map_series[metric])
+    _dump_json(os.path.join(output_dir, 'timeseries_data.json'), timeseries[metric])
+    if not sharded:
+        _dump_json(os.path.join(output_dir, 'map_series_metrics.json'), map_series)
+        _dump_json(os.path.join(output_dir, 'timeseries_metrics.json'), timeseries)
+    print(f"ECharts 数据已保存到: {output_dir}（指标: {', '.join(numeric_cols)}）")
+    return output_dir
+
+
+def echarts_part(province_data: pd.DataFrame, metrics: Optional[Sequence[str]] = None) -> Optional[Dict]:
+    """一段数据（流水线中为一个月）的 ECharts 中间结果：名称键整理、周期 × 名称的均值与按名称、时间排序的序列行。
+
+    需要 time 列与名称键，否则返回 None（由 convert_to_echarts_format 对整表处理）。
+    各段的周期互不重叠时，write_echarts_parts 只做拼接与写出，输出与对拼接后的整表调用 convert_to_echarts_format 相同。
+    """
+    keys = _name_keys(province_data)
+    if not keys or 'time' not in province_data.columns:
+        return None
+    province_data = province_data.assign(time=pd.to_datetime(province_data['time']))
+    return _prepare_part(province_data, keys, _metric_columns(province_data, metrics), True)
+
+
+def write_echarts_parts(parts: Sequence[Dict], output_dir: str = 'Data/output/echarts',
+                        compact: Optional[bool] = None, sharded: Optional[bool] = None) -> str:
+    """按周期顺序合并 echarts_part 的结果并写出（文件与 convert_to_echarts_format 相同），返回 output_dir。"""
+    parts = [p for p in parts if p is not None]
+    if not parts:
+        raise ValueError('没有可合并的 ECharts 分段')
+    os.makedirs(output_dir, exist_ok=True)
+    sharded = ECHARTS_SHARDED if sharded is None else sharded
+    return _write_part(_merge_parts(parts), output_dir, compact, sharded)
+
+
+def _metric_columns(df: pd.DataFrame, metrics: Optional[Sequence[str]]) -> List[str]:
+    # 所有数值列都导出（lat/lon 不是指标）；map_series_data/timeseries_data 仍只含第一个指标，保持原有格式
+    numeric_cols = [c for c in df.select_dtypes(include=['number']).columns if c not in ('lat', 'lon')]
+    if metrics:
+        numeric_cols = [c for c in metrics if c in numeric_cols]
     if not numeric_cols:
         raise ValueError('province_data 必须包含数值列用于可视化')
-    metric = numeric_cols[0]
+    return numeric_cols
 
-    map_series = {}
+
+def _prepare_part(province_data: pd.DataFrame, keys: List[str], numeric_cols: List[str], has_time: bool) -> Dict:
+    # 名称键缺失的行（如无上级市的区县）不导出，与原先 groupby 默认 dropna 的行为一致；
+    # 否则 astype(str) 在 pandas 3 下保留 NaN，拼接名称时报错
+    province_data = province_data[province_data[keys].notna().all(axis=1)]
+    data = province_data[keys + numeric_cols].copy()
+    for k in keys:
+        # 分类列 groupby 时只保留出现过的组合，并按名称排序
+        data[k] = data[k].astype(str)
     if has_time:
-        for t, grp in province_data.groupby(province_data['time'].dt.strftime('%Y-%m')):
-            items = []
-            # 假设有一列“admin_name”或按 province+city 组合标识省/市
-            if 'admin_name' in province_data.columns:
-                for _, row in grp.iterrows():
-                    name = row.get('admin_name')
-                    val = row.get(metric, 0)
-                    items.append({'name': name, 'value': float(val) if pd.notna(val) else None})
-            elif 'province' in province_data.columns and 'city' in province_data.columns:
-                # 使用 province|city 作为名称（与聚合输出一致）
-                agg = grp.groupby(['province', 'city'])[metric].mean().reset_index()
-                for _, row in agg.iterrows():
-                    name = f"{row['province']}|{row['city']}"
-                    items.append({'name': name, 'value': float(row[metric]) if pd.notna(row[metric]) else None})
-            else:
-                # 后备：宽格式或无法推断时保留空列表
-                items = []
-            map_series[t] = items
+        times = province_data['time'].to_numpy()
+        # datetime64[M] 的字符串形式即 YYYY-MM；NaT 行不进入任何周期
+        data['_period'] = np.where(np.isnat(times), None, times.astype('datetime64[M]').astype(str))
+        data['_time'] = times
     else:
-        # 聚合所有行以生成单个地图快照
-        grp = province_data
-        items = []
-        if 'admin_name' in province_data.columns:
-            agg = grp.groupby('admin_name')[metric].mean().reset_index()
-            for _, row in agg.iterrows():
-                items.append({'name': row['admin_name'], 'value': float(row[metric]) if pd.notna(row[metric]) else None})
-        elif 'province' in province_data.columns and 'city' in province_data.columns:
-            agg = grp.groupby(['province', 'city'])[metric].mean().reset_index()
-            for _, row in agg.iterrows():
-                name = f"{row['province']}|{row['city']}"
-                items.append({'name': name, 'value': float(row[metric]) if pd.notna(row[metric]) else None})
-        map_series['ALL'] = items
-
-    timeseries = []
-    # 如果我们有时间，请为每个 admin/省市 生成时间序列；否则将时间序列留空
+        data['_period'] = 'ALL'
+    # 地图：每个周期、每个名称一次 groupby 求全部指标的均值
+    agg = data.groupby(['_period'] + keys, sort=True)[numeric_cols].mean()
+    # 时间序列：按名称与时间排序，写出时按组切片
+    ts_data = data[data['_time'].notna()].sort_values(keys + ['_time'], kind='stable') if has_time else None
+    return {'keys': keys, 'metrics': numeric_cols, 'has_time': has_time, 'data': data, 'agg': agg, 'ts_data': ts_data}
+
+
+def _merge_parts(parts: Sequence[Dict]) -> Dict:
+    first = parts[0]
+    if any(p['keys'] != first['keys'] or p['metrics'] != first['metrics'] or p['has_time'] != first['has_time']
+           for p in parts[1:]):
+        raise ValueError('各 ECharts 分段的名称键、指标或时间列不一致，无法合并')
+    if len(parts) == 1:
+        return first
+    keys, numeric_cols = first['keys'], first['metrics']
+    parts = sorted(parts, key=lambda p: str(p['agg'].index[0][0]) if len(p['agg']) else '')
+    data = pd.concat([p['data'] for p in parts], ignore_index=True)
+    agg = pd.concat([p['agg'] for p in parts])
+    period_sets = [set(p['agg'].index.get_level_values(0)) for p in parts]
+    if not agg.index.get_level_values(0).is_monotonic_increasing or \
+            sum(map(len, period_sets)) != len(set().union(*period_sets)):
+        # 分段的周期有重叠或交错时，各段均值不能直接拼接，按全部行重新分组
+        agg = data.groupby(['_period'] + keys, sort=True)[numeric_cols].mean()
+    ts_data = None
+    if first['has_time']:
+        # 各段已按 名称 × 时间 排好序，拼接后的稳定排序只是归并
+        ts_data = pd.concat([p['ts_data'] for p in parts], ignore_index=True).sort_values(keys + ['_time'],
+                                                                                           kind='stable')
+    return dict(first, data=data, agg=agg, ts_data=ts_data)
+
+
+def _write_part(part: Dict, output_dir: str, compact: Optional[bool], sharded: bool) -> str:
+    keys, numeric_cols, has_time = part['keys'], part['metrics'], part['has_time']
+    data, agg, ts_data = part['data'], part['agg'], part['ts_data']
+    metric = numeric_cols[0]
+    periods = agg.index.get_level_values(0).to_numpy()
+    names = _join_names(agg.index.droplevel(0).to_frame(index=False), keys)
+    map_bounds = group_bounds(periods)
+
+    # 按组逐条生成 (周期, 地图条目) 与 时间序列条目；分片模式下不在内存中构建整年的嵌套结构，直接流式写出
+    def map_items(m):
+        arr = agg[m].to_numpy()
+        for a, b in map_bounds:
+            yield periods[a], [{'name': n, 'value': v} for n, v in zip(names[a:b], json_values(arr[a:b]))]
+
+    ts_items = None
     if has_time:
-        if 'admin_name' in province_data.columns:
-            for name, grp in province_data.groupby('admin_name'):
-                series = {'name': name, 'type': 'line', 'data': []}
-                for _, row in grp.sort_values('time').iterrows():
-                    ts = int(pd.to_datetime(row['time']).timestamp() * 1000)
-                    series['data'].append([ts, float(row.get(metric, 0)) if pd.notna(row.get(metric, None)) else None])
-                timeseries.append(series)
-        elif 'province' in province_data.columns and 'city' in province_data.columns:
-            # 使用 province|city 组合作为系列名称
-            for (prov, city), grp in province_data.groupby(['province', 'city']):
-                name = f"{prov}|{city}"
-                series = {'name': name, 'type': 'line', 'data': []}
-                for _, row in grp.sort_values('time').iterrows():
-                    ts = int(pd.to_datetime(row['time']).timestamp() * 1000)
-                    series['data'].append([ts, float(row.get(metric, 0)) if pd.notna(row.get(metric, None)) else None])
-                timeseries.append(series)
-
-    with open(os.path.join(output_dir, 'map_series_data.json'), 'w', encoding='utf-8') as f:
-        json.dump(map_series, f, ensure_ascii=False, indent=2)
-
-    with open(os.path.join(output_dir, 'timeseries_data.json'), 'w', encoding='utf-8') as f:
-        json.dump(timeseries, f, ensure_ascii=False, indent=2)
-
-    print(f"ECharts 数据已保存到: {output_dir}")
+        ts_names = _join_names(ts_data[keys], keys)
+        ts_ms = ts_data['_time'].to_numpy().astype('datetime64[ms]').astype('int64').tolist()
+        ts_bounds = group_bounds(ts_names)
+
+        def ts_items(m):
+            arr = ts_data[m].to_numpy()
+            for a, b in ts_bounds:
+                yield {'name': ts_names[a], 'type': 'line',
+                       'data': list(map(list, zip(ts_ms[a:b], json_values(arr[a:b]))))}
+
+    if sharded:
+        from .util.echarts_shards import write_echarts_shards
+        shard_kw = {}
+        if has_time:
+            shard_kw = dict(ts_units=ts_data[keys[0]].to_numpy(dtype=object), ts_names=ts_names,
+                            ts_ms=ts_data['_time'].to_numpy().astype('datetime64[ms]').astype('int64'),
+                            ts_values={m: ts_data[m].to_numpy() for m in numeric_cols})
+        manifest = write_echarts_shards(os.path.join(output_dir, 'shards'), keys, numeric_cols, periods, names,
+                                        {m: agg[m].to_numpy() for m in numeric_cols}, levels=TREND_LEVELS,
+                                        **shard_kw)
+        print(f"[visualize] 分片: {len(manifest['periods'])} 个周期 × {len(numeric_cols)} 个指标，"
+              f"{len(manifest['units'])} 个单元 -> {os.path.join(output_dir, 'shards')}")
+
+    if ECHARTS_COMPACT if compact is None else compact:
+        from .util.echarts_compact import write_compact_payload
+        written = write_compact_payload(output_dir, _join_names(data, keys), {m: data[m].to_numpy() for m in numeric_cols},
+                                        times=data['_time'].to_numpy() if has_time else None,
+                                        periods=data['_period'].to_numpy(), keys=keys,
+                                        decimals=ECHARTS_COMPACT_DECIMALS, compress=ECHARTS_PRECOMPRESS)
+        print(f"[visualize] 紧凑格式: {', '.join(os.path.basename(p) for p in written)}")
+
+    if sharded:
+        write_json_pairs(os.path.join(output_dir, 'map_series_data.json'), map_items(metric))
+        write_json_items(os.path.join(output_dir, 'timeseries_data.json'), ts_items(metric) if ts_items else ())
+    else:
+        map_series = {m: dict(map_items(m)) for m in numeric_cols}
+        timeseries = {m: list(ts_items(m)) if ts_items else [] for m in numeric_cols}
+        _dump_json(os.path.join(output_dir, 'map_series_data.json'), map_series[metric])
+        _dump_json(os.path.join(output_dir, 'timeseries_data.json'), timeseries[metric])
+        _dump_json(os.path.join(output_dir, 'map_series_metrics.json'), map_series)
+        _dump_json(os.path.join(output_dir, 'timeseries_metrics.json'), timeseries)
+
+    print(f"ECharts 数据已保存到: {output_dir}（指标: {', '.join(numeric_cols)}）")
     return output_dir
 
+
+def _name_keys(df: pd.DataFrame) -> List[str]:
+    # admin_name，否则 province|city|county、province|city、province（与聚合输出一致）
+    if 'admin_name' in df.columns:
+        return ['admin_name']
+    for keys in (['province', 'city', 'county'], ['province', 'city'], ['province']):
+        if all(k in df.columns for k in keys):
+            return keys
+    return []
+
+
+def _join_names(frame: pd.DataFrame, keys: List[str]) -> np.ndarray:
+    names = frame[keys[0]].astype(str).to_numpy(dtype=object)
+    for k in keys[1:]:
+        names = names + '|' + frame[k].astype(str).to_numpy(dtype=object)
+    return names
+
+
+def _dump_json(path: str, obj) -> None:
+    # json.dumps 一次性编码走 C 加速器；json.dump 的流式编码是纯 Python，大文件慢数倍
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(obj, ensure_ascii=False, separators=(',', ':')))
+
 # 尝试从可能包含文件名或路径的字符串列中推断日期（例如文件名中包含 20130101 / 2013-01-01 / 201301）
 def _infer_date_from_string(s: str):
     if not isinstance(s, str):